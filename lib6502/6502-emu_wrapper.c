@@ -120,18 +120,20 @@ int lib6502_step_cpu(frame_status_t *status, history_6502_t *entry, breakpoints_
 	count = lengths[inst.mode];
 	if (entry) lib6502_show_current_instruction(entry);
 
-	bpid = libdebugger_check_breakpoints(breakpoints, status, &lib6502_register_callback);
-	if (bpid >= 0) {
-		status->frame_status = FRAME_BREAKPOINT;
-		status->breakpoint_id = bpid;
-		if (entry) {
-			b = (history_breakpoint_t *)entry;
-			b->breakpoint_id = bpid;
-			b->breakpoint_type = breakpoints->breakpoint_type[bpid];
-			b->disassembler_type = DISASM_NEXT_INSTRUCTION;
-			b->disassembler_type_cpu = DISASM_6502_HISTORY;
+	if (BREAKPOINTS_NEED_CHECK(breakpoints, PC)) {
+		bpid = libdebugger_check_breakpoints(breakpoints, status, &lib6502_register_callback);
+		if (bpid >= 0) {
+			status->frame_status = FRAME_BREAKPOINT;
+			status->breakpoint_id = bpid;
+			if (entry) {
+				b = (history_breakpoint_t *)entry;
+				b->breakpoint_id = bpid;
+				b->breakpoint_type = breakpoints->breakpoint_type[bpid];
+				b->disassembler_type = DISASM_NEXT_INSTRUCTION;
+				b->disassembler_type_cpu = DISASM_6502_HISTORY;
+			}
+			return bpid;
 		}
-		return bpid;
 	}
 
 	write_addr = NULL;
@@ -231,6 +233,18 @@ int lib6502_step_cpu(frame_status_t *status, history_6502_t *entry, breakpoints_
 		}
 	}
 
+	/* memory watch breakpoints are reported before the next instruction */
+	if (breakpoints->num_watch_breakpoints) {
+		if (read_addr != NULL) {
+			index = (intptr_t)read_addr - (intptr_t)(&memory[0]);
+			if (index >= 0 && index < MAIN_MEMORY_SIZE) WATCH_READ(breakpoints, (uint16_t)index);
+		}
+		if (write_addr != NULL) {
+			index = (intptr_t)write_addr - (intptr_t)(&memory[0]);
+			if (index >= 0 && index < MAIN_MEMORY_SIZE) WATCH_WRITE(breakpoints, (uint16_t)index);
+		}
+	}
+
 	if (status->use_memory_access) {
 		if (read_addr != NULL) {
 			index = (intptr_t)read_addr - (intptr_t)(&memory[0]);
@@ -385,6 +399,29 @@ int lib6502_next_frame(input_t *input, output_t *output, breakpoints_t *breakpoi
 	return bpid;
 }
 
+/* Run up to num_frames frames without returning to the caller in between. The
+ save state is only copied out after the last frame, and the loop stops early
+ if a breakpoint is hit. The number of frames that were completed is stored in
+ frames_finished. */
+int lib6502_run_frames(input_t *input, output_t *output, breakpoints_t *breakpoints, emulator_history_t *history, int num_frames, int *frames_finished)
+{
+	int bpid = -1;
+	frame_status_t *status = &output->status;
+
+	if (apple2_mode) {
+		memory[0xc000] = input->keychar;
+	}
+	status->final_cycle_in_frame = cycles_per_frame - 1;
+	*frames_finished = 0;
+	while (*frames_finished < num_frames) {
+		bpid = libdebugger_calc_frame(&lib6502_calc_frame, memory, status, breakpoints, history);
+		if (status->frame_status == FRAME_FINISHED) *frames_finished += 1;
+		if (bpid >= 0) break;
+	}
+	lib6502_get_current_state(output);
+	return bpid;
+}
+
 void lib6502_set_a2_emulation_mode(int mode) {
 	if (mode) apple2_mode = 1;
 	else apple2_mode = 0;
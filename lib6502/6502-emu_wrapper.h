@@ -84,6 +84,8 @@ int lib6502_step_cpu(frame_status_t *output, history_6502_t *entry, breakpoints_
 
 int lib6502_next_frame(input_t *input, output_t *output, breakpoints_t *state, emulator_history_t *history);
 
+int lib6502_run_frames(input_t *input, output_t *output, breakpoints_t *breakpoints, emulator_history_t *history, int num_frames, int *frames_finished);
+
 void lib6502_show_next_instruction(emulator_history_t *history);
 
 #endif /* _6502_EMU_WRAPPER_H_ */
@@ -6,6 +6,7 @@ cdef extern:
     int lib6502_clear_state_arrays(np.uint8_t *buf, np.uint8_t *buf)
     int lib6502_configure_state_arrays(np.uint8_t *buf, np.uint8_t *buf)
     int lib6502_next_frame(np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf)
+    int lib6502_run_frames(np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf, np.uint8_t *buf, int num_frames, int *frames_finished) nogil
     void lib6502_show_next_instruction(np.uint8_t *buf)
     void lib6502_get_current_state(np.uint8_t *buf)
     void lib6502_restore_state(np.uint8_t *buf)
@@ -48,6 +49,33 @@ def next_frame(np.ndarray input not None, np.ndarray output not None, np.ndarray
     bpid = lib6502_next_frame(&ibuf[0], &obuf[0], &dbuf[0], hbuf)
     return bpid
 
+def run_frames(np.ndarray input not None, np.ndarray output not None, np.ndarray breakpoints not None, history_storage, int num_frames):
+    cdef np.uint8_t[:] ibuf
+    cdef np.uint8_t[:] obuf
+    cdef np.uint8_t[:] dbuf
+    cdef np.uint8_t *hbuf
+    cdef np.uint8_t[:] tmp
+    cdef np.uint8_t *iptr
+    cdef np.uint8_t *optr
+    cdef np.uint8_t *dptr
+    cdef int bpid
+    cdef int frames_finished = 0
+    if history_storage is not None:
+        tmp = history_storage.history_array.view(np.uint8)
+        hbuf = &tmp[0]
+    else:
+        hbuf = <np.uint8_t *>0
+
+    ibuf = input.view(np.uint8)
+    obuf = output.view(np.uint8)
+    dbuf = breakpoints.view(np.uint8)
+    iptr = &ibuf[0]
+    optr = &obuf[0]
+    dptr = &dbuf[0]
+    with nogil:
+        bpid = lib6502_run_frames(iptr, optr, dptr, hbuf, num_frames, &frames_finished)
+    return bpid, frames_finished
+
 def show_next_instruction(history_storage):
     cdef np.uint8_t *hbuf
     cdef np.uint8_t[:] tmp
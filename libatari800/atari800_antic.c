@@ -1890,7 +1890,8 @@ static void prepare_an_antic_4(int nchars, const UBYTE *antic_memptr, const ULON
 	else {
 		chptr = MEMORY_mem + (((anticmode == 4 ? dctr : dctr >> 1) ^ chbase_20) & 0xfc07);
 		int index = chptr - MEMORY_mem;
-		access_type[index] = ACCESS_TYPE_CHARACTER;
+		if (LIBATARI800_Status->use_memory_access)
+			access_type[index] = ACCESS_TYPE_CHARACTER;
 	}
 #endif
 
@@ -1927,7 +1928,8 @@ static void draw_antic_6(int nchars, const UBYTE *antic_memptr, UWORD *ptr, cons
 		chptr = ANTIC_xe_ptr + (((anticmode == 6 ? dctr & 7 : dctr >> 1) ^ chbase_20) - 0x4000);
 	else {
 		chptr = MEMORY_mem + ((anticmode == 6 ? dctr & 7 : dctr >> 1) ^ chbase_20);
-		access_type[chptr - MEMORY_mem] = ACCESS_TYPE_CHARACTER;
+		if (LIBATARI800_Status->use_memory_access)
+			access_type[chptr - MEMORY_mem] = ACCESS_TYPE_CHARACTER;
 	}
 #endif
 
@@ -1942,7 +1944,8 @@ static void draw_antic_6(int nchars, const UBYTE *antic_memptr, UWORD *ptr, cons
 		chdata = MEMORY_dGetByte(t_chbase + ((UWORD) (screendata & 0x3f) << 3));
 #else
 		int index = (screendata & 0x3f) << 3;
-		access_type[chptr - MEMORY_mem + index] = ACCESS_TYPE_CHARACTER;
+		if (LIBATARI800_Status->use_memory_access)
+			access_type[chptr - MEMORY_mem + index] = ACCESS_TYPE_CHARACTER;
 		chdata = chptr[index];
 #endif
 		do {
@@ -2012,7 +2015,8 @@ static void prepare_an_antic_6(int nchars, const UBYTE *antic_memptr, const ULON
 	else {
 		chptr = MEMORY_mem + ((anticmode == 6 ? dctr & 7 : dctr >> 1) ^ chbase_20);
 		int index = chptr - MEMORY_mem;
-		access_type[index] = ACCESS_TYPE_CHARACTER;
+		if (LIBATARI800_Status->use_memory_access)
+			access_type[index] = ACCESS_TYPE_CHARACTER;
 	}
 #endif
 
@@ -2025,7 +2029,8 @@ static void prepare_an_antic_6(int nchars, const UBYTE *antic_memptr, const ULON
 		chdata = MEMORY_dGetByte(t_chbase + ((UWORD) (screendata & 0x3f) << 3));
 #else
 		int index = (screendata & 0x3f) << 3;
-		access_type[chptr - MEMORY_mem + index] = ACCESS_TYPE_CHARACTER;
+		if (LIBATARI800_Status->use_memory_access)
+			access_type[chptr - MEMORY_mem + index] = ACCESS_TYPE_CHARACTER;
 		chdata = chptr[index];
 #endif
 		*an_ptr++ = chdata & 0x80 ? an : 0;
@@ -2798,7 +2803,8 @@ UBYTE ANTIC_GetDLByte(UWORD *paddr)
 		result = ANTIC_xe_ptr[addr - 0x4000];
 	else
 		result = MEMORY_GetByte((UWORD) addr);
-	access_type[addr] = ACCESS_TYPE_DISPLAY_LIST;
+	if (LIBATARI800_Status->use_memory_access)
+		access_type[addr] = ACCESS_TYPE_DISPLAY_LIST;
 	addr++;
 	if ((addr & 0x3FF) == 0)
 		addr -= 0x400;
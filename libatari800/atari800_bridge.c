@@ -114,6 +114,7 @@ void a8bridge_clear_state_arrays(input_template_t *input, output_template_t *out
 	output->status.frame_status = 0;
 	output->status.cycles_since_power_on = 0;
 	output->status.instructions_since_power_on = 0;
+	output->status.use_memory_access = 1;
 }
 
 void a8bridge_configure_state_arrays(input_template_t *input, output_template_t *output)
@@ -400,6 +401,29 @@ int a8bridge_next_frame(input_template_t *input, output_template_t *output, brea
 	return bpid;
 }
 
+/* Run up to num_frames frames in a loop, only saving the state and copying the
+ screen after the last one. Stops early if a breakpoint is hit; the number of
+ completed frames is stored in frames_finished. */
+int a8bridge_run_frames(input_template_t *input, output_template_t *output, breakpoints_t *breakpoints, emulator_history_t *history, int num_frames, int *frames_finished)
+{
+	int bpid = -1;
+
+	LIBATARI800_Input_array = input;
+	*frames_finished = 0;
+	while (*frames_finished < num_frames) {
+		INPUT_key_code = PLATFORM_Keyboard();
+		bpid = libdebugger_calc_frame(&a8bridge_calc_frame, MEMORY_mem, &output->status, breakpoints, history);
+		if (output->status.frame_status == FRAME_FINISHED) *frames_finished += 1;
+		if (bpid >= 0) break;
+	}
+
+	LIBATARI800_StateSave(output->state, &output->tags);
+	if (output->status.frame_status == FRAME_FINISHED) {
+		copy_screen(output->video);
+	}
+	return bpid;
+}
+
 void a8bridge_show_current_instruction(history_atari800_t *entry) {
 	int count;
 	uint8_t opcode;
@@ -89,33 +89,48 @@ extern UBYTE *access_type;
 #undef MEMORY_dPutByte
 
 UBYTE MEMORY_dGetByte(UWORD x) {
-	memory_access[x]=255;
-	access_type[x]|=ACCESS_TYPE_READ;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[x]=255;
+		access_type[x]|=ACCESS_TYPE_READ;
+	}
+	if (LIBATARI800_Breakpoints) WATCH_READ(LIBATARI800_Breakpoints, x);
 	return MEMORY_mem[x];
 }
 
 UBYTE MEMORY_dHwGetByte(UWORD x) {
-	memory_access[x]=255;
-	access_type[x]|=ACCESS_TYPE_READ | ACCESS_TYPE_HARDWARE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[x]=255;
+		access_type[x]|=ACCESS_TYPE_READ | ACCESS_TYPE_HARDWARE;
+	}
+	if (LIBATARI800_Breakpoints) WATCH_READ(LIBATARI800_Breakpoints, x);
 	return MEMORY_HwGetByte(x, FALSE);
 }
 
 UBYTE MEMORY_dSafeHwGetByte(UWORD x) {
-	memory_access[x]=255;
-	access_type[x]|=ACCESS_TYPE_READ | ACCESS_TYPE_HARDWARE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[x]=255;
+		access_type[x]|=ACCESS_TYPE_READ | ACCESS_TYPE_HARDWARE;
+	}
+	if (LIBATARI800_Breakpoints) WATCH_READ(LIBATARI800_Breakpoints, x);
 	return MEMORY_HwGetByte(x, TRUE);
 }
 
 void MEMORY_dPutByte(UWORD x, UBYTE y) {
 	MEMORY_mem[x]=y;
-	memory_access[x]=255;
-	access_type[x]|=ACCESS_TYPE_WRITE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[x]=255;
+		access_type[x]|=ACCESS_TYPE_WRITE;
+	}
+	if (LIBATARI800_Breakpoints) WATCH_WRITE(LIBATARI800_Breakpoints, x);
 }
 
 void MEMORY_dHwPutByte(UWORD x, UBYTE y) {
 	MEMORY_HwPutByte(x, y);
-	memory_access[x]=255;
-	access_type[x]|=ACCESS_TYPE_WRITE | ACCESS_TYPE_HARDWARE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[x]=255;
+		access_type[x]|=ACCESS_TYPE_WRITE | ACCESS_TYPE_HARDWARE;
+	}
+	if (LIBATARI800_Breakpoints) WATCH_WRITE(LIBATARI800_Breakpoints, x);
 }
 
 
@@ -488,22 +503,28 @@ static const int cycles[256] =
 #endif
 
 UBYTE GET_CODE_BYTE() {
-	memory_access[PC]=255;
-	access_type[PC]|=ACCESS_TYPE_EXECUTE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[PC]=255;
+		access_type[PC]|=ACCESS_TYPE_EXECUTE;
+	}
 	return MEMORY_mem[PC++];
 }
 
 UBYTE PEEK_CODE_BYTE() {
-	memory_access[PC]=255;
-	access_type[PC]|=ACCESS_TYPE_EXECUTE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[PC]=255;
+		access_type[PC]|=ACCESS_TYPE_EXECUTE;
+	}
 	return MEMORY_mem[PC];
 }
 
 UWORD PEEK_CODE_WORD() {
-	memory_access[PC]=255;
-	memory_access[PC+1]=255;
-	access_type[PC]|=ACCESS_TYPE_EXECUTE;
-	access_type[PC+1]|=ACCESS_TYPE_EXECUTE;
+	if (LIBATARI800_Status->use_memory_access) {
+		memory_access[PC]=255;
+		memory_access[PC+1]=255;
+		access_type[PC]|=ACCESS_TYPE_EXECUTE;
+		access_type[PC+1]|=ACCESS_TYPE_EXECUTE;
+	}
 	return MEMORY_dGetWord(PC);
 }
 
@@ -772,7 +793,7 @@ recreate_history_entry:
 			entry->flag = opcode_history_flags_6502[insn];
 		}
 
-		if (LIBATARI800_Breakpoints && check_breakpoints) {
+		if (LIBATARI800_Breakpoints && check_breakpoints && BREAKPOINTS_NEED_CHECK(LIBATARI800_Breakpoints, CPU_regPC)) {
 			// printf("before checking breakpoint; CPU_regPC=%04x PC=%04x last_pc=%04x\n", CPU_regPC, PC, last_pc);
 			int bpid = libdebugger_check_breakpoints(LIBATARI800_Breakpoints, LIBATARI800_Status, &a8bridge_register_callback);
 			if (bpid >= 0) {
@@ -13,90 +13,91 @@ void libdebugger_init_array(breakpoints_t *breakpoints) {
 	breakpoints->last_pc = -1;
 }
 
-typedef struct {
-	uint16_t stack[TOKENS_PER_BREAKPOINT];
-	int index;
-	int error;
-} postfix_stack_t;
-
-void clear(postfix_stack_t *s) {
-	s->index = 0;
-	s->error = 0;
-}
+static uint16_t power(uint16_t base, uint16_t exponent) {
+	uint16_t value = 1;
 
-void push(postfix_stack_t *s, uint16_t value) {
-	if (s->index >= TOKENS_PER_BREAKPOINT) {
-		s->error = STACK_OVERFLOW;
-	}
-	else {
-		s->stack[s->index++] = value;
+	while (exponent) {
+		if (exponent & 1) value *= base;
+		base *= base;
+		exponent >>= 1;
 	}
-#ifdef DEBUG_POSTFIX_STACK
-	printf("push; (err=%d) stack is now: ", s->error);
-	for (int i=0; i<s->index; i++) {
-		printf("%x,", s->stack[i]);
-	}
-	printf("\n");
-#endif
-}
-
-uint16_t pop(postfix_stack_t *s) {
-	uint16_t value;
-
-	if (s->index > 0) {
-		value = (uint16_t)(s->stack[--s->index]);
-	}
-	else {
-		s->error = STACK_UNDERFLOW;
-		value = 0;
-	}
-#ifdef DEBUG_POSTFIX_STACK
-	printf("pop; (err=%d) stack is now: ", s->error);
-	for (int i=0; i<s->index; i++) {
-		printf("%x,", s->stack[i]);
-	}
-	printf("\n");
-#endif
 	return value;
 }
 
-void process_binary(uint16_t token, postfix_stack_t *s) {
-	uint16_t first, second, value;
+/* Evaluate the postfix token list of a breakpoint. The token lists have been
+	validated by Debugger.compile_breakpoints, so the only checks here are the
+	ones needed to stay in bounds if the list was changed behind its back.
+	Values are 16 bit unsigned, like the registers they are compared against.
 
-	first = pop(s);
-	second = pop(s);
-	value = 0;
-	if (!s->error) {
-		switch(token) {
-			case OP_PLUS:
-			value = first + second;
-			break;
+	returns: the value of the expression, or a negative error code.
+*/
+static int evaluate_tokens(uint16_t *tokens, cpu_state_callback_ptr get_emulator_value) {
+	uint16_t stack[TOKENS_PER_BREAKPOINT + 1];
+	uint16_t token, first, second;
+	int sp = 0, count;
 
-			case OP_MINUS:
-			value = first - second;
+	for (count = 0; count < TOKENS_PER_BREAKPOINT - 1; count++) {
+		token = *tokens++;
+#ifdef DEBUG_BREAKPOINT
+		printf("  count=%d token=%x sp=%d\n", count, token, sp);
+#endif
+		switch (token & OP_MASK) {
+			case OP_BINARY:
+			if (sp < 2) return -STACK_UNDERFLOW;
+			first = stack[--sp];  /* top of stack is the right operand */
+			second = stack[sp - 1];
+			switch (token) {
+				case OP_BITWISE_AND: second = second & first; break;
+				case OP_BITWISE_OR: second = second | first; break;
+				case OP_DIV: second = first ? second / first : 0; break;
+				case OP_EQ: second = second == first; break;
+				case OP_EXP: second = power(second, first); break;
+				case OP_GE: second = second >= first; break;
+				case OP_GT: second = second > first; break;
+				case OP_LE: second = second <= first; break;
+				case OP_LOGICAL_AND: second = second && first; break;
+				case OP_LOGICAL_OR: second = second || first; break;
+				case OP_LSHIFT: second = first < 16 ? second << first : 0; break;
+				case OP_LT: second = second < first; break;
+				case OP_MINUS: second = second - first; break;
+				case OP_MULT: second = second * first; break;
+				case OP_NE: second = second != first; break;
+				case OP_PLUS: second = second + first; break;
+				case OP_RSHIFT: second = first < 16 ? second >> first : 0; break;
+				default: return -EVALUATION_ERROR;
+			}
+			stack[sp - 1] = second;
 			break;
 
-			case OP_EQ:
-			value = first == second;
+			case OP_UNARY:
+			if (sp < 1) return -STACK_UNDERFLOW;
+			first = stack[sp - 1];
+			switch (token) {
+				case OP_BITWISE_NOT: first = ~first; break;
+				case OP_LOGICAL_NOT: first = !first; break;
+				case OP_UMINUS: first = -first; break;
+				case OP_UPLUS: break;
+				default: return -EVALUATION_ERROR;
+			}
+			stack[sp - 1] = first;
 			break;
 
-			case OP_LOGICAL_AND:
-			value = first && second;
+			case VALUE_ARGUMENT:
+			/* the argument is the next token */
+			count++;
+			if (token == NUMBER) stack[sp++] = *tokens++;
+			else stack[sp++] = get_emulator_value(token, *tokens++);
 			break;
 
 			default:
-			printf("unimplemented binary operation: token=%d\n", token);
-			break;
+			if (token == END_OF_LIST) {
+				if (sp != 1) return sp ? -STACK_OVERFLOW : -STACK_UNDERFLOW;
+				return stack[0];
+			}
+			stack[sp++] = get_emulator_value(token, 0);
 		}
-#ifdef DEBUG_POSTFIX_STACK
-		printf("process_binary: op=%d first=%d second=%d value=%d\n", token, first, second, value);
-#endif
-		push(s, value);
 	}
-}
-
-int process_unary(uint16_t token, cpu_state_callback_ptr get_emulator_value, postfix_stack_t *s) {
-	return 0;
+	return -EVALUATION_ERROR;
 }
 
 /* returns: index number of breakpoint or -1 if no breakpoint condition met. */
@@ -106,12 +107,20 @@ int libdebugger_brk_instruction(breakpoints_t *breakpoints) {
 	return 0;
 }
 
+/* Called by the CPU when it accesses an address that has its bit set in the
+ read or write watch bitmap */
+void libdebugger_watch_hit(breakpoints_t *breakpoints, uint16_t addr, int access_type) {
+	if (!breakpoints->watch_pending) {
+		breakpoints->watch_pending = 1;
+		breakpoints->watch_address = addr;
+		breakpoints->watch_access_type = access_type;
+	}
+}
+
 /* returns: index number of breakpoint or -1 if no breakpoint condition met. */
 int libdebugger_check_breakpoints(breakpoints_t *breakpoints, frame_status_t *run, cpu_state_callback_ptr get_emulator_value) {
-	uint16_t token, op, addr, value;
 	int64_t ref_val;
-	int i, num_entries, index, status, btype, final_value, count, current_pc;
-	postfix_stack_t stack;
+	int i, j, btype, value, count, current_pc;
 
 	current_pc = get_emulator_value(REG_PC, 0);
 	// printf("in libdebugger_check_breakpoints: PC=%04x breakpoint->last_pc=%04x\n", current_pc, breakpoints->last_pc);
@@ -122,7 +131,17 @@ int libdebugger_check_breakpoints(breakpoints_t *breakpoints, frame_status_t *ru
 		return 0;
 	}
 
-	num_entries = breakpoints->num_breakpoints;
+	/* memory watch triggered by the previous instruction */
+	if (breakpoints->watch_pending) {
+		breakpoints->watch_pending = 0;
+		btype = breakpoints->watch_access_type == ACCESS_TYPE_READ ? BREAKPOINT_READ_MEMORY : BREAKPOINT_WRITE_MEMORY;
+		for (j=0; j < breakpoints->num_watch_breakpoints; j++) {
+			i = breakpoints->watch_breakpoint_ids[j];
+			if (breakpoints->breakpoint_status[i] == BREAKPOINT_ENABLED && breakpoints->breakpoint_type[i] == btype && breakpoints->tokens[i * TOKENS_PER_BREAKPOINT] == breakpoints->watch_address) {
+				return i;
+			}
+		}
+	}
 
 	/* Special case for zeroth breakpoint: step conditions & user control */
 	if (breakpoints->breakpoint_status[0] == BREAKPOINT_ENABLED) {
@@ -144,75 +163,33 @@ int libdebugger_check_breakpoints(breakpoints_t *breakpoints, frame_status_t *ru
 		}
 	}
 
-	/* process normal breakpoints */
-	for (i=1; i < num_entries; i++) {
-		status = breakpoints->breakpoint_status[i];
-		if (status == BREAKPOINT_ENABLED) {
-			btype = breakpoints->breakpoint_type[i];
-#ifdef DEBUG_BREAKPOINT
-			printf("Breakpoint %d enabled: type=%d\n", i, btype);
-#endif
-			index = i * TOKENS_PER_BREAKPOINT;
-			clear(&stack);
-			for (count=0; count < TOKENS_PER_BREAKPOINT - 1; count++) {
-				token = breakpoints->tokens[index++];
-				op = token & OP_MASK;
-#ifdef DEBUG_BREAKPOINT
-				printf("  index=%d, count=%d token=%x\n", index-1, count, token);
-#endif
-				if (token == END_OF_LIST) goto compute;
-
-				if (op == OP_BINARY) {
-#ifdef DEBUG_BREAKPOINT
-					printf("  binary: op=%d\n", op);
-#endif
-					process_binary(token, &stack);
-				}
-				else if (op == OP_UNARY) {
-#ifdef DEBUG_BREAKPOINT
-					printf("  unary: op=%d\n", op);
-#endif
-					process_unary(token, get_emulator_value, &stack);
-				}
-				else {
-					if (op == VALUE_ARGUMENT) {
-						addr = breakpoints->tokens[index++];
-					}
-					else {
-						addr = 0;
-					}
-					if (token == NUMBER) {
-						value = addr;
-#ifdef DEBUG_BREAKPOINT
-						printf("  number: op=%d value=%04x\n", op, addr);
-#endif
+	/* PC == address breakpoints: only when the bitmap says there's one here
+	 is it necessary to find out which one */
+	if (BITMAP_TEST(breakpoints->pc_bitmap, current_pc)) {
+		for (j=0; j < breakpoints->num_address_breakpoints; j++) {
+			i = breakpoints->address_breakpoint_ids[j];
+			if (breakpoints->breakpoint_status[i] == BREAKPOINT_ENABLED && breakpoints->tokens[i * TOKENS_PER_BREAKPOINT + 2] == current_pc) {
+				return i;
+			}
+		}
+	}
 
-					}
-					else {
-						value = get_emulator_value(token, addr);
+	/* everything else is evaluated */
+	for (j=0; j < breakpoints->num_conditional_breakpoints; j++) {
+		i = breakpoints->conditional_breakpoint_ids[j];
+		if (breakpoints->breakpoint_status[i] == BREAKPOINT_ENABLED) {
 #ifdef DEBUG_BREAKPOINT
-						printf("  emu value: op=%d value=%04x\n", op, value);
+			printf("Breakpoint %d enabled: type=%d\n", i, breakpoints->breakpoint_type[i]);
 #endif
-					}
-					push(&stack, value);
-				}
-				if (stack.error) {
-					breakpoints->breakpoint_status[i] = stack.error;
-					goto next;
-				}
+			value = evaluate_tokens(&breakpoints->tokens[i * TOKENS_PER_BREAKPOINT], get_emulator_value);
+			if (value < 0) {
+				breakpoints->breakpoint_status[i] = -value;
 			}
-compute:
-			final_value = pop(&stack);
-			if (stack.error) {
-				breakpoints->breakpoint_status[i] = stack.error;
-				goto next;
-			}
-			if (final_value != 0) {
+			else if (value != 0) {
 				/* condition true, so the breakpoint should be triggered! */
 				return i;
 			}
 		}
-next: ;
 	}
 	return -1;
 }
@@ -220,23 +197,30 @@ next: ;
 #define ACCESS_COLOR_NORMAL_MAX 192
 #define ACCESS_COLOR_NORMAL_MIN 64
 
-/* Reduce brightness of each access at start of each frame */
+/* Reduce brightness of each access at start of each frame.
+
+	The loop is written without branches so the compiler can vectorize it:
+	every location is updated using masks computed from its current value.
+	A location that has faded out shows the contents of memory instead, and
+	memory can change without going through the access hooks (e.g. SIO
+	transfers or restoring a save state), so every location must be visited
+	each frame. Callers skip it entirely when use_memory_access is zero.
+*/
 void libdebugger_memory_access_start_frame(uint8_t *memory, frame_status_t *output) {
-	uint8_t val, *ptr, *a, *mem;
-
-	for (ptr=output->memory_access, a=output->access_type, mem=memory; ptr<&output->memory_access[MAIN_MEMORY_SIZE]; ptr++, a++, mem++) {
-		val = *ptr;
-		if (val > ACCESS_COLOR_NORMAL_MAX) *ptr = ACCESS_COLOR_NORMAL_MAX;
-		else {
-			if (val > ACCESS_COLOR_NORMAL_MIN) {
-				*ptr = val - access_color_step;
-				*a = *a & 0x0f;
-			}
-			else {
-				*ptr = *mem >> 2;
-				*a = 0;
-			}
-		}
+	uint8_t *ptr = output->memory_access;
+	uint8_t *a = output->access_type;
+	const uint8_t *mem = memory;
+	uint8_t step = (uint8_t)access_color_step;
+	int i;
+
+	for (i = 0; i < MAIN_MEMORY_SIZE; i++) {
+		uint8_t val = ptr[i];
+		uint8_t over = -(uint8_t)(val > ACCESS_COLOR_NORMAL_MAX);
+		uint8_t fading = -(uint8_t)(val > ACCESS_COLOR_NORMAL_MIN) & ~over;
+		uint8_t idle = ~(over | fading);
+
+		ptr[i] = (over & ACCESS_COLOR_NORMAL_MAX) | (fading & (uint8_t)(val - step)) | (idle & (mem[i] >> 2));
+		a[i] = (over & a[i]) | (fading & a[i] & 0x0f);
 	}
 }
 
@@ -246,11 +230,12 @@ void libdebugger_memory_access_start_frame(uint8_t *memory, frame_status_t *outp
 	stepping.
 */
 void libdebugger_memory_access_finish_frame(frame_status_t *output) {
-	uint8_t val, *ptr;
+	uint8_t *ptr = output->memory_access;
+	int i;
 
-	for (ptr=output->memory_access; ptr<&output->memory_access[MAIN_MEMORY_SIZE]; ptr++) {
-		val = *ptr;
-		if (val > ACCESS_COLOR_NORMAL_MAX) *ptr = ACCESS_COLOR_NORMAL_MAX;
+	for (i = 0; i < MAIN_MEMORY_SIZE; i++) {
+		uint8_t val = ptr[i];
+		ptr[i] = val > ACCESS_COLOR_NORMAL_MAX ? ACCESS_COLOR_NORMAL_MAX : val;
 	}
 }
 
@@ -261,14 +246,14 @@ int libdebugger_calc_frame(emu_frame_callback_ptr calc, uint8_t *memory, frame_s
 	switch (output->frame_status) {
 		case FRAME_BREAKPOINT:
 		output->breakpoint_id = 0;
-		libdebugger_memory_access_finish_frame(output);
+		if (output->use_memory_access) libdebugger_memory_access_finish_frame(output);
 		break;
 
 		default:
 		output->frame_number += 1;
 		output->current_instruction_in_frame = 0;
 		output->current_cycle_in_frame = 0;
-		libdebugger_memory_access_start_frame(memory, output);
+		if (output->use_memory_access) libdebugger_memory_access_start_frame(memory, output);
 	}
 	output->frame_status = FRAME_INCOMPLETE;
 	bpid = calc(output, breakpoints, history);
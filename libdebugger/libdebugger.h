@@ -72,6 +72,8 @@ typedef struct {
 #define BREAKPOINT_INFINITE_LOOP 0x5
 #define BREAKPOINT_BRK_INSTRUCTION 0x6
 #define BREAKPOINT_PAUSE_AT_FRAME_START 0x7
+#define BREAKPOINT_READ_MEMORY 0x8  /* address stored in first token */
+#define BREAKPOINT_WRITE_MEMORY 0x9
 
 /* status values returned */
 #define NO_BREAKPOINT_FOUND -1
@@ -85,8 +87,38 @@ typedef struct {
         uint8_t breakpoint_type[NUM_BREAKPOINT_ENTRIES];
         uint8_t breakpoint_status[NUM_BREAKPOINT_ENTRIES];
         uint16_t tokens[TOKEN_LIST_SIZE];  /* indexed by breakpoint number * TOKENS_PER_BREAKPOINT */
+
+        /* Index compiled from the breakpoints above by debugger.py each time
+        they change. Simple PC == address breakpoints are looked up through
+        the bitmap; only the remaining conditional breakpoints have their
+        token lists evaluated on every instruction. */
+        int32_t num_address_breakpoints;
+        int32_t num_conditional_breakpoints;
+        uint8_t address_breakpoint_ids[NUM_BREAKPOINT_ENTRIES];
+        uint8_t conditional_breakpoint_ids[NUM_BREAKPOINT_ENTRIES];
+        uint8_t pc_bitmap[MAIN_MEMORY_SIZE / 8];  /* bit (addr & 7) of byte (addr >> 3) */
+
+        /* Memory watch breakpoints, also compiled by debugger.py. The CPU
+        tests the bitmaps on each memory access and records a hit, which is
+        reported by the breakpoint check before the next instruction. */
+        int32_t num_watch_breakpoints;
+        int32_t watch_pending;
+        int32_t watch_address;
+        int32_t watch_access_type;  /* ACCESS_TYPE_READ or ACCESS_TYPE_WRITE */
+        uint8_t watch_breakpoint_ids[NUM_BREAKPOINT_ENTRIES];
+        uint8_t read_bitmap[MAIN_MEMORY_SIZE / 8];
+        uint8_t write_bitmap[MAIN_MEMORY_SIZE / 8];
 } breakpoints_t;
 
+#define BITMAP_TEST(bitmap, addr) ((bitmap)[(uint16_t)(addr) >> 3] & (1 << ((addr) & 7)))
+
+/* True if libdebugger_check_breakpoints could find a breakpoint at this PC;
+ if not, the CPU can skip calling it. */
+#define BREAKPOINTS_NEED_CHECK(b, pc) ((b)->num_conditional_breakpoints || (b)->watch_pending || (b)->breakpoint_status[0] == BREAKPOINT_ENABLED || (b)->last_pc == (pc) || BITMAP_TEST((b)->pc_bitmap, pc))
+
+#define WATCH_READ(b, addr) do { if (BITMAP_TEST((b)->read_bitmap, addr)) libdebugger_watch_hit(b, addr, ACCESS_TYPE_READ); } while (0)
+#define WATCH_WRITE(b, addr) do { if (BITMAP_TEST((b)->write_bitmap, addr)) libdebugger_watch_hit(b, addr, ACCESS_TYPE_WRITE); } while (0)
+
 
 /* operation flags */
 #define OP_UNARY 0x1000
@@ -168,6 +200,8 @@ int libdebugger_brk_instruction(breakpoints_t *breakpoints);
 
 int libdebugger_check_breakpoints(breakpoints_t *, frame_status_t *, cpu_state_callback_ptr);
 
+void libdebugger_watch_hit(breakpoints_t *breakpoints, uint16_t addr, int access_type);
+
 int libdebugger_calc_frame(emu_frame_callback_ptr calc, uint8_t *memory, frame_status_t *output, breakpoints_t *breakpoints, emulator_history_t *history);
 
 #endif /* LIBDEBUGGER_H */
@@ -1,5 +1,8 @@
 # cython: language_level=3
 from libc.stdio cimport printf
+from libc.string cimport memcpy
+import os
+from concurrent.futures import ThreadPoolExecutor
 import cython
 import numpy as np
 cimport numpy as np
@@ -8,7 +11,7 @@ from libudis.libudis cimport history_entry_t, emulator_history_t, parse_func_t,
 
 from libudis.declarations cimport find_parse_function, find_string_function
 
-from omnivore.disassembler.dtypes import HISTORY_ENTRY_DTYPE
+from omnivore.disassembler.dtypes import HISTORY_ENTRY_DTYPE, LABEL_INFO_DTYPE
 
 cdef extern:
     string_func_t stringifier_map[]
@@ -26,23 +29,49 @@ cdef class TextStorage:
     cdef public np.ndarray text_buffer
     cdef char *text_buffer_data
     cdef text_buffer_size
+    cdef bint external_buffer
     cdef char *text_ptr
     cdef np.uint32_t text_index
 
-    def __init__(self, max_lines, buffer_size=None):
+    def __init__(self, max_lines, buffer_size=None, text_buffer=None):
         if buffer_size is None:
-            buffer_size = max_lines * 64
-        self.alloc_arrays(max_lines, buffer_size)
+            buffer_size = max_lines * 64 if text_buffer is None else len(text_buffer)
+        self.alloc_arrays(max_lines, buffer_size, text_buffer)
         self.clear()
 
-    def alloc_arrays(self, max_lines, buffer_size):
+    def alloc_arrays(self, max_lines, buffer_size, text_buffer=None):
+        """Allocate the line index and text buffer. If `text_buffer` is
+        given, text is written directly into it instead of a new array; it
+        must be a contiguous uint8 array of at least `buffer_size` bytes.
+        """
         self.label_info = np.zeros(max_lines * sizeof(label_info_t), dtype=np.uint8)
         self.label_info_data = <label_info_t *>self.label_info.data
+        self.external_buffer = text_buffer is not None
+        if text_buffer is None:
+            text_buffer = np.zeros(buffer_size, dtype=np.uint8)
+        elif text_buffer.dtype != np.uint8 or not text_buffer.flags.c_contiguous or len(text_buffer) < buffer_size:
+            raise ValueError(f"text buffer must be contiguous uint8 of at least {buffer_size} bytes")
         self.text_buffer_size = buffer_size
-        self.text_buffer = np.zeros(buffer_size, dtype=np.uint8)
+        self.text_buffer = text_buffer
         self.text_buffer_data = <char *>self.text_buffer.data
         self.max_lines = max_lines
 
+    def reserve(self, max_lines, buffer_size=None):
+        """Clear the storage and make sure it has room for `max_lines` lines,
+        reallocating only if the current arrays are too small.
+
+        A text buffer supplied by the caller can't be grown, so a ValueError
+        is raised if it is too small; call `alloc_arrays` with a larger
+        buffer instead.
+        """
+        if buffer_size is None:
+            buffer_size = max_lines * 64
+        if max_lines > self.max_lines or buffer_size > self.text_buffer_size:
+            if self.external_buffer and buffer_size > self.text_buffer_size:
+                raise ValueError(f"supplied text buffer of {self.text_buffer_size} bytes is too small for {buffer_size} bytes")
+            self.alloc_arrays(max(max_lines, self.max_lines), max(buffer_size, self.text_buffer_size), self.text_buffer if self.external_buffer else None)
+        self.clear()
+
     def __len__(self):
         return self.num_lines
 
@@ -50,35 +79,74 @@ cdef class TextStorage:
         return index > 0 and index < self.num_lines
 
     def __getitem__(self, index):
-        cdef label_info_t *info
-        cdef int i, start, count
-
         if isinstance(index, slice):
-            lines = []
-            for i in range(*index.indices(len(self))):
-                info = &self.label_info_data[i]
-                start = info.text_start_index
-                count = info.line_length
-                lines.append(self.text_buffer[start:start + count].tostring())
-            return lines
+            return [self.get_bytes(i) for i in range(*index.indices(len(self)))]
         elif isinstance(index, int):
-            i = index
-            info = &self.label_info_data[i]
-            start = info.text_start_index
-            count = info.line_length
-            return self.text_buffer[start:start + count].tostring()
+            return self.get_bytes(index)
         else:
             raise TypeError(f"index must be int or slice, not {type(index)}")
 
     def __iter__(self):
-        cdef label_info_t *info
-        cdef int i, start, count
+        cdef int i
 
         for i in range(self.num_lines):
-            info = &self.label_info_data[i]
-            start = info.text_start_index
-            count = info.line_length
-            yield self.text_buffer[start:start + count].tostring()
+            yield self.get_bytes(i)
+
+    cdef inline label_info_t *get_info(self, int i) except NULL:
+        if i < 0:
+            i += self.num_lines
+        if i < 0 or i >= self.num_lines:
+            raise IndexError(f"line {i} out of range")
+        return &self.label_info_data[i]
+
+    def get_bytes(self, int i):
+        """Return the text of line `i` as bytes, copied straight from the
+        text buffer"""
+        cdef label_info_t *info = self.get_info(i)
+        return self.text_buffer_data[info.text_start_index:info.text_start_index + info.line_length]
+
+    def get_str(self, int i):
+        """Return the text of line `i` as a str, decoded straight from the
+        text buffer without an intermediate bytes object"""
+        cdef label_info_t *info = self.get_info(i)
+        return self.text_buffer_data[info.text_start_index:info.text_start_index + info.line_length].decode('latin-1')
+
+    def get_view(self, int i):
+        """Return a memoryview of the text of line `i`. It refers to the
+        text buffer, so it's only valid until the storage is cleared.
+        """
+        cdef label_info_t *info = self.get_info(i)
+        return memoryview(self.text_buffer)[info.text_start_index:info.text_start_index + info.line_length]
+
+    @property
+    def line_info(self):
+        """Structured array view of the index of all lines"""
+        return self.label_info[:self.num_lines * sizeof(label_info_t)].view(LABEL_INFO_DTYPE)
+
+    def lines(self, start=0, stop=None):
+        """Return the text of lines `start` to `stop` as a tuple of a single
+        uint8 array holding the text of all the lines, and an array of
+        offsets into it such that line `start + i` is
+        `text[offsets[i]:offsets[i + 1]]`.
+
+        Lines are usually stored consecutively, in which case the text
+        array is a view into the text buffer rather than a copy.
+        """
+        start, stop, _ = slice(start, stop).indices(self.num_lines)
+        stop = max(start, stop)
+        info = self.line_info[start:stop]
+        first = info['text_start_index'].astype(np.int64)
+        lengths = info['line_length'].astype(np.int64)
+        offsets = np.zeros(len(info) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if len(info) == 0:
+            text = self.text_buffer[0:0]
+        elif np.array_equal(first - first[0], offsets[:-1]):
+            text = self.text_buffer[first[0]:first[0] + offsets[-1]]
+        else:
+            index = np.repeat(first - offsets[:-1], lengths) + np.arange(offsets[-1])
+            text = self.text_buffer[index]
+        return text, offsets
 
     def clear(self):
         self.num_lines = 0
@@ -125,7 +193,7 @@ cdef class LabelStorage(TextStorage):
             info = &self.label_info_data[i]
             start = info.text_start_index
             count = info.line_length
-            return (self.text_buffer[start:start + count].tostring(), info.num_bytes, info.item_count, info.type_code)
+            return (self.text_buffer_data[start:start + count], info.num_bytes, info.item_count, info.type_code)
         elif isinstance(index, slice):
             raise TypeError(f"slicing not yet supported")
         else:
@@ -203,7 +271,7 @@ cdef class LabelStorage(TextStorage):
             start = info.text_start_index
             if start > 0:
                 count = info.line_length
-                print("entry:", i, start, count, info.num_bytes, info.item_count, info.type_code, self.text_buffer[start:start + count].tostring())
+                print("entry:", i, start, count, info.num_bytes, info.item_count, info.type_code, self.text_buffer[start:start + count].tobytes())
             info += 1
         if self.num_lines - 5 > 0:
             print("...", self.num_lines - 5, "more")
@@ -263,13 +331,20 @@ cdef class StringifiedDisassembly:
     cdef int mnemonic_case
     cdef char *hex_case
 
-    def __init__(self, start_index, max_lines, jmp_targets, labels=None, mnemonic_lower=True, hex_lower=True):
+    def __init__(self, start_index, max_lines, jmp_targets, labels=None, mnemonic_lower=True, hex_lower=True, TextStorage disasm_text=None):
+        if disasm_text is None:
+            disasm_text = TextStorage(max_lines)
+        self.disasm_text = disasm_text
+        self.setup(start_index, max_lines, jmp_targets, labels, mnemonic_lower, hex_lower)
+
+    def setup(self, start_index, max_lines, jmp_targets, labels=None, mnemonic_lower=True, hex_lower=True):
+        """Prepare for reuse, growing the text storage only if necessary"""
         cdef label_info_t *info
         cdef char *text
         cdef long addr
 
         self.start_index = start_index
-        self.disasm_text = TextStorage(max_lines)
+        self.disasm_text.reserve(max_lines)
         self.mnemonic_case = 1 if mnemonic_lower else 0
         self.hex_case = hexdigits_lower if hex_lower else hexdigits_upper
         self.jmp_targets = jmp_targets
@@ -295,20 +370,19 @@ cdef class StringifiedDisassembly:
         return self.disasm_text.num_lines
 
     def __getitem__(self, index):
-        if isinstance(index, slice):
-            lines = []
-            for i in range(*index.indices(len(self))):
-                lines.append(self.disasm_text[i])
-            return lines
-        elif isinstance(index, int):
-            return self.disasm_text[index]
-
-        else:
-            raise TypeError(f"index must be int or slice, not {type(index)}")
+        return self.disasm_text[index]
 
     def __iter__(self):
+        return iter(self.disasm_text)
+
+    def get_str(self, int i):
+        return self.disasm_text.get_str(i)
+
+    def iter_str(self):
+        cdef int i
+
         for i in range(len(self)):
-            yield self.disasm_text[i]
+            yield self.disasm_text.get_str(i)
 
     def clear(self):
         self.origin = 0
@@ -374,20 +448,34 @@ cdef class ParsedDisassembly:
         cdef history_entry_t *h = &self.history_entries[self.num_entries]
         cdef int last_pc = self.current_pc + num_bytes
         cdef np.uint32_t *index_list = self.index_to_row_data
+        cdef int i, count
+        with nogil:
+            while self.current_pc < last_pc and self.num_entries < self.max_entries:
+                if num_bytes > 0:
+                    count = processor(h, src, self.current_pc, last_pc, self.jmp_targets_data)
+                    src += count
+                    num_bytes -= count
+                    self.current_pc += count
+                    for i in range(count):
+                        index_list[self.index_index] = self.num_entries
+                        self.index_index += 1
+                    self.num_entries += 1
+                    h += 1
+                else:
+                    break
+
+    cdef int parse_entry(self, parse_func_t processor, np.uint8_t *src, int index, int chunk_end):
+        # parse a single entry starting at byte `index` of `src`, returning
+        # the number of bytes used
+        cdef history_entry_t *h = &self.history_entries[self.num_entries]
+        cdef int count = processor(h, src + index, self.origin + index, self.origin + chunk_end, self.jmp_targets_data)
         cdef int i
-        while self.current_pc < last_pc and self.num_entries < self.max_entries:
-            if num_bytes > 0:
-                count = processor(h, src, self.current_pc, last_pc, self.jmp_targets_data)
-                src += count
-                num_bytes -= count
-                self.current_pc += count
-                for i in range(count):
-                    index_list[self.index_index] = self.num_entries
-                    self.index_index += 1
-                self.num_entries += 1
-                h += 1
-            else:
-                break
+        for i in range(index, min(index + count, self.num_bytes)):
+            self.index_to_row_data[i] = self.num_entries
+        self.num_entries += 1
+        self.index_index = index + count
+        self.current_pc = self.origin + self.index_index
+        return count
 
     cdef fix_offset_labels(self):
         # fast loop in C to check for references to addresses that are in the
@@ -421,15 +509,96 @@ cdef class ParsedDisassembly:
         # printf("processor = %lx\n", processor)
         self.parse_next(processor, <unsigned char *>src.data, len(src))
 
-    def stringify(self, int index, int num_lines_requested, labels=None, mnemonic_lower=True, hex_lower=True):
+    def stringify(self, int index, int num_lines_requested, labels=None, mnemonic_lower=True, hex_lower=True, StringifiedDisassembly output=None):
+        """Return the text of `num_lines_requested` entries starting at
+        `index`. Passing the result of a previous call as `output` reuses
+        its storage instead of allocating new buffers.
+        """
         cdef history_entry_t *h = &self.history_entries[index]
-        output = StringifiedDisassembly(index, num_lines_requested, self.jmp_targets, labels, mnemonic_lower, hex_lower)
+        if output is None:
+            output = StringifiedDisassembly(index, num_lines_requested, self.jmp_targets, labels, mnemonic_lower, hex_lower)
+        else:
+            output.setup(index, num_lines_requested, self.jmp_targets, labels, mnemonic_lower, hex_lower)
         output.parse_history_entries(h, num_lines_requested)
         return output
 
 
 cdef int data_style = 1
 
+# how far past the start of an entry a parser may look to decide where the
+# entry ends: the data parser checks whether up to 9 bytes after a short
+# entry start a run, so an entry depends on at most this many bytes
+cdef int max_parse_lookahead = 17
+
+# jump targets found by the first entries of a piece are kept separately
+# because those entries are thrown away if the piece started in the middle
+# of an instruction
+cdef int max_piece_head_rows = 32
+
+cdef class DisassemblyPiece:
+    """Entries parsed from part of a chunk without reference to the rest of
+    the segment, so that pieces can be parsed in parallel.
+    """
+    cdef public int start
+    cdef public int end
+    cdef public int chunk_end
+    cdef public int stop
+    cdef public int num_rows
+    cdef int origin
+    cdef parse_func_t processor
+    cdef np.uint8_t *src
+    cdef public np.ndarray raw_entries
+    cdef history_entry_t *entries
+    cdef public np.ndarray row_start
+    cdef np.int32_t *row_start_data
+    cdef public np.ndarray head_targets
+    cdef jmp_targets_t *head_targets_data
+    cdef public np.ndarray body_targets
+    cdef jmp_targets_t *body_targets_data
+
+    def __init__(self, int start, int end, int chunk_end, int origin):
+        self.start = start
+        self.end = end
+        self.chunk_end = chunk_end
+        self.stop = start
+        self.num_rows = 0
+        self.origin = origin
+        # every entry starts before the end of the piece and uses at least
+        # one byte
+        self.raw_entries = np.zeros((end - start) * sizeof(history_entry_t), dtype=np.uint8)
+        self.entries = <history_entry_t *>self.raw_entries.data
+        self.row_start = np.zeros(end - start, dtype=np.int32)
+        self.row_start_data = <np.int32_t *>self.row_start.data
+        self.head_targets = np.zeros(sizeof(jmp_targets_t), dtype=np.uint8)
+        self.head_targets_data = <jmp_targets_t *>self.head_targets.data
+        self.body_targets = np.zeros(sizeof(jmp_targets_t), dtype=np.uint8)
+        self.body_targets_data = <jmp_targets_t *>self.body_targets.data
+
+    @property
+    def num_head_rows(self):
+        return min(self.num_rows, max_piece_head_rows)
+
+    def parse(self):
+        with nogil:
+            self.parse_nogil()
+
+    cdef void parse_nogil(self) nogil:
+        cdef int p = self.start
+        cdef int count
+        cdef history_entry_t *h = self.entries
+        cdef jmp_targets_t *targets = self.head_targets_data
+
+        while p < self.end:
+            if self.num_rows == max_piece_head_rows:
+                targets = self.body_targets_data
+            count = self.processor(h, self.src + p, self.origin + p, self.origin + self.chunk_end, targets)
+            self.row_start_data[self.num_rows] = p
+            self.num_rows += 1
+            p += count
+            h += 1
+        self.stop = p
+
+
 cdef class DisassemblyConfig:
     cdef np.uint8_t c_split_comments[8]
     cdef parse_func_t segment_parsers[8]
@@ -518,6 +687,216 @@ cdef class DisassemblyConfig:
 
         return parsed
 
+    def calc_chunk_starts(self, np.ndarray style):
+        """Return the indexes where a new chunk starts, i.e. where `parse`
+        switches to a different parser or splits at a comment.
+        """
+        cdef int user_bit_mask = 0x7
+        cdef int comment_bit_mask = 0x40
+
+        split = np.array([self.c_split_comments[i] for i in range(8)], dtype=bool)
+        s2 = style & user_bit_mask
+        boundary = (s2[1:] != s2[:-1]) | (((style[1:] & comment_bit_mask) != 0) & split[s2[1:]])
+        return np.flatnonzero(boundary).astype(np.int64) + 1
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    def reparse(self, ParsedDisassembly parsed, np.ndarray[np.uint8_t, ndim=1, mode="c"] data, np.ndarray[np.uint8_t, ndim=1, mode="c"] style, int start_index, int end_index):
+        """Update `parsed` in place after the bytes or styles from
+        `start_index` up to (but not including) `end_index` have changed.
+
+        `data` and `style` are the new contents of the whole segment, with
+        `style` as returned by `get_comment_locations`. Parsing restarts at
+        the first entry whose parser could have looked ahead into the change
+        and stops at the first boundary after the change that matches an
+        instruction boundary in the old parse; the new entries are spliced
+        in place of the old ones and the rows in `index_to_row` after the
+        change are shifted.
+
+        Returns False if `parsed` can't be updated and a full `parse` is
+        needed. Labels discovered by replaced instructions remain until the
+        next full parse.
+        """
+        cdef int user_bit_mask = 0x7
+        cdef int num_bytes = parsed.num_bytes
+        cdef int origin = parsed.origin
+        cdef int entry_size = parsed.entry_size
+        cdef np.uint32_t *index_to_row = parsed.index_to_row_data
+        cdef np.uint8_t *src = <np.uint8_t *>data.data
+        cdef np.uint8_t *c_style = <np.uint8_t *>style.data
+        cdef int first_row, last_row, p, b0, count, chunk_end, k, num_new, num_starts, delta
+        cdef int max_new, num_allocated
+        cdef np.int64_t[:] starts
+        cdef np.uint32_t[:] new_rows
+        cdef np.ndarray scratch
+        cdef history_entry_t *h
+        cdef parse_func_t processor
+
+        if num_bytes < 1 or len(data) != num_bytes or len(style) != num_bytes or parsed.index_index != num_bytes:
+            return False
+        start_index = max(0, min(start_index, num_bytes - 1))
+        end_index = max(start_index + 1, min(end_index, num_bytes))
+
+        # restart at the entry that covers the earliest byte that could see
+        # the change, because its end depends on the bytes and chunk
+        # boundaries up to max_parse_lookahead bytes after its start
+        b0 = max(0, start_index - max_parse_lookahead)
+        first_row = index_to_row[b0]
+        while b0 > 0 and index_to_row[b0 - 1] == first_row:
+            b0 -= 1
+
+        chunk_starts = self.calc_chunk_starts(style)
+        starts = chunk_starts
+        num_starts = len(chunk_starts)
+        k = np.searchsorted(chunk_starts, b0, side="right")
+        chunk_end = starts[k] if k < num_starts else num_bytes
+
+        max_new = parsed.max_entries - first_row
+        num_allocated = end_index - b0 + 64
+        scratch = np.zeros(num_allocated * entry_size, dtype=np.uint8)
+        h = <history_entry_t *>scratch.data
+        rows_array = np.zeros(num_bytes - b0, dtype=np.uint32)
+        new_rows = rows_array
+        num_new = 0
+        p = b0
+        while p < end_index or (p < num_bytes and index_to_row[p] == index_to_row[p - 1]):
+            if num_new >= num_allocated:
+                if num_new >= max_new:
+                    return False
+                num_allocated *= 2
+                scratch = np.concatenate([scratch, np.zeros(len(scratch), dtype=np.uint8)])
+                h = <history_entry_t *>scratch.data + num_new
+            while p >= chunk_end:
+                k += 1
+                chunk_end = starts[k] if k < num_starts else num_bytes
+            processor = self.segment_parsers[c_style[p] & user_bit_mask]
+            count = processor(h, src + p, origin + p, origin + chunk_end, parsed.jmp_targets_data)
+            if count < 1:
+                return False
+            while count > 0 and p < num_bytes:
+                new_rows[p - b0] = first_row + num_new
+                p += 1
+                count -= 1
+            num_new += 1
+            h += 1
+
+        last_row = index_to_row[p] if p < num_bytes else parsed.num_entries
+        delta = num_new - (last_row - first_row)
+        if parsed.num_entries + delta > parsed.max_entries:
+            return False
+
+        raw = parsed.raw_entries
+        raw[(first_row + num_new) * entry_size:(parsed.num_entries + delta) * entry_size] = raw[last_row * entry_size:parsed.num_entries * entry_size].copy()
+        raw[first_row * entry_size:(first_row + num_new) * entry_size] = scratch[:num_new * entry_size]
+        parsed.num_entries += delta
+        parsed.index_to_row[b0:p] = rows_array[:p - b0]
+        if delta != 0 and p < num_bytes:
+            rows = parsed.index_to_row[p:num_bytes]
+            rows[:] = rows.astype(np.int64) + delta
+        parsed.fix_offset_labels()
+        return True
+
+    def parse_parallel(self, segment, num_entries, num_workers=None, int piece_size=0x10000):
+        """Like `parse`, but splits large segments into pieces of about
+        `piece_size` bytes that are disassembled in `num_workers` threads
+        (default: one per CPU) with the GIL released.
+
+        A piece that doesn't start at the beginning of a chunk may start in
+        the middle of an instruction, so while merging, the entries that
+        overlap the start of each piece are parsed again serially until they
+        line up with the entries of the piece. Segments smaller than two
+        pieces are handled by `parse`.
+        """
+        cdef int user_bit_mask = 0x7
+        cdef int num_bytes = len(segment)
+        cdef int origin = segment.origin
+        cdef int cur, chunk_start, chunk_end, num_pieces, i
+        cdef DisassemblyPiece piece
+
+        if num_workers is None:
+            num_workers = os.cpu_count() or 1
+        if num_workers < 2 or num_bytes < 2 * piece_size:
+            return self.parse(segment, num_entries)
+
+        src_copy = segment.data.tobytes()
+        cdef np.uint8_t *src = <np.uint8_t *>src_copy
+        cdef np.ndarray style = segment.get_comment_locations(user=user_bit_mask)
+        cdef np.uint8_t *c_style = <np.uint8_t *>style.data
+
+        pieces = []
+        bounds = [0] + self.calc_chunk_starts(style).tolist() + [num_bytes]
+        for chunk_start, chunk_end in zip(bounds[:-1], bounds[1:]):
+            num_pieces = (chunk_end - chunk_start + piece_size - 1) // piece_size
+            splits = np.linspace(chunk_start, chunk_end, num_pieces + 1).astype(np.int64)
+            for i in range(num_pieces):
+                piece = DisassemblyPiece(splits[i], splits[i + 1], chunk_end, origin)
+                piece.processor = self.segment_parsers[c_style[chunk_start] & user_bit_mask]
+                piece.src = src
+                pieces.append(piece)
+
+        with ThreadPoolExecutor(num_workers) as pool:
+            list(pool.map(DisassemblyPiece.parse, pieces))
+
+        cdef ParsedDisassembly parsed = self.get_parser(num_entries, origin, num_bytes)
+        cur = 0
+        for piece in pieces:
+            cur = self.merge_piece(parsed, piece, src, cur)
+            if cur < 0:
+                break
+        parsed.fix_offset_labels()
+        return parsed
+
+    cdef int merge_piece(self, ParsedDisassembly parsed, DisassemblyPiece piece, np.uint8_t *src, int cur) except -2:
+        # append the entries of the piece starting at byte `cur`, returning
+        # the byte after the last entry or -1 if `parsed` is full
+        cdef int n = piece.num_rows
+        cdef np.int32_t *row_start = piece.row_start_data
+        cdef int k = 0
+        cdef int serial_end, count, i, b, row
+
+        # the previous piece may have ended in the middle of an instruction
+        # of this one
+        while cur < piece.end:
+            while k < n and row_start[k] < cur:
+                k += 1
+            if k < n and row_start[k] == cur:
+                break
+            if parsed.num_entries >= parsed.max_entries:
+                return -1
+            cur += parsed.parse_entry(piece.processor, src, cur, piece.chunk_end)
+        if cur >= piece.end:
+            return cur
+
+        # entries whose jump targets went to the head table are parsed
+        # again so their targets are recorded in order. If entries that
+        # were thrown away also wrote to the body table, everything is.
+        serial_end = piece.num_head_rows if k <= piece.num_head_rows else n
+        for i in range(k, serial_end):
+            if parsed.num_entries >= parsed.max_entries:
+                return -1
+            cur += parsed.parse_entry(piece.processor, src, cur, piece.chunk_end)
+        if serial_end == n:
+            return cur
+
+        count = min(n - serial_end, parsed.max_entries - parsed.num_entries)
+        memcpy(&parsed.history_entries[parsed.num_entries], &piece.entries[serial_end], count * sizeof(history_entry_t))
+        for i in range(count):
+            row = parsed.num_entries + i
+            b = row_start[serial_end + i]
+            cur = row_start[serial_end + i + 1] if serial_end + i + 1 < n else piece.stop
+            while b < cur:
+                parsed.index_to_row_data[b] = row
+                b += 1
+        parsed.num_entries += count
+        parsed.index_index = cur
+        parsed.current_pc = parsed.origin + cur
+        discovered = parsed.jmp_targets[:256*256]
+        body = piece.body_targets[:256*256]
+        np.copyto(discovered, body, where=body != 0)
+        if count < n - serial_end:
+            return -1
+        return cur
+
 
 cdef class StringifiedHistory:
     cdef public int origin
@@ -533,16 +912,25 @@ cdef class StringifiedHistory:
     cdef int mnemonic_case
     cdef char *hex_case
 
-    def __init__(self, max_lines, labels=None, mnemonic_lower=True, hex_lower=True):
+    def __init__(self, max_lines, labels=None, mnemonic_lower=True, hex_lower=True, TextStorage history_text=None, TextStorage result_text=None):
+        if history_text is None:
+            history_text = TextStorage(max_lines)
+        if result_text is None:
+            result_text = TextStorage(max_lines)
+        self.history_text = history_text
+        self.result_text = result_text
+        self.jmp_targets = np.zeros(sizeof(jmp_targets_t), dtype=np.uint8)
+        self.jmp_targets_data = <jmp_targets_t *>self.jmp_targets.data
+        self.setup(max_lines, labels, mnemonic_lower, hex_lower)
+
+    def setup(self, max_lines, labels=None, mnemonic_lower=True, hex_lower=True):
+        """Prepare for reuse, growing the text storage only if necessary"""
         cdef long addr
 
-        self.history_text = TextStorage(max_lines)
-        self.result_text = TextStorage(max_lines)
+        self.history_text.reserve(max_lines)
+        self.result_text.reserve(max_lines)
         self.mnemonic_case = 1 if mnemonic_lower else 0
         self.hex_case = hexdigits_lower if hex_lower else hexdigits_upper
-        self.clear()
-        self.jmp_targets = np.zeros(sizeof(jmp_targets_t), dtype=np.uint8)
-        self.jmp_targets_data = <jmp_targets_t *>self.jmp_targets.data
 
         if labels is not None:
             addr = labels.get_text_storage_addr()
@@ -561,20 +949,26 @@ cdef class StringifiedHistory:
 
     def __getitem__(self, index):
         if isinstance(index, slice):
-            lines = []
-            for i in range(*index.indices(len(self))):
-                lines.append((self.history_text[i], self.result_text[i]
-))
-            return lines
+            return [self[i] for i in range(*index.indices(len(self)))]
         elif isinstance(index, int):
-            return self.history_text[index], self.result_text[index]
-
+            return self.history_text.get_bytes(index), self.result_text.get_bytes(index)
         else:
             raise TypeError(f"index must be int or slice, not {type(index)}")
 
     def __iter__(self):
+        cdef int i
+
+        for i in range(len(self)):
+            yield self.history_text.get_bytes(i), self.result_text.get_bytes(i)
+
+    def get_str(self, int i):
+        return self.history_text.get_str(i), self.result_text.get_str(i)
+
+    def iter_str(self):
+        cdef int i
+
         for i in range(len(self)):
-            yield self.history_text[i], self.result_text[i]
+            yield self.history_text.get_str(i), self.result_text.get_str(i)
 
     def clear(self):
         self.history_text.clear()
@@ -664,6 +1058,35 @@ cdef class HistoryStorage:
     def cumulative_count(self):
         return self.history.cumulative_count
 
+    @property
+    def num_allocated_entries(self):
+        return self.history.num_allocated_entries
+
+    def ordered_views(self, start=0, stop=None):
+        """Return entries `start` to `stop` (counted from the oldest entry, as
+        in `__getitem__`) in order as a list of at most two views into the
+        ring, so no copy is needed at the wraparound point.
+        """
+        start, stop, _ = slice(start, stop).indices(self.history.num_entries)
+        if stop <= start:
+            return []
+        mod = self.history.num_allocated_entries
+        first = (self.history.first_entry_index + start) % mod
+        last = first + stop - start
+        if last <= mod:
+            return [self.entries[first:last]]
+        return [self.entries[first:], self.entries[:last - mod]]
+
+    def load_entries(self, entries):
+        """Replace the contents of the ring with `entries`, keeping only the
+        most recent if there are more than will fit.
+        """
+        count = min(len(entries), self.history.num_allocated_entries)
+        self.entries[:count] = entries[len(entries) - count:]
+        self.history.first_entry_index = 0
+        self.history.num_entries = count
+        self.history.latest_entry_index = count - 1
+
     def clear(self):
         self.history.first_entry_index = 0
         self.history.latest_entry_index = -1
@@ -695,8 +1118,15 @@ cdef class HistoryStorage:
         i = last % mod
         print(f"{i}: {self.entries[i]}")
 
-    def stringify(self, int index, int num_lines_requested, labels=None, mnemonic_lower=True, hex_lower=True):
-        output = StringifiedHistory(num_lines_requested, labels, mnemonic_lower, hex_lower)
+    def stringify(self, int index, int num_lines_requested, labels=None, mnemonic_lower=True, hex_lower=True, StringifiedHistory output=None):
+        """Return the text of `num_lines_requested` entries starting at row
+        `index`. Passing the result of a previous call as `output` reuses
+        its storage instead of allocating new buffers.
+        """
+        if output is None:
+            output = StringifiedHistory(num_lines_requested, labels, mnemonic_lower, hex_lower)
+        else:
+            output.setup(num_lines_requested, labels, mnemonic_lower, hex_lower)
         index = (self.history.first_entry_index + index) % self.history.num_allocated_entries
         output.parse_history_entries(self.history, index, num_lines_requested)
         return output
@@ -502,6 +502,14 @@ int stringify_entry_breakpoint(history_entry_t *h_entry, char *t, char *hexdigit
             t = STRING(t, 0, ": infinite loop detected");
             break;
 
+            case BREAKPOINT_READ_MEMORY:
+            t = STRING(t, 0, ": memory read");
+            break;
+
+            case BREAKPOINT_WRITE_MEMORY:
+            t = STRING(t, 0, ": memory write");
+            break;
+
             default:
             break;
         }
@@ -5,7 +5,9 @@ import wx
 from atrcopy import match_bit_mask, comment_bit_mask, selected_bit_mask, diff_bit_mask, user_bit_mask, not_user_bit_mask
 
 from omnivore_framework.utils.permute import bit_reverse_table
-from omnivore_framework.utils.nputil import intscale, intwscale, intwscale_font
+from omnivore_framework.utils.nputil import intwscale, intwscale_font
+
+from ..ui.intscale import intscale
 
 from . import colors
 from .atascii import internal_to_atascii, atascii_to_internal
@@ -18,6 +20,34 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# Each style byte is reduced to one of these classes, which selects the set of
+# colors used for its pixels. Later classes have priority.
+NORMAL_STYLE, DATA_STYLE, COMMENT_STYLE, MATCH_STYLE, SELECTED_STYLE = range(5)
+num_style_classes = 5
+
+
+def calc_style_classes():
+    style = np.arange(256)
+    classes = np.full(256, NORMAL_STYLE, dtype=np.intp)
+    classes[(style & user_bit_mask) > 0] = DATA_STYLE
+    classes[(style & comment_bit_mask) == comment_bit_mask] = COMMENT_STYLE
+    classes[(style & match_bit_mask) == match_bit_mask] = MATCH_STYLE
+    classes[(style & selected_bit_mask) == selected_bit_mask] = SELECTED_STYLE
+    return classes
+
+style_classes = calc_style_classes()
+
+
+def calc_pixel_table(bits_per_pixel):
+    # color index of each pixel in a byte, for all byte values, leftmost
+    # pixel in the high bits
+    shifts = np.arange(8 - bits_per_pixel, -1, -bits_per_pixel)
+    values = np.arange(256)[:, np.newaxis] >> shifts
+    return (values & ((1 << bits_per_pixel) - 1)).astype(np.uint8)
+
+pixel_tables = {bits_per_pixel: calc_pixel_table(bits_per_pixel) for bits_per_pixel in [1, 2, 4]}
+
+
 class BaseRenderer(object):
     name = "base"
     scale_width = 1
@@ -42,6 +72,9 @@ class BaseRenderer(object):
 
     def get_colors(self, segment_viewer, registers):
         color_registers = [segment_viewer.machine.color_registers[r] for r in registers]
+        return self.calc_blended_colors(segment_viewer, color_registers)
+
+    def calc_blended_colors(self, segment_viewer, color_registers):
         h_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.highlight_background_color)
         m_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.match_background_color)
         c_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.comment_background_color)
@@ -93,61 +126,53 @@ class BaseRenderer(object):
         elif self.pixels_per_byte == 8:
             return self.calc_style_per_pixel_1bpp(style)
 
-    def get_2bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel=None):
-        bits = np.unpackbits(byte_values)
-        bits = bits.reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row, 4), dtype=np.uint8)
-        pixels[:,0] = bits[:,0] * 2 + bits[:,1]
-        pixels[:,1] = bits[:,2] * 2 + bits[:,3]
-        pixels[:,2] = bits[:,4] * 2 + bits[:,5]
-        pixels[:,3] = bits[:,6] * 2 + bits[:,7]
-
+    def calc_palette(self, segment_viewer, colors):
+        """Return an array of RGB values for every combination of style
+        class and color index, indexed by `style class * number of colors +
+        color index`, followed by the empty background color.
+        """
+        color_registers, h_colors, m_colors, c_colors, d_colors = colors
+        n = len(color_registers)
+        palette = np.empty((num_style_classes * n + 1, 3), dtype=np.uint8)
+        for style_class, c in [(NORMAL_STYLE, color_registers), (DATA_STYLE, d_colors), (COMMENT_STYLE, c_colors), (MATCH_STYLE, m_colors), (SELECTED_STYLE, h_colors)]:
+            palette[style_class * n:(style_class + 1) * n] = c
+        palette[-1] = segment_viewer.preferences.empty_background_color.Get(False)
+        return palette
+
+    def get_bitimage(self, segment_viewer, pixels, style, count, colors):
+        """Return the RGB image of an array of color indexes.
+
+        `style` either has the same shape as `pixels` or has one value for
+        each row of `pixels`. Rows starting at `count` are drawn in the
+        empty background color, unless `count` is None. Each output pixel is
+        a single lookup into the palette.
+        """
+        palette = self.calc_palette(segment_viewer, colors)
+        index = style_classes[style] * len(colors[0])
+        if index.ndim < pixels.ndim:
+            index = index[:, np.newaxis]
+        index = index + pixels
+        if count is not None:
+            index[count:] = len(palette) - 1
+        return palette[index]
+
+    def get_1bpp(self, segment_viewer, count, byte_values, style, colors, style_per_pixel=None):
+        pixels = pixel_tables[1][byte_values]
         if style_per_pixel is None:
-            style_per_pixel = self.calc_style_per_pixel_2bpp(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
+            style_per_pixel = style
+        return self.get_bitimage(segment_viewer, pixels, style_per_pixel, count, colors)
 
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr * bytes_per_row, 4, 3), dtype=np.uint8)
-        for i in range(4):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
+    def get_2bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel=None):
+        pixels = pixel_tables[2][byte_values]
+        if style_per_pixel is None:
+            style_per_pixel = style
+        return self.get_bitimage(segment_viewer, pixels, style_per_pixel, count, colors)
 
     def get_4bpp(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel=None):
-        bits = np.unpackbits(byte_values)
-        bits = bits.reshape((-1, 8))
-        pixels = np.empty((nr * bytes_per_row, 2), dtype=np.uint8)
-        pixels[:,0] = bits[:,0] * 8 + bits[:,1] * 4 + bits[:,2] * 2 + bits[:,3]
-        pixels[:,1] = bits[:,4] * 8 + bits[:,5] * 4 + bits[:,6] * 2 + bits[:,7]
-
+        pixels = pixel_tables[4][byte_values]
         if style_per_pixel is None:
-            style_per_pixel = self.calc_style_per_pixel_4bpp(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr * bytes_per_row, 2, 3), dtype=np.uint8)
-        for i in range(16):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-        return bitimage
+            style_per_pixel = style
+        return self.get_bitimage(segment_viewer, pixels, style_per_pixel, count, colors)
 
     def get_bitplane_pixels(self, bits, pixels, bytes_per_row, pixels_per_row):
         """Fill the pixels array with color register data
@@ -160,9 +185,9 @@ class BaseRenderer(object):
     def get_bitplane_style(self, style):
         raise NotImplemented
 
-    def get_bitplanes(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors):
+    def get_bitplanes(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, colors, style_per_pixel=None):
         bitplanes = self.bitplanes
-        _, rem = divmod(np.alen(byte_values), bitplanes)
+        _, rem = divmod(len(byte_values), bitplanes)
         if rem > 0:
             byte_values = np.append(byte_values, np.zeros(rem, dtype=np.uint8))
             style = np.append(style, np.zeros(rem, dtype=np.uint8))
@@ -170,24 +195,10 @@ class BaseRenderer(object):
         bits = np.unpackbits(byte_values).reshape((-1, 8))
         pixels = np.empty((nr * bytes_per_row // bitplanes, pixels_per_row), dtype=np.uint8)
         self.get_bitplane_pixels(bits, pixels, bytes_per_row, pixels_per_row)
-        pixels = pixels.reshape((nr, pixels_per_row))
+        # each group of bitplane bytes has a single style for its 8 pixels
         s = self.get_bitplane_style(style)
-        style_per_pixel = s.repeat(8).reshape((-1, pixels_per_row))
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        color_registers, h_colors, m_colors, c_colors, d_colors = colors
-        bitimage = np.empty((nr, pixels_per_row, 3), dtype=np.uint8)
-        for i in range(2**bitplanes):
-            color_is_set = (pixels == i)
-            bitimage[color_is_set & normal] = color_registers[i]
-            bitimage[color_is_set & data] = d_colors[i]
-            bitimage[color_is_set & comment] = c_colors[i]
-            bitimage[color_is_set & match] = m_colors[i]
-            bitimage[color_is_set & highlight] = h_colors[i]
+        bitimage = self.get_bitimage(segment_viewer, pixels.reshape((-1, 8)), s, None, colors)
+        bitimage = bitimage.reshape((nr, pixels_per_row, 3))
         bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
         return bitimage
 
@@ -199,39 +210,8 @@ class OneBitPerPixelB(BaseRenderer):
         return ((255, 255, 255), (0, 0, 0))
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        bits = np.unpackbits(byte_values)
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels == 0)
-        color1 = (pixels == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-
-        if style_per_pixel is None:
-            style_per_pixel = self.calc_style_per_pixel_1bpp(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 8, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
-
+        colors = self.calc_blended_colors(segment_viewer, self.get_bw_colors(segment_viewer))
+        bitimage = self.get_1bpp(segment_viewer, count, byte_values, style, colors, style_per_pixel)
         return self.reshape(bitimage, bytes_per_row, nr)
 
 
@@ -283,38 +263,12 @@ class OneBitPerPixelApple2Linear(BaseRenderer):
         return np.vstack((style, style, style, style, style, style, style)).T
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        bits = np.unpackbits(bit_reverse_table[byte_values])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
+        pixels = pixel_tables[1][bit_reverse_table[byte_values], 0:7]
 
+        colors = self.calc_blended_colors(segment_viewer, self.get_bw_colors(segment_viewer))
         if style_per_pixel is None:
-            style_per_pixel = self.calc_style_per_pixel(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
+            style_per_pixel = style
+        bitimage = self.get_bitimage(segment_viewer, pixels, style_per_pixel, count, colors)
 
         return bitimage.reshape((nr, bytes_per_row * 7, 3))
 
@@ -343,38 +297,12 @@ class OneBitPerPixelApple2FullScreen(OneBitPerPixelApple2Linear):
         byte_values = byte_values[0:8192]
         num_valid = len(byte_values)  # might be smaller than 8192
         screen[:num_valid] = byte_values
-        bits = np.unpackbits(bit_reverse_table[screen])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
+        pixels = pixel_tables[1][bit_reverse_table[screen[:192 * 40]], 0:7]
 
+        colors = self.calc_blended_colors(segment_viewer, self.get_bw_colors(segment_viewer))
         if style_per_pixel is None:
-            style_per_pixel = self.calc_style_per_pixel(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((192 * 40, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
+            style_per_pixel = style
+        bitimage = self.get_bitimage(segment_viewer, pixels, style_per_pixel, count, colors)
 
         return bitimage.reshape((nr, bytes_per_row * 7, 3))
 
@@ -426,38 +354,12 @@ class OneBitPerPixelApple2Artifacting(OneBitPerPixelApple2Linear):
     # 11 - white
 
     def get_image(self, segment_viewer, bytes_per_row, nr, count, byte_values, style, style_per_pixel=None):
-        bits = np.unpackbits(bit_reverse_table[byte_values])
-        pixels = bits.reshape((-1, 8))
-
-        background = (pixels[:,0:7] == 0)
-        color1 = (pixels[:,0:7] == 1)
-
-        bw_colors = self.get_bw_colors(segment_viewer)
-        h_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(bw_colors, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(bw_colors, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
+        pixels = pixel_tables[1][bit_reverse_table[byte_values], 0:7]
 
+        colors = self.calc_blended_colors(segment_viewer, self.get_bw_colors(segment_viewer))
         if style_per_pixel is None:
-            style_per_pixel = self.calc_style_per_pixel(style)
-        normal = (style_per_pixel & self.ignore_mask) == 0
-        highlight = (style_per_pixel & selected_bit_mask) == selected_bit_mask
-        data = (style_per_pixel & user_bit_mask) > 0
-        comment = (style_per_pixel & comment_bit_mask) == comment_bit_mask
-        match = (style_per_pixel & match_bit_mask) == match_bit_mask
-
-        bitimage = np.empty((nr * bytes_per_row, 7, 3), dtype=np.uint8)
-        bitimage[background & normal] = bw_colors[0]
-        bitimage[background & data] = d_colors[0]
-        bitimage[background & comment] = c_colors[0]
-        bitimage[background & match] = m_colors[0]
-        bitimage[background & highlight] = h_colors[0]
-        bitimage[color1 & normal] = bw_colors[1]
-        bitimage[color1 & data] = d_colors[1]
-        bitimage[color1 & comment] = c_colors[1]
-        bitimage[color1 & match] = m_colors[1]
-        bitimage[color1 & highlight] = h_colors[1]
-        bitimage[count:,:,:] = segment_viewer.preferences.empty_background_color.Get(False)
+            style_per_pixel = style
+        bitimage = self.get_bitimage(segment_viewer, pixels, style_per_pixel, count, colors)
 
         return bitimage.reshape((nr, bytes_per_row * 7, 3))
 
@@ -664,11 +566,7 @@ class GTIA9(FourBitsPerPixel):
     def get_colors(self, segment_viewer, registers):
         antic_color_registers = self.get_antic_color_registers(segment_viewer)
         color_registers = segment_viewer.machine.get_color_registers(antic_color_registers)
-        h_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.highlight_background_color)
-        m_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.match_background_color)
-        c_colors = colors.get_blended_color_registers(color_registers, segment_viewer.preferences.comment_background_color)
-        d_colors = colors.get_dimmed_color_registers(color_registers, segment_viewer.preferences.background_color, segment_viewer.preferences.data_background_color)
-        return color_registers, h_colors, m_colors, c_colors, d_colors
+        return self.calc_blended_colors(segment_viewer, color_registers)
 
 
 class GTIA10(GTIA9):
@@ -1,4 +1,5 @@
 import hashlib, uuid
+from collections import OrderedDict
 
 import numpy as np
 import wx
@@ -57,6 +58,58 @@ A2MouseTextFont = {
 builtin_font_data = {f['uuid']:f for f in [A8DefaultFont, A8ComputerFont, A2DefaultFont, A2MouseTextFont]}
 
 
+def calc_font_uuid(font_data):
+    """Return the uuid of the font, or one computed from the font data for
+    fonts that don't have one (e.g. fonts edited by the user)
+    """
+    if 'uuid' in font_data:
+        return font_data['uuid']
+    if 'np_data' in font_data:
+        data_bytes = font_data['np_data'].tobytes()
+    else:
+        data_bytes = bytes(font_data['data'])
+    return str(uuid.UUID(bytes=hashlib.md5(data_bytes).digest()))
+
+
+def color_key(colors):
+    return tuple(tuple(float(v) for v in c) for c in colors)
+
+
+class GlyphAtlasCache(object):
+    """LRU cache of the expanded glyph arrays returned by
+    `font_renderer.get_font`.
+
+    Every `AnticFont` needs five copies of the character set rendered in
+    different colors, and many viewers show the same font, so the arrays
+    are shared between them. They are marked read-only for that reason.
+    """
+    def __init__(self, max_fonts=64):
+        self.max_fonts = max_fonts
+        self.fonts = OrderedDict()
+
+    def __len__(self):
+        return len(self.fonts)
+
+    def clear(self):
+        self.fonts.clear()
+
+    def get_font(self, font_uuid, data, font_renderer, colors, gr0_colors, reverse):
+        key = (font_uuid, font_renderer, color_key(colors), color_key(gr0_colors), bool(reverse))
+        try:
+            font = self.fonts[key]
+            self.fonts.move_to_end(key)
+        except KeyError:
+            font = font_renderer.get_font(data, colors, gr0_colors, reverse)
+            font.flags.writeable = False
+            self.fonts[key] = font
+            while len(self.fonts) > self.max_fonts:
+                self.fonts.popitem(last=False)
+        return font
+
+
+glyph_atlas_cache = GlyphAtlasCache()
+
+
 class AnticFont(object):
     def __init__(self, segment_viewer, font_data, font_renderer, playfield_colors, reverse=False):
         self.use_blinking = font_data.get('blink', False)
@@ -64,7 +117,7 @@ class AnticFont(object):
         self.char_h = font_renderer.char_bit_height
         self.scale_w = font_renderer.scale_width
         self.scale_h = font_renderer.scale_height
-        self.uuid = font_data['uuid']
+        self.uuid = calc_font_uuid(font_data)
 
         self.set_colors(segment_viewer, playfield_colors)
         self.set_fonts(segment_viewer, font_data, font_renderer, reverse)
@@ -88,21 +141,24 @@ class AnticFont(object):
             data = np.fromstring(font_data['data'], dtype=np.uint8)
         self.font_data = font_data
 
+        def get_font(registers, gr0_colors):
+            return glyph_atlas_cache.get_font(self.uuid, data, font_renderer, registers, gr0_colors, reverse)
+
         m = segment_viewer.machine
-        self.normal_font = font_renderer.get_font(data, m.color_registers, self.normal_gr0_colors, reverse)
+        self.normal_font = get_font(m.color_registers, self.normal_gr0_colors)
 
         prefs = segment_viewer.preferences
         h_colors = colors.get_blended_color_registers(m.color_registers, prefs.highlight_background_color)
-        self.highlight_font = font_renderer.get_font(data, h_colors, self.highlight_gr0_colors, reverse)
+        self.highlight_font = get_font(h_colors, self.highlight_gr0_colors)
 
         d_colors = colors.get_dimmed_color_registers(m.color_registers, prefs.background_color, prefs.data_background_color)
-        self.data_font = font_renderer.get_font(data, d_colors, self.data_gr0_colors, reverse)
+        self.data_font = get_font(d_colors, self.data_gr0_colors)
 
         m_colors = colors.get_blended_color_registers(m.color_registers, prefs.match_background_color)
-        self.match_font = font_renderer.get_font(data, m_colors, self.match_gr0_colors, reverse)
+        self.match_font = get_font(m_colors, self.match_gr0_colors)
 
         c_colors = colors.get_blended_color_registers(m.color_registers, prefs.comment_background_color)
-        self.comment_font = font_renderer.get_font(data, c_colors, self.comment_gr0_colors, reverse)
+        self.comment_font = get_font(c_colors, self.comment_gr0_colors)
 
     def get_height(self, zoom):
         return self.char_h * self.scale_h * zoom
@@ -93,6 +93,49 @@ import logging
 log = logging.getLogger(__name__)
 
 
+unary_operators = {dd.OP_BITWISE_NOT, dd.OP_LOGICAL_NOT, dd.OP_UMINUS, dd.OP_UPLUS}
+
+binary_operators = {
+    dd.OP_BITWISE_AND, dd.OP_BITWISE_OR, dd.OP_DIV, dd.OP_EQ, dd.OP_EXP,
+    dd.OP_GE, dd.OP_GT, dd.OP_LE, dd.OP_LOGICAL_AND, dd.OP_LOGICAL_OR,
+    dd.OP_LSHIFT, dd.OP_LT, dd.OP_MINUS, dd.OP_MULT, dd.OP_NE, dd.OP_PLUS,
+    dd.OP_RSHIFT,
+}
+
+
+def check_tokens(tokens):
+    """Verify that the postfix token list evaluates to a single value,
+    returning BREAKPOINT_ENABLED if so or the error status the C evaluator
+    would report.
+    """
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        token = int(tokens[i])
+        op = token & dd.OP_MASK
+        if token == dd.END_OF_LIST:
+            if depth == 1:
+                return dd.BREAKPOINT_ENABLED
+            return dd.STACK_OVERFLOW if depth > 1 else dd.STACK_UNDERFLOW
+        elif op == dd.OP_BINARY:
+            if token not in binary_operators:
+                return dd.EVALUATION_ERROR
+            if depth < 2:
+                return dd.STACK_UNDERFLOW
+            depth -= 1
+        elif op == dd.OP_UNARY:
+            if token not in unary_operators:
+                return dd.EVALUATION_ERROR
+            if depth < 1:
+                return dd.STACK_UNDERFLOW
+        else:
+            if op == dd.VALUE_ARGUMENT:
+                i += 1
+            depth += 1
+        i += 1
+    return dd.EVALUATION_ERROR  # missing END_OF_LIST
+
+
 class Breakpoint:
     def __init__(self, debugger, id, addr=None):
         self.debugger = debugger
@@ -117,6 +160,7 @@ class Breakpoint:
     def status(self, status):
         c = self.debugger.debug_cmd[0]
         c['breakpoint_status'][self.id] = status
+        self.debugger.compile_breakpoints()
 
     @property
     def type(self):
@@ -127,6 +171,7 @@ class Breakpoint:
     def type(self, type):
         c = self.debugger.debug_cmd[0]
         c['breakpoint_type'][self.id] = type
+        self.debugger.compile_breakpoints()
 
     @property
     def reference_value(self):
@@ -152,12 +197,23 @@ class Breakpoint:
         i = self.index
         count = len(term_list)
         c['tokens'][i:i+count] = term_list
+        self.debugger.compile_breakpoints()
 
     @property
     def enabled(self):
         c = self.debugger.debug_cmd[0]
         return bool(c['breakpoint_status'][self.id] == dd.BREAKPOINT_ENABLED)
 
+    @property
+    def address(self):
+        """PC of a simple address breakpoint, or None for any other kind"""
+        c = self.debugger.debug_cmd[0]
+        i = self.index
+        tokens = c['tokens'][i:i+5]
+        if tokens[0] == dd.REG_PC and tokens[1] == dd.NUMBER and tokens[3] == dd.OP_EQ and tokens[4] == dd.END_OF_LIST:
+            return int(tokens[2])
+        return None
+
     @property
     def had_error(self):
         c = self.debugger.debug_cmd[0]
@@ -170,6 +226,13 @@ class Breakpoint:
         c['breakpoint_status'][self.id] = dd.BREAKPOINT_ENABLED
         self.terms = (dd.REG_PC, dd.NUMBER, addr, dd.OP_EQ, dd.END_OF_LIST)
 
+    def watch_memory(self, addr, write=False):
+        # shortcut to create a break after the CPU reads (or writes) addr
+        c = self.debugger.debug_cmd[0]
+        c['breakpoint_type'][self.id] = dd.BREAKPOINT_WRITE_MEMORY if write else dd.BREAKPOINT_READ_MEMORY
+        c['tokens'][self.index] = addr
+        self.enable()
+
     def step_into(self, count):
         # shortcut to create a break after `count` instructions
         c = self.debugger.debug_cmd[0]
@@ -215,22 +278,37 @@ class Breakpoint:
         self.terms = (dd.OPCODE_TYPE, dd.OPCODE_RETURN, dd.REG_SP, dd.NUMBER, sp, dd.OP_EQ, dd.OP_LOGICAL_AND, dd.END_OF_LIST)
         self.enable()
 
+    def break_at_return_to(self, addr, sp=-1):
+        # shortcut to break when PC=addr with the stack unwound to sp, or at
+        # PC=addr alone if sp is unknown
+        c = self.debugger.debug_cmd[0]
+        c['breakpoint_type'][self.id] = dd.BREAKPOINT_CONDITIONAL
+        c['breakpoint_status'][self.id] = dd.BREAKPOINT_ENABLED
+        if sp < 0:
+            self.terms = (dd.REG_PC, dd.NUMBER, addr, dd.OP_EQ, dd.END_OF_LIST)
+        else:
+            self.terms = (dd.REG_PC, dd.NUMBER, addr, dd.OP_EQ, dd.REG_SP, dd.NUMBER, sp, dd.OP_EQ, dd.OP_LOGICAL_AND, dd.END_OF_LIST)
+        self.enable()
+
     def clear(self):
         c = self.debugger.debug_cmd[0]
         status = dd.BREAKPOINT_DISABLED if self.id == 0 else dd.BREAKPOINT_EMPTY
         c['breakpoint_type'][self.id] = dd.BREAKPOINT_CONDITIONAL
         c['breakpoint_status'][self.id] = status
         c['tokens'][self.index] = dd.END_OF_LIST
+        self.debugger.compile_breakpoints()
 
     def enable(self):
         c = self.debugger.debug_cmd[0]
         c['breakpoint_status'][self.id] = dd.BREAKPOINT_ENABLED
         if self.id >= c['num_breakpoints']:
             c['num_breakpoints'] = self.id + 1
+        self.debugger.compile_breakpoints()
 
     def disable(self):
         c = self.debugger.debug_cmd[0]
         c['breakpoint_status'][self.id] = dd.BREAKPOINT_DISABLED
+        self.debugger.compile_breakpoints()
 
 
 class Debugger(Serializable):
@@ -240,14 +318,21 @@ class Debugger(Serializable):
     serializable_computed = {'debug_cmd_raw'}
 
     def __init__(self):
-        self.debug_cmd_raw = np.zeros([dd.DEBUGGER_COMMANDS_DTYPE.itemsize], dtype=np.uint8)
-        self.debug_cmd = self.debug_cmd_raw.view(dtype=dd.DEBUGGER_COMMANDS_DTYPE)
+        self.init_debug_array(np.zeros([dd.DEBUGGER_COMMANDS_DTYPE.itemsize], dtype=np.uint8))
         self.clear_all_breakpoints()
 
+    def init_debug_array(self, debug_cmd_raw):
+        self.debug_cmd_raw = debug_cmd_raw
+        self.debug_cmd = self.debug_cmd_raw.view(dtype=dd.DEBUGGER_COMMANDS_DTYPE)
+
     ##### Serialization
 
     def restore_computed_attributes(self, state):
-        self.debug_cmd_raw[:] = state['debug_cmd_raw']
+        # saved states from before the compiled breakpoint index was added are
+        # shorter; the index is rebuilt anyway
+        raw = state['debug_cmd_raw']
+        self.debug_cmd_raw[:len(raw)] = raw
+        self.compile_breakpoints()
 
     def clear_all_breakpoints(self):
         c = self.debug_cmd[0]
@@ -256,6 +341,59 @@ class Debugger(Serializable):
         c['breakpoint_status'][0] = dd.BREAKPOINT_DISABLED
         c['num_breakpoints'] = 0
         c['last_pc'] = -1
+        c['watch_pending'] = 0
+        self.compile_breakpoints()
+
+    def compile_breakpoints(self):
+        """Rebuild the index the C code uses to check breakpoints quickly.
+
+        Must be called after anything changes the breakpoint definitions;
+        the Breakpoint methods do this automatically. Enabled conditional
+        breakpoints have their token lists validated, and any with errors are
+        marked with the error status instead of being evaluated. Simple
+        PC == address breakpoints and memory watch breakpoints are entered in
+        bitmaps so they cost a single bit test per instruction or memory
+        access, no matter how many there are.
+        """
+        c = self.debug_cmd[0]
+        address_ids = []
+        conditional_ids = []
+        watch_ids = []
+        bits = np.zeros(dd.MAIN_MEMORY_SIZE, dtype=np.bool_)
+        read_bits = np.zeros(dd.MAIN_MEMORY_SIZE, dtype=np.bool_)
+        write_bits = np.zeros(dd.MAIN_MEMORY_SIZE, dtype=np.bool_)
+        for i in range(c['num_breakpoints']):
+            if c['breakpoint_status'][i] != dd.BREAKPOINT_ENABLED:
+                continue
+            b = Breakpoint(self, i)
+            btype = c['breakpoint_type'][i]
+            if btype == dd.BREAKPOINT_READ_MEMORY or btype == dd.BREAKPOINT_WRITE_MEMORY:
+                watch_ids.append(i)
+                bitmap = read_bits if btype == dd.BREAKPOINT_READ_MEMORY else write_bits
+                bitmap[c['tokens'][b.index]] = True
+                continue
+            if btype != dd.BREAKPOINT_CONDITIONAL:
+                continue
+            status = check_tokens(c['tokens'][b.index:b.index + dd.TOKENS_PER_BREAKPOINT])
+            if status != dd.BREAKPOINT_ENABLED:
+                log.warning(f"breakpoint {i}: error {hex(status)} in {c['tokens'][b.index:b.index + dd.TOKENS_PER_BREAKPOINT]}")
+                c['breakpoint_status'][i] = status
+                continue
+            addr = b.address
+            if addr is None:
+                conditional_ids.append(i)
+            else:
+                address_ids.append(i)
+                bits[addr] = True
+        c['num_address_breakpoints'] = len(address_ids)
+        c['address_breakpoint_ids'][:len(address_ids)] = address_ids
+        c['num_conditional_breakpoints'] = len(conditional_ids)
+        c['conditional_breakpoint_ids'][:len(conditional_ids)] = conditional_ids
+        c['pc_bitmap'][:] = np.packbits(bits, bitorder='little')
+        c['num_watch_breakpoints'] = len(watch_ids)
+        c['watch_breakpoint_ids'][:len(watch_ids)] = watch_ids
+        c['read_bitmap'][:] = np.packbits(read_bits, bitorder='little')
+        c['write_bitmap'][:] = np.packbits(write_bits, bitorder='little')
 
     def create_breakpoint(self, addr=None):
         c = self.debug_cmd[0]
@@ -264,6 +402,11 @@ class Debugger(Serializable):
         c['num_breakpoints'] = max(c['num_breakpoints'], bpid + 1)
         return Breakpoint(self, bpid, addr)
 
+    def create_watchpoint(self, addr, write=False):
+        b = self.create_breakpoint()
+        b.watch_memory(addr, write)
+        return b
+
     def get_breakpoint(self, bpid):
         if bpid < 0:
             return None
@@ -273,6 +416,18 @@ class Debugger(Serializable):
         b = Breakpoint(self, 0)
         b.step_into(number)
 
+    def step_out(self, call_graph=None):
+        """Break when the current subroutine returns. With a `CallGraph`, the
+        break is at the return address of its innermost call; otherwise it
+        is at the next return instruction at the current stack depth.
+        """
+        b = Breakpoint(self, 0)
+        target = None if call_graph is None else call_graph.step_out_target()
+        if target is None:
+            b.break_at_return()
+        else:
+            b.break_at_return_to(*target)
+
     def break_vbi_start(self, number=1):
         b = Breakpoint(self, 0)
         b.break_vbi_start(number)
@@ -56,6 +56,20 @@ DEBUGGER_COMMANDS_DTYPE = np.dtype([
     ("breakpoint_type", np.uint8, NUM_BREAKPOINT_ENTRIES),
     ("breakpoint_status", np.uint8, NUM_BREAKPOINT_ENTRIES),
     ("tokens", np.uint16, TOKEN_LIST_SIZE),
+
+    # compiled by Debugger.compile_breakpoints
+    ("num_address_breakpoints", np.int32),
+    ("num_conditional_breakpoints", np.int32),
+    ("address_breakpoint_ids", np.uint8, NUM_BREAKPOINT_ENTRIES),
+    ("conditional_breakpoint_ids", np.uint8, NUM_BREAKPOINT_ENTRIES),
+    ("pc_bitmap", np.uint8, MAIN_MEMORY_SIZE // 8),
+    ("num_watch_breakpoints", np.int32),
+    ("watch_pending", np.int32),
+    ("watch_address", np.int32),
+    ("watch_access_type", np.int32),
+    ("watch_breakpoint_ids", np.uint8, NUM_BREAKPOINT_ENTRIES),
+    ("read_bitmap", np.uint8, MAIN_MEMORY_SIZE // 8),
+    ("write_bitmap", np.uint8, MAIN_MEMORY_SIZE // 8),
 ])
 
 # Breakpoints are address of PC to break at before executing code at that
@@ -95,6 +109,10 @@ BREAKPOINT_COUNT_CYCLES = 0x2
 BREAKPOINT_AT_RETURN = 0x3
 BREAKPOINT_COUNT_FRAMES = 0x4
 BREAKPOINT_INFINITE_LOOP = 0x5
+BREAKPOINT_BRK_INSTRUCTION = 0x6
+BREAKPOINT_PAUSE_AT_FRAME_START = 0x7
+BREAKPOINT_READ_MEMORY = 0x8  # address stored in first token
+BREAKPOINT_WRITE_MEMORY = 0x9
 
 
 # contitional breakpoint definitions
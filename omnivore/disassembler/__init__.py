@@ -23,6 +23,11 @@ except ModuleNotFoundError:
 except ImportError as e:
     log.warning(f"libudis C extension not loaded (likely an undefined symbol):\n{str(e)}")
 
+from .trace import HistoryTrace, TraceFile
+from .query import HistoryQuery
+from .callgraph import CallGraph
+from .profiler import ExecutionProfile
+
 
 
 def create_history_dtype(num_entries, history_dtype):
@@ -0,0 +1,278 @@
+"""Call graph reconstructed from CPU history entries
+
+A shadow stack follows JSR, RTS, RTI and interrupt start entries, building
+a calling context tree: one node for each distinct chain of calls from the
+top level, so the same subroutine called from two places has two nodes. The
+tree is stored as parallel numpy arrays indexed by node number, with node 0
+the top level (code that isn't inside any known call). Parents always have
+lower node numbers than their children.
+
+Cycles are charged to the node on top of the shadow stack when they are
+used, so time spent in calls that haven't returned yet (like a main loop)
+is included. The JSR and RTS instructions are charged to the subroutine
+they call or return from.
+"""
+import numpy as np
+
+from .dtypes import HISTORY_6502_DTYPE, HISTORY_FRAME_DTYPE
+from .flags import *
+from .query import instruction_types
+
+import logging
+log = logging.getLogger(__name__)
+
+
+interrupt_types = [DISASM_ATARI800_VBI_START, DISASM_ATARI800_DLI_START]
+
+# the 6502 stack only has room for 128 return addresses, so anything deeper
+# is the result of leaving subroutines without an RTS
+max_stack_depth = 128
+
+JSR = 0x20
+
+
+class StackEntry:
+    __slots__ = ['node', 'return_pc', 'sp', 'interrupt']
+
+    def __init__(self, node, return_pc, sp, interrupt):
+        self.node = node
+        self.return_pc = return_pc
+        self.sp = sp  # stack pointer after returning, or -1 if unknown
+        self.interrupt = interrupt
+
+
+class CallGraph:
+    """Incrementally built calling context tree.
+
+    Node arrays (only the first `num_nodes` elements are valid):
+
+    * `parent`: node number of the caller, -1 for the top level
+    * `address`: address of the subroutine or interrupt handler, -1 for the
+      top level
+    * `depth`: number of calls from the top level
+    * `calls`: number of times the node was entered
+    * `self_cycles`: cycles used by instructions while the node was on top
+      of the stack
+    * `recursive`: True if the address also appears in an ancestor
+
+    The cycles used by each node during each frame are kept for the most
+    recent `max_frames` frames.
+    """
+    max_frames = 600
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.num_nodes = 0
+        self.parent = np.zeros(0, dtype=np.int32)
+        self.address = np.zeros(0, dtype=np.int32)
+        self.depth = np.zeros(0, dtype=np.int32)
+        self.calls = np.zeros(0, dtype=np.int64)
+        self.self_cycles = np.zeros(0, dtype=np.int64)
+        self.recursive = np.zeros(0, dtype=bool)
+        self.children = {}
+        self.add_node(-1, -1)
+        self.stack = []
+        self.unresolved = None
+        self.total_cycles = 0
+        self.last_cycles = 0
+        self.frame_start_cycles = np.zeros(1, dtype=np.int64)
+        self.frame_cycles = {}
+
+    def __len__(self):
+        return self.num_nodes
+
+    # tree
+
+    def grow(self):
+        size = max(64, 2 * len(self.parent))
+        for name in ['parent', 'address', 'depth', 'calls', 'self_cycles', 'recursive']:
+            old = getattr(self, name)
+            new = np.zeros(size, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add_node(self, parent, address):
+        node = self.num_nodes
+        if node >= len(self.parent):
+            self.grow()
+        self.parent[node] = parent
+        self.address[node] = address
+        if parent >= 0:
+            self.depth[node] = self.depth[parent] + 1
+            self.recursive[node] = address in self.path_addresses(parent)
+        self.num_nodes += 1
+        self.children[(parent, address)] = node
+        return node
+
+    def child(self, parent, address):
+        try:
+            return self.children[(parent, address)]
+        except KeyError:
+            return self.add_node(parent, address)
+
+    def path(self, node):
+        """List of nodes from the first call below the top level to `node`"""
+        nodes = []
+        while node > 0:
+            nodes.append(node)
+            node = self.parent[node]
+        return nodes[::-1]
+
+    def path_addresses(self, node):
+        return [int(self.address[n]) for n in self.path(node)]
+
+    def calc_inclusive(self, self_cycles=None):
+        """Return the cycles used by each node including all the nodes below
+        it, from `self_cycles` or the session totals if not specified.
+        """
+        n = self.num_nodes
+        if self_cycles is None:
+            self_cycles = self.self_cycles[:n]
+        inclusive = np.array(self_cycles[:n], dtype=np.int64)
+        depth = self.depth[:n]
+        parent = self.parent[:n]
+        for d in range(int(depth.max()), 0, -1):
+            nodes = np.flatnonzero(depth == d)
+            np.add.at(inclusive, parent[nodes], inclusive[nodes])
+        return inclusive
+
+    # shadow stack
+
+    @property
+    def current_node(self):
+        return self.stack[-1].node if self.stack else 0
+
+    def push(self, address, return_pc, sp, interrupt):
+        if len(self.stack) >= max_stack_depth:
+            self.stack.pop(0)
+        node = self.child(self.current_node, address)
+        self.calls[node] += 1
+        self.stack.append(StackEntry(node, return_pc, sp, interrupt))
+
+    def charge(self, cycles):
+        self.self_cycles[self.current_node] += cycles - self.last_cycles
+        self.last_cycles = cycles
+
+    def add_entries(self, chunks):
+        """Follow a list of history entry arrays in time order"""
+        for chunk in chunks:
+            self.add_chunk(chunk.view(HISTORY_6502_DTYPE))
+
+    def add_chunk(self, h):
+        types = h['disassembler_type']
+        is_instruction = np.isin(types, instruction_types)
+        rows = np.flatnonzero(is_instruction)
+        if self.unresolved is not None and len(rows):
+            return_pc, sp = self.unresolved
+            self.push(int(h['pc'][rows[0]]), return_pc, sp, True)
+            self.unresolved = None
+
+        cycles = np.where(is_instruction, h['cycles'], 0)
+        end_cycles = self.total_cycles + np.cumsum(cycles, dtype=np.int64)
+        start_cycles = end_cycles - cycles
+        if len(end_cycles):
+            self.total_cycles = int(end_cycles[-1])
+
+        opcode = h['instruction'][:, 0]
+        masked = h['flag'] & FLAG_RESULT_MASK
+        is_call = is_instruction & (opcode == JSR)
+        is_return = is_instruction & ((masked == FLAG_RTS) | (masked == FLAG_RTI))
+        is_interrupt = np.isin(types, interrupt_types)
+        is_frame_end = types == DISASM_FRAME_END
+        events = np.flatnonzero(is_call | is_return | is_interrupt | is_frame_end)
+        for row in events.tolist():
+            if is_call[row]:
+                self.charge(int(start_cycles[row]))
+                e = h[row]
+                address = int(e['instruction'][1]) | (int(e['instruction'][2]) << 8)
+                self.push(address, (int(e['pc']) + 3) & 0xffff, int(e['sp']), False)
+            elif is_interrupt[row]:
+                # the handler starts at the next instruction, which may not be
+                # in this chunk yet
+                self.charge(int(start_cycles[row]))
+                return_pc = int(h['pc'][row])
+                following = np.searchsorted(rows, row)
+                if following < len(rows):
+                    self.push(int(h['pc'][rows[following]]), return_pc, -1, True)
+                else:
+                    self.unresolved = (return_pc, -1)
+            elif is_frame_end[row]:
+                self.charge(int(start_cycles[row]))
+                self.end_frame(int(h[row:row + 1].view(HISTORY_FRAME_DTYPE)['frame_number'][0]))
+            elif masked[row] == FLAG_RTS:
+                if self.stack and not self.stack[-1].interrupt:
+                    self.charge(int(end_cycles[row]))
+                    self.stack.pop()
+            else:
+                # RTI also leaves any subroutines exited without an RTS
+                if any(s.interrupt for s in self.stack):
+                    self.charge(int(end_cycles[row]))
+                    while not self.stack.pop().interrupt:
+                        pass
+        self.charge(self.total_cycles)
+
+    # frames
+
+    def end_frame(self, frame_number):
+        n = self.num_nodes
+        start = np.zeros(n, dtype=np.int64)
+        start[:len(self.frame_start_cycles)] = self.frame_start_cycles
+        used = self.self_cycles[:n] - start
+        nodes = np.flatnonzero(used).astype(np.int32)
+        self.frame_cycles[frame_number] = (nodes, used[nodes])
+        if len(self.frame_cycles) > self.max_frames:
+            del self.frame_cycles[next(iter(self.frame_cycles))]
+        self.frame_start_cycles = self.self_cycles[:n].copy()
+
+    def get_frame_self_cycles(self, frame_number):
+        """Return the cycles used by each node during the frame as an array
+        indexed by node, or None if the frame isn't available.
+        """
+        try:
+            nodes, used = self.frame_cycles[frame_number]
+        except KeyError:
+            return None
+        self_cycles = np.zeros(self.num_nodes, dtype=np.int64)
+        self_cycles[nodes] = used
+        return self_cycles
+
+    # output
+
+    def node_name(self, node, labels=None):
+        address = int(self.address[node])
+        if address < 0:
+            return "top"
+        if labels is not None and address in labels:
+            return labels[address]
+        return f"${address:04x}"
+
+    def calc_folded_stacks(self, frame_number=None, labels=None):
+        """Return a list of lines in the folded stack format read by flame
+        graph tools: the names of the calls from the top level separated by
+        semicolons, a space, and the cycles used by the last call in the
+        chain. Covers the whole session, or a single frame if
+        `frame_number` is given.
+        """
+        if frame_number is None:
+            self_cycles = self.self_cycles[:self.num_nodes]
+        else:
+            self_cycles = self.get_frame_self_cycles(frame_number)
+            if self_cycles is None:
+                return []
+        lines = []
+        for node in np.flatnonzero(self_cycles).tolist():
+            names = [self.node_name(0, labels)] + [self.node_name(n, labels) for n in self.path(node)]
+            lines.append(f"{';'.join(names)} {self_cycles[node]}")
+        return lines
+
+    def step_out_target(self):
+        """Return a tuple of the PC and stack pointer where the innermost
+        call will return, or None if there is no known call. The stack
+        pointer is -1 if it isn't known (after an interrupt).
+        """
+        if not self.stack:
+            return None
+        s = self.stack[-1]
+        return s.return_pc, s.sp
@@ -95,3 +95,11 @@ EMULATOR_HISTORY_HEADER_DTYPE = np.dtype([
     ("latest_entry_index", np.int32),
     ("cumulative_count", np.uint32),
 ])
+
+LABEL_INFO_DTYPE = np.dtype([
+    ("text_start_index", np.uint32),
+    ("line_length", np.int8),
+    ("num_bytes", np.int8),
+    ("item_count", np.int8),
+    ("type_code", np.int8),
+])
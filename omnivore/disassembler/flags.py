@@ -31,6 +31,7 @@ FLAG_RTS = 18
 FLAG_STORE_A_IN_MEMORY = 19
 FLAG_STORE_X_IN_MEMORY = 20
 FLAG_STORE_Y_IN_MEMORY = 21
+FLAG_RESULT_MASK = 0x3f
 FLAG_TARGET_ADDR = 64
 FLAG_REG_SR = 128
 
@@ -0,0 +1,107 @@
+"""Execution profile folded from CPU history entries
+
+Instruction counts and cycle totals per address are accumulated with
+`np.bincount` over each batch of history entries. Subroutine times come
+from a `CallGraph` built from the same entries, summed over all the call
+chains that reach each subroutine.
+"""
+import numpy as np
+
+from .dtypes import HISTORY_6502_DTYPE
+from .query import instruction_types
+from .callgraph import CallGraph
+from .trace import HistoryCursor
+
+import logging
+log = logging.getLogger(__name__)
+
+
+MAIN_MEMORY_SIZE = 1<<16
+
+
+def sum_by_address(addresses, values):
+    totals = np.zeros(MAIN_MEMORY_SIZE, dtype=np.uint64)
+    np.add.at(totals, addresses, values.astype(np.uint64))
+    return totals
+
+
+class ExecutionProfile:
+    """Per-address execution statistics.
+
+    All arrays have one element for each address in the 64K address space:
+
+    * `hits`: number of instructions executed at the address
+    * `cycles`: total cycles of the instructions executed at the address
+    * `calls`: number of calls to a subroutine (or interrupt handler)
+      starting at the address
+    * `inclusive`: total cycles spent in calls to the subroutine, including
+      the subroutines it calls. Recursive calls are only counted once.
+    * `exclusive`: cycles spent in the subroutine itself
+
+    If created with a `HistoryStorage`, `update` folds in the entries added
+    to the ring since the last update.
+    """
+    def __init__(self, history=None):
+        self.cursor = None if history is None else HistoryCursor(history)
+        self.clear()
+
+    def clear(self):
+        self.hits = np.zeros(MAIN_MEMORY_SIZE, dtype=np.uint64)
+        self.cycles = np.zeros(MAIN_MEMORY_SIZE, dtype=np.uint64)
+        self.call_graph = CallGraph()
+
+    def update(self, num_frames=1):
+        _, chunks = self.cursor.advance(num_frames)
+        self.add_entries(chunks)
+
+    @property
+    def max_frames_per_update(self):
+        return self.cursor.max_frames_per_advance
+
+    def add_entries(self, chunks):
+        """Fold in a list of history entry arrays in time order"""
+        for chunk in chunks:
+            h = chunk.view(HISTORY_6502_DTYPE)
+            rows = np.flatnonzero(np.isin(h['disassembler_type'], instruction_types))
+            pc = h['pc'][rows]
+            self.hits += np.bincount(pc, minlength=MAIN_MEMORY_SIZE).astype(np.uint64)
+            self.cycles += np.bincount(pc, weights=h['cycles'][rows], minlength=MAIN_MEMORY_SIZE).astype(np.uint64)
+        self.call_graph.add_entries(chunks)
+
+    @property
+    def calls(self):
+        g = self.call_graph
+        return sum_by_address(g.address[1:len(g)], g.calls[1:len(g)])
+
+    @property
+    def exclusive(self):
+        g = self.call_graph
+        return sum_by_address(g.address[1:len(g)], g.self_cycles[1:len(g)])
+
+    @property
+    def inclusive(self):
+        g = self.call_graph
+        inclusive = g.calc_inclusive()
+        outermost = np.flatnonzero(~g.recursive[:len(g)])[1:]
+        return sum_by_address(g.address[outermost], inclusive[outermost])
+
+    def calc_heat_map(self, out=None):
+        """Return the cycles per address scaled logarithmically to 0 - 255,
+        optionally into the uint8 array `out`.
+        """
+        if out is None:
+            out = np.empty(MAIN_MEMORY_SIZE, dtype=np.uint8)
+        scaled = np.log2(self.cycles.astype(np.float64) + 1.0)
+        peak = scaled.max()
+        if peak > 0:
+            scaled *= 255.0 / peak
+        out[:] = scaled
+        return out
+
+    def hot_spots(self, count=20, by="cycles"):
+        """Return addresses with the highest totals in the named array, in
+        decreasing order, skipping any with a zero total.
+        """
+        values = getattr(self, by)
+        order = np.argsort(values, kind="stable")[::-1][:count]
+        return order[values[order] > 0]
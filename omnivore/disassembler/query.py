@@ -0,0 +1,171 @@
+"""Vectorized searches through CPU history entries
+
+A `HistoryQuery` operates on a list of history entry arrays in time order,
+as returned by `HistoryStorage.ordered_views`, so the ring is searched in
+place without copying at the wraparound point. Each search is a numpy
+expression over the whole list, and results are returned as arrays of row
+numbers (counted from the oldest entry, the same numbering used by
+`HistoryStorage.__getitem__` and the instruction history viewer) or as
+boolean masks with one element per row.
+
+The register and memory fields are interpreted using `HISTORY_6502_DTYPE`,
+which shares its layout with `HISTORY_ATARI800_DTYPE` for everything but
+the final two bytes.
+"""
+import numpy as np
+
+from .dtypes import HISTORY_6502_DTYPE, HISTORY_FRAME_DTYPE
+from .flags import *
+
+import logging
+log = logging.getLogger(__name__)
+
+
+instruction_types = [DISASM_6502_HISTORY, DISASM_ATARI800_HISTORY]
+
+write_flags = [FLAG_STORE_A_IN_MEMORY, FLAG_STORE_X_IN_MEMORY, FLAG_STORE_Y_IN_MEMORY, FLAG_MEMORY_ALTER]
+
+read_flags = [FLAG_LOAD_A_FROM_MEMORY, FLAG_LOAD_X_FROM_MEMORY, FLAG_LOAD_Y_FROM_MEMORY, FLAG_MEMORY_READ_ALTER_A, FLAG_PEEK_MEMORY, FLAG_MEMORY_ALTER]
+
+
+class HistoryQuery:
+    """Search history entries given as a list of arrays in time order.
+
+    Methods in the masks section return boolean masks that can be combined
+    with the usual numpy operators and converted to row numbers with
+    `rows`.
+    """
+    def __init__(self, chunks, first_row=0):
+        self.chunks = [c.view(HISTORY_6502_DTYPE) for c in chunks]
+        self.first_row = first_row
+        self.num_rows = sum(len(c) for c in self.chunks)
+
+    @classmethod
+    def from_history(cls, history, start=0, stop=None):
+        """Search the entries in a `HistoryStorage` ring from row `start` to
+        row `stop`."""
+        start = slice(start, stop).indices(len(history))[0]
+        return cls(history.ordered_views(start, stop), start)
+
+    def __len__(self):
+        return self.num_rows
+
+    def field(self, name):
+        """Return a single field as an array with one element per row"""
+        if not self.chunks:
+            return np.zeros(0, dtype=HISTORY_6502_DTYPE[name])
+        return np.concatenate([c[name] for c in self.chunks])
+
+    def mask(self, func):
+        """Apply `func` to each chunk of entries, returning the concatenated
+        boolean mask."""
+        if not self.chunks:
+            return np.zeros(0, dtype=bool)
+        return np.concatenate([func(c) for c in self.chunks])
+
+    def rows(self, mask):
+        """Convert a mask into an array of row numbers"""
+        return np.flatnonzero(mask) + self.first_row
+
+    def entries(self, rows):
+        """Return a copy of the entries at the given row numbers"""
+        rows = np.asarray(rows) - self.first_row
+        found = np.zeros(len(rows), dtype=HISTORY_6502_DTYPE)
+        start = 0
+        for c in self.chunks:
+            stop = start + len(c)
+            in_chunk = (rows >= start) & (rows < stop)
+            found[in_chunk] = c[rows[in_chunk] - start]
+            start = stop
+        return found
+
+    # masks
+
+    def is_type(self, *types):
+        return self.mask(lambda c: np.isin(c['disassembler_type'], types))
+
+    def is_instruction(self):
+        return self.is_type(*instruction_types)
+
+    def pc_in_range(self, first, last=None):
+        """Instructions with first <= pc <= last"""
+        if last is None:
+            last = first
+        return self.mask(lambda c: (c['pc'] >= first) & (c['pc'] <= last) & np.isin(c['disassembler_type'], instruction_types))
+
+    def target_in_range(self, first, last, flags):
+        return self.mask(lambda c: (c['target_addr'] >= first) & (c['target_addr'] <= last) & np.isin(c['flag'] & FLAG_RESULT_MASK, flags) & np.isin(c['disassembler_type'], instruction_types))
+
+    def writes_to(self, first, last=None):
+        """Store and read-modify-write instructions that changed memory in
+        the range first <= address <= last"""
+        if last is None:
+            last = first
+        return self.target_in_range(first, last, write_flags)
+
+    def reads_from(self, first, last=None):
+        """Load, compare and read-modify-write instructions that read memory
+        in the range first <= address <= last"""
+        if last is None:
+            last = first
+        return self.target_in_range(first, last, read_flags)
+
+    def register_changed(self, register):
+        """Instructions that changed `register` (one of 'a', 'x', 'y', 'sp'
+        or 'sr'), found by comparing the register value recorded before
+        each instruction with that before the next instruction.
+        """
+        is_instruction = self.mask(lambda c: np.isin(c['disassembler_type'], instruction_types + [DISASM_NEXT_INSTRUCTION]))
+        rows = np.flatnonzero(is_instruction)
+        values = self.field(register)[rows]
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[rows[:-1][values[1:] != values[:-1]]] = True
+        return mask
+
+    # frames and interrupts
+
+    def frame_ends(self):
+        """Return the rows of the end of frame markers and their frame
+        numbers as a tuple of arrays"""
+        mask = self.is_type(DISASM_FRAME_END)
+        rows = np.flatnonzero(mask)
+        if self.chunks:
+            frames = np.concatenate([c.view(HISTORY_FRAME_DTYPE)['frame_number'] for c in self.chunks])[rows]
+        else:
+            frames = np.zeros(0, dtype=np.uint32)
+        return rows + self.first_row, frames
+
+    def cumulative_cycles(self):
+        """Total CPU cycles of all instructions up to and including each
+        row"""
+        cycles = np.where(self.is_instruction(), self.field('cycles'), 0)
+        return np.cumsum(cycles, dtype=np.int64)
+
+    def interrupt_cycles(self, start_type=DISASM_ATARI800_VBI_START, end_type=DISASM_ATARI800_VBI_END):
+        """Return the start rows of each complete interrupt and the number
+        of cycles used by the instructions in it (not including the 7 cycles
+        for the 6502 to begin the interrupt) as a tuple of arrays.
+
+        Interrupts are matched by pairing each start marker with the first
+        end marker that follows it, so DLIs within a VBI are included in the
+        VBI's time.
+        """
+        types = self.field('disassembler_type')
+        starts = np.flatnonzero(types == start_type)
+        ends = np.flatnonzero(types == end_type)
+        following = np.searchsorted(ends, starts)
+        complete = following < len(ends)
+        starts = starts[complete]
+        ends = ends[following[complete]]
+        total = self.cumulative_cycles()
+        return starts + self.first_row, total[ends] - total[starts]
+
+    def frames_with_long_vbi(self, min_cycles):
+        """Return the frame numbers whose VBI used more than `min_cycles`
+        cycles. The VBI belongs to the first frame that ends after it
+        starts."""
+        starts, cycles = self.interrupt_cycles()
+        rows, frames = self.frame_ends()
+        long = starts[cycles > min_cycles]
+        following = np.searchsorted(rows, long)
+        return frames[following[following < len(rows)]]
@@ -0,0 +1,81 @@
+"""Cache of stringified history entries
+
+Formatting history entries as text is the most expensive part of drawing
+the instruction history, but most of the rows visible after a repaint were
+visible before it. Entries are cached by an id that doesn't change as new
+entries are added (see `EmulatorBase.calc_cpu_history_entry_id`), so only
+rows that scroll into view or are new need to be formatted.
+"""
+from collections import OrderedDict
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class StringifiedHistoryCache:
+    """LRU cache of the (instruction, result) text of history entries,
+    keyed by entry id.
+
+    The cache is cleared whenever the `generation` passed to `get` changes,
+    which the emulator uses to signal that ids have been renumbered or that
+    the labels used in formatting have changed.
+    """
+    def __init__(self, max_rows=4096):
+        self.max_rows = max_rows
+        self.rows = OrderedDict()
+        self.generation = None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def clear(self):
+        self.rows.clear()
+
+    def get(self, generation, first_id, count, stringify, num_volatile=0):
+        """Return a list of the text for `count` consecutive rows, starting
+        with the row having id `first_id`.
+
+        Rows not in the cache are formatted by `stringify(offset, num)`,
+        which must return a sequence of `num` (instruction, result) tuples
+        starting `offset` rows from the first. Rows are requested in runs so
+        that a single call covers each gap in the cache. The last
+        `num_volatile` rows are always reformatted because they can still
+        change, e.g. the entry showing the next instruction to execute.
+        """
+        if generation != self.generation:
+            self.rows.clear()
+            self.generation = generation
+        rows = self.rows
+        text = [None] * count
+        stable = count - num_volatile
+        missing_start = None
+        for offset in range(count + 1):
+            if offset < stable:
+                try:
+                    text[offset] = rows[first_id + offset]
+                    rows.move_to_end(first_id + offset)
+                except KeyError:
+                    if missing_start is None:
+                        missing_start = offset
+                    continue
+            elif offset < count:
+                if missing_start is None:
+                    missing_start = offset
+                continue
+            if missing_start is not None:
+                self.fill(text, first_id, missing_start, offset, stringify, stable)
+                missing_start = None
+        while len(rows) > self.max_rows:
+            rows.popitem(last=False)
+        while text and text[-1] is None:
+            # past the end of the history
+            text.pop()
+        return text
+
+    def fill(self, text, first_id, start, stop, stringify, stable):
+        parsed = stringify(start, stop - start)
+        for offset, line in enumerate(parsed, start):
+            line = tuple(line)
+            text[offset] = line
+            if offset < stable:
+                self.rows[first_id + offset] = line
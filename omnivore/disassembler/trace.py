@@ -0,0 +1,374 @@
+"""Full session CPU history traces
+
+The `HistoryStorage` ring only holds the most recent instructions. A
+`HistoryTrace` copies each batch of new entries out of the ring before they
+can be overwritten and appends them to a `TraceFile`, so the entire session
+can be scrolled in the instruction history viewer while only the ring and a
+few decompressed segments are held in memory.
+
+The trace file is append-only::
+
+    magic (8 bytes)
+    segment header, zlib compressed entries
+    segment header, zlib compressed entries
+    ...
+
+Each segment header records the number of entries, the compressed size, the
+cumulative instruction count of the first entry (from the ring's
+`cumulative_count`) and the range of frame numbers ended within the
+segment. The segment index is rebuilt on open by hopping from header to
+header, and an incomplete segment left at the end of the file by a crash is
+discarded.
+"""
+import os
+import zlib
+import struct
+from bisect import bisect_right
+from collections import OrderedDict
+
+import numpy as np
+
+from .dtypes import HISTORY_ENTRY_DTYPE, HISTORY_FRAME_DTYPE
+from .flags import DISASM_FRAME_END, DISASM_NEXT_INSTRUCTION
+
+import logging
+log = logging.getLogger(__name__)
+
+
+magic = b"OMNITRC\x00"
+segment_magic = b"SEG\x00"
+segment_header = struct.Struct("<4sIIQqq")
+
+INDEX_DTYPE = np.dtype([
+    ("offset", np.int64),  # file position of the compressed data
+    ("nbytes", np.int64),
+    ("first_row", np.int64),
+    ("count", np.int64),
+    ("first_index", np.int64),  # cumulative instruction count
+    ("first_frame", np.int64),  # -1 if no frame ends in the segment
+    ("last_frame", np.int64),
+])
+
+
+class TraceFile:
+    """Append-only, compressed, memory mapped file of history entries.
+
+    Rows are numbered consecutively from the first entry in the file.
+    """
+    compress_level = 1
+
+    max_cached_segments = 8
+
+    def __init__(self, path):
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.fh = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self.fh.write(magic)
+            self.fh.flush()
+        self.data = None
+        self.cache = OrderedDict()
+        self.scan()
+
+    def __str__(self):
+        return f"TraceFile: {self.path}, {self.num_rows} entries in {len(self.index)} segments"
+
+    def __len__(self):
+        return self.num_rows
+
+    def scan(self):
+        self.remap()
+        if bytes(self.data[:len(magic)]) != magic:
+            raise ValueError(f"{self.path} is not a trace file")
+        segments = []
+        offset = len(magic)
+        size = len(self.data)
+        row = 0
+        while offset + segment_header.size <= size:
+            tag, count, nbytes, first_index, first_frame, last_frame = segment_header.unpack(bytes(self.data[offset:offset + segment_header.size]))
+            data_offset = offset + segment_header.size
+            if tag != segment_magic or data_offset + nbytes > size:
+                break
+            segments.append((data_offset, nbytes, row, count, first_index, first_frame, last_frame))
+            row += count
+            offset = data_offset + nbytes
+        if offset < size:
+            log.warning(f"{self.path}: discarding {size - offset} bytes of incomplete trace data")
+            self.fh.truncate(offset)
+        self.fh.seek(offset)
+        self.end_offset = offset
+        self.index = np.array(segments, dtype=INDEX_DTYPE)
+        self.segment_rows = self.index['first_row'].tolist()
+        self.num_rows = row
+
+    def remap(self):
+        self.fh.flush()
+        self.data = np.memmap(self.fh, dtype=np.uint8, mode="r")
+
+    def close(self):
+        self.data = None
+        self.cache.clear()
+        self.fh.close()
+
+    @property
+    def next_index(self):
+        """Cumulative instruction count following the last entry"""
+        if len(self.index) == 0:
+            return 0
+        last = self.index[-1]
+        return int(last['first_index'] + last['count'])
+
+    def append(self, chunks, first_index):
+        """Append a segment made from the history entry arrays in `chunks`,
+        the first of which has the cumulative instruction count
+        `first_index`.
+        """
+        count = 0
+        frames = []
+        compressor = zlib.compressobj(self.compress_level)
+        compressed = []
+        for chunk in chunks:
+            count += len(chunk)
+            ends = chunk[chunk['disassembler_type'] == DISASM_FRAME_END]
+            if len(ends):
+                frames.append(ends.view(HISTORY_FRAME_DTYPE)['frame_number'])
+            compressed.append(compressor.compress(np.ascontiguousarray(chunk)))
+        if count == 0:
+            return
+        compressed.append(compressor.flush())
+        payload = b"".join(compressed)
+        if frames:
+            frames = np.concatenate(frames)
+            first_frame, last_frame = int(frames.min()), int(frames.max())
+        else:
+            first_frame = last_frame = -1
+        self.fh.seek(self.end_offset)
+        self.fh.write(segment_header.pack(segment_magic, count, len(payload), first_index, first_frame, last_frame))
+        self.fh.write(payload)
+        data_offset = self.end_offset + segment_header.size
+        self.end_offset = data_offset + len(payload)
+        entry = np.array([(data_offset, len(payload), self.num_rows, count, first_index, first_frame, last_frame)], dtype=INDEX_DTYPE)
+        self.index = np.append(self.index, entry)
+        self.segment_rows.append(self.num_rows)
+        self.num_rows += count
+
+    def get_segment(self, segment):
+        try:
+            entries = self.cache.pop(segment)
+        except KeyError:
+            s = self.index[segment]
+            offset = int(s['offset'])
+            end = offset + int(s['nbytes'])
+            if end > len(self.data):
+                self.remap()
+            raw = zlib.decompress(self.data[offset:end])
+            entries = np.frombuffer(raw, dtype=HISTORY_ENTRY_DTYPE)
+            if len(self.cache) >= self.max_cached_segments:
+                self.cache.popitem(last=False)
+        self.cache[segment] = entries
+        return entries
+
+    def find_segment(self, row):
+        return bisect_right(self.segment_rows, row) - 1
+
+    def get_entries(self, start, stop):
+        """Return a copy of the entries in rows `start` to `stop`"""
+        start = max(0, start)
+        stop = min(stop, self.num_rows)
+        if stop <= start:
+            return np.zeros(0, dtype=HISTORY_ENTRY_DTYPE)
+        segment = self.find_segment(start)
+        chunks = []
+        row = start
+        while row < stop:
+            entries = self.get_segment(segment)
+            first = self.segment_rows[segment]
+            chunks.append(entries[row - first:stop - first])
+            row = first + len(entries)
+            segment += 1
+        return np.concatenate(chunks)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.num_rows
+        if row < 0 or row >= self.num_rows:
+            raise IndexError(f"trace row {row} out of range")
+        segment = self.find_segment(row)
+        return self.get_segment(segment)[row - self.segment_rows[segment]]
+
+    def find_cumulative_index(self, index):
+        """Return the row holding the entry with cumulative instruction count
+        `index`, or -1 if it isn't in the trace.
+        """
+        first = self.index['first_index']
+        found = np.nonzero((first <= index) & (index < first + self.index['count']))[0]
+        if len(found) == 0:
+            return -1
+        s = self.index[found[-1]]
+        return int(s['first_row'] + index - s['first_index'])
+
+    def find_frame_end(self, frame_number):
+        """Return the row of the most recent entry marking the end of frame
+        `frame_number`, or -1 if it isn't in the trace. Frame numbers aren't
+        necessarily increasing through the file, as restoring an earlier save
+        state restarts the frame count.
+        """
+        found = np.nonzero((self.index['first_frame'] <= frame_number) & (frame_number <= self.index['last_frame']))[0]
+        for segment in found[::-1]:
+            entries = self.get_segment(segment)
+            frames = entries.view(HISTORY_FRAME_DTYPE)
+            rows = np.nonzero((entries['disassembler_type'] == DISASM_FRAME_END) & (frames['frame_number'] == frame_number))[0]
+            if len(rows):
+                return self.segment_rows[segment] + int(rows[-1])
+        return -1
+
+    def find_frame(self, frame_number):
+        """Return the range of rows covering frame `frame_number` as a tuple
+        (start, stop), where the last row is the frame end marker. Returns
+        None if the end of the frame isn't in the trace.
+        """
+        stop = self.find_frame_end(frame_number)
+        if stop < 0:
+            return None
+        start = 0
+        if frame_number > 0:
+            previous = self.find_frame_end(frame_number - 1)
+            if 0 <= previous < stop:
+                start = previous + 1
+        return start, stop + 1
+
+
+class HistoryCursor:
+    """Follow a `HistoryStorage` ring, returning the entries added since the
+    previous call to `advance`.
+
+    `advance` must be called often enough that the ring doesn't wrap between
+    calls; any entries overwritten before being seen are skipped with a
+    warning. The trailing DISASM_NEXT_INSTRUCTION entry is always left for
+    the next call because the low level emulator reuses it for the next
+    instruction.
+
+    Entries are identified by their cumulative index, counted from
+    `first_index` for the oldest entry in the ring when the cursor is
+    created.
+    """
+    def __init__(self, history, first_index=0):
+        self.history = history
+        self.last_count = history.cumulative_count
+        self.total_count = first_index + len(history)
+        self.processed_count = first_index
+        self.max_entries_per_frame = 0
+
+    @property
+    def num_pending(self):
+        return self.total_count - self.processed_count
+
+    def update_count(self):
+        # cumulative_count is only 32 bits in the ring header
+        count = self.history.cumulative_count
+        self.total_count += (count - self.last_count) & 0xffffffff
+        self.last_count = count
+
+    def advance(self, num_frames=1):
+        """Return a tuple of the cumulative index of the first new entry and
+        a list of views of the new entries in order.
+
+        `num_frames` is the number of frames run since the last call, used
+        to estimate how many frames can be run before the ring wraps.
+        """
+        self.update_count()
+        history = self.history
+        num_entries = len(history)
+        ring_start = self.total_count - num_entries
+        start = self.processed_count
+        stop = self.total_count
+        if num_entries > 0 and history[num_entries - 1]['disassembler_type'] == DISASM_NEXT_INSTRUCTION:
+            stop -= 1
+        if start < ring_start:
+            log.warning(f"CPU history ring overflowed; {ring_start - start} entries skipped")
+            start = ring_start
+        if stop <= start:
+            return start, []
+        if num_frames > 0:
+            self.max_entries_per_frame = max(self.max_entries_per_frame, (stop - self.processed_count) // num_frames)
+        self.processed_count = stop
+        return start, history.ordered_views(start - ring_start, stop - ring_start)
+
+    @property
+    def max_frames_per_advance(self):
+        """Number of frames that can safely be run before calling `advance`"""
+        if self.max_entries_per_frame == 0:
+            return 1
+        # leave half the ring free for frames longer than any seen so far
+        return max(1, self.history.num_allocated_entries // 2 // self.max_entries_per_frame)
+
+
+class HistoryTrace(HistoryCursor):
+    """Spill entries from a `HistoryStorage` ring into a `TraceFile`.
+
+    Rows are numbered across the whole session: those in the trace file
+    followed by any entries that are still only in the ring.
+    """
+    def __init__(self, path, history):
+        self.trace = TraceFile(path)
+        HistoryCursor.__init__(self, history, self.trace.next_index)
+        self.scratch = None
+        self.scratch_output = None
+
+    def __len__(self):
+        self.update_count()
+        return self.trace.num_rows + self.num_pending
+
+    def close(self):
+        self.spill()
+        self.trace.close()
+
+    def spill(self, num_frames=1):
+        """Append all new entries in the ring to the trace file"""
+        first_index, chunks = self.advance(num_frames)
+        if chunks:
+            self.trace.append(chunks, first_index)
+
+    def ordered_views(self, start=0, stop=None):
+        """Return the entries in rows `start` to `stop` as a list of arrays
+        in time order, the same as `HistoryStorage.ordered_views`. Segments
+        from the trace file are decompressed, but entries still in the ring
+        are returned as views.
+        """
+        self.update_count()
+        start, stop, _ = slice(start, stop).indices(len(self))
+        num_spilled = self.trace.num_rows
+        chunks = []
+        row = start
+        while row < min(stop, num_spilled):
+            segment = self.trace.find_segment(row)
+            first = self.trace.segment_rows[segment]
+            entries = self.trace.get_segment(segment)
+            chunks.append(entries[row - first:stop - first])
+            row = first + len(entries)
+        if stop > num_spilled:
+            ring_start = self.total_count - len(self.history)
+            offset = self.processed_count - ring_start - num_spilled
+            chunks.extend(self.history.ordered_views(max(start, num_spilled) + offset, stop + offset))
+        return chunks
+
+    def get_entries(self, start, stop):
+        """Return a copy of the entries in rows `start` to `stop`"""
+        chunks = self.ordered_views(start, stop)
+        if not chunks:
+            return np.zeros(0, dtype=HISTORY_ENTRY_DTYPE)
+        return np.concatenate(chunks)
+
+    def __getitem__(self, row):
+        entries = self.get_entries(row, row + 1)
+        if len(entries) == 0:
+            raise IndexError(f"history row {row} out of range")
+        return entries[0]
+
+    def stringify(self, start, count, labels=None):
+        entries = self.get_entries(start, start + count)
+        if self.scratch is None or self.scratch.num_allocated_entries < max(count, 1):
+            self.scratch = self.history.__class__(max(count, 1))
+        self.scratch.load_entries(entries)
+        self.scratch_output = self.scratch.stringify(0, len(entries), labels, output=self.scratch_output)
+        return self.scratch_output
@@ -0,0 +1,133 @@
+"""Background disassembly
+
+A full disassembly of a large segment can take long enough to make the user
+interface stutter, so viewers run it on a worker thread and keep showing the
+previous result until the new one is ready. The parser releases the GIL, so
+the user interface stays responsive while it runs.
+"""
+import threading
+
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class SegmentSnapshot:
+    """Copy of the parts of a segment used by `DisassemblyConfig.parse`, so
+    the segment can keep changing while the copy is being parsed on another
+    thread.
+    """
+    def __init__(self, segment, user_bit_mask=0x7):
+        self.segment = segment
+        self.origin = segment.origin
+        self.user_bit_mask = user_bit_mask
+        self.data = np.frombuffer(bytearray(segment.data.tobytes()), dtype=np.uint8)
+        self.style = segment.get_comment_locations(user=user_bit_mask)
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_comment_locations(self, user):
+        if user != self.user_bit_mask:
+            raise ValueError(f"snapshot only has comment locations for user bit mask {self.user_bit_mask}")
+        return self.style
+
+
+class DisassemblyWorker:
+    """Runs jobs one at a time on a daemon thread.
+
+    Only the most recently submitted job matters: submitting a job replaces
+    any job that hasn't started yet, and the result of a job is discarded if
+    another job was submitted or `cancel` was called while it was running.
+    Results are passed to the callback through `deliver(func, *args)`, which
+    for a GUI should be something like `wx.CallAfter` so the callback runs
+    on the main thread.
+    """
+    def __init__(self, deliver=None):
+        self.deliver = deliver if deliver is not None else lambda func, *args: func(*args)
+        self.lock = threading.Condition()
+        self.generation = 0
+        self.next_job = None
+        self.pending = None
+        self.thread = None
+        self.is_shutdown = False
+
+    @property
+    def is_busy(self):
+        """True if there is a job whose result hasn't been delivered yet"""
+        with self.lock:
+            return self.pending is not None
+
+    def submit(self, func, callback, *args):
+        """Run `func(*args)` on the worker thread and call `callback` with
+        its return value, unless a newer job is submitted first.
+        """
+        with self.lock:
+            if self.is_shutdown:
+                raise RuntimeError("disassembly worker has been shut down")
+            self.generation += 1
+            self.next_job = (self.generation, func, args, callback)
+            self.pending = self.generation
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="disassembly worker", daemon=True)
+                self.thread.start()
+            self.lock.notify()
+            return self.generation
+
+    def cancel(self):
+        """Discard any queued job and the result of the running one"""
+        with self.lock:
+            self.generation += 1
+            self.next_job = None
+            self.pending = None
+
+    def shutdown(self):
+        """Discard any queued job and the result of the running one, and
+        end the worker thread once the running job has finished.
+        """
+        with self.lock:
+            self.generation += 1
+            self.pending = None
+            self.is_shutdown = True
+            if self.thread is not None:
+                # a job without a function stops the thread
+                self.next_job = (self.generation, None, (), None)
+                self.lock.notify()
+            else:
+                self.next_job = None
+
+    def run(self):
+        while True:
+            with self.lock:
+                while self.next_job is None:
+                    self.lock.wait()
+                generation, func, args, callback = self.next_job
+                self.next_job = None
+            if func is None:
+                break
+            try:
+                result = func(*args)
+            except Exception:
+                log.exception("background disassembly failed")
+                with self.lock:
+                    if generation == self.generation:
+                        self.pending = None
+            else:
+                with self.lock:
+                    stale = generation != self.generation
+                if not stale:
+                    self.deliver(self.finish, generation, callback, result)
+                del result
+            # don't keep the last job's table, segment and disassembly alive
+            # while waiting for the next one
+            del func, args, callback
+
+    def finish(self, generation, callback, result):
+        # a newer job may have been submitted while the result was waiting
+        # to be delivered
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.pending = None
+        callback(result)
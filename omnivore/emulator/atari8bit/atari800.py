@@ -72,6 +72,21 @@ def ntsc_color_map():
     return rmap, gmap, bmap
 
 
+def calc_packed_palettes(rmap, gmap, bmap):
+    """Return palettes with each color packed into a single array element,
+    so a color indexed frame can be converted with one gather: a uint32
+    array with RGBA bytes in memory order, and a 3 byte void array with RGB
+    bytes.
+    """
+    rgba = np.empty((256, 4), dtype=np.uint8)
+    rgba[:,0] = rmap
+    rgba[:,1] = gmap
+    rgba[:,2] = bmap
+    rgba[:,3] = 255
+    rgb = np.ascontiguousarray(rgba[:,0:3])
+    return rgba.view(np.uint32).reshape(256), rgb.view('V3').reshape(256)
+
+
 class Atari800(EmulatorBase):
     cpu = "6502"
     name = "atari800"
@@ -93,6 +108,7 @@ class Atari800(EmulatorBase):
 
     def compute_color_map(self):
         self.rmap, self.gmap, self.bmap = ntsc_color_map()
+        self.rgba_palette, self.rgb_palette = calc_packed_palettes(self.rmap, self.gmap, self.bmap)
 
     @property
     def current_cpu_status(self):
@@ -246,26 +262,18 @@ class Atari800(EmulatorBase):
 
     def get_frame_rgb(self, frame_number=-1):
         raw = self.get_color_indexed_screen(frame_number)
-        self.screen_rgb[:,:,0] = self.rmap[raw]
-        self.screen_rgb[:,:,1] = self.gmap[raw]
-        self.screen_rgb[:,:,2] = self.bmap[raw]
+        np.take(self.rgb_palette, raw, out=self.screen_rgb.view('V3').reshape(raw.shape))
         return self.screen_rgb
 
-    def get_frame_rgba(self, frame_number=-1):
+    def get_frame_rgba(self, frame_number=-1, flip=False):
         raw = self.get_color_indexed_screen(frame_number)
-        self.screen_rgba[:,:,0] = self.rmap[raw]
-        self.screen_rgba[:,:,1] = self.gmap[raw]
-        self.screen_rgba[:,:,2] = self.bmap[raw]
-        self.screen_rgba[:,:,3] = 255
+        if flip:
+            raw = raw[::-1]
+        np.take(self.rgba_palette, raw, out=self.screen_rgba.view(np.uint32).reshape(raw.shape))
         return self.screen_rgba
 
     def get_frame_rgba_opengl(self, frame_number=-1):
-        raw = np.flipud(self.get_color_indexed_screen(frame_number))
-        self.screen_rgba[:,:,0] = self.rmap[raw]
-        self.screen_rgba[:,:,1] = self.gmap[raw]
-        self.screen_rgba[:,:,2] = self.bmap[raw]
-        self.screen_rgba[:,:,3] = 255
-        return self.screen_rgba
+        return self.get_frame_rgba(frame_number, True)
 
     ##### Input routines
 
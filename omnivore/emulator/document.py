@@ -11,6 +11,7 @@ from traits.api import Trait, Any, List, Event, Dict, Property, Bool, Int, Strin
 from .. import find_emulator, guess_emulator, default_emulator, UnknownEmulatorError, EmulatorError
 
 from ..document import SegmentedDocument
+from .save_state import ContainerReader, ContainerWriter
 
 import logging
 log = logging.getLogger(__name__)
@@ -25,9 +26,11 @@ class EmulatorSegmentParser(SegmentParser):
             if count > 0:
                 print(f"creating emulator segment {name} at {hex(start)}:{hex(start + count)}")
                 self.segments.append(DefaultSegment(r[start:start + count], offset, name))
+        for array, origin, name in self.separate_memory_blocks:
+            self.segments.append(DefaultSegment(SegmentData(array), origin, name))
 
-def segment_parser_factory(save_state_memory_blocks):
-    cls = type('EmulatorSegmentParser', (EmulatorSegmentParser, SegmentParser), dict(save_state_memory_blocks = save_state_memory_blocks))
+def segment_parser_factory(save_state_memory_blocks, separate_memory_blocks=()):
+    cls = type('EmulatorSegmentParser', (EmulatorSegmentParser, SegmentParser), dict(save_state_memory_blocks = save_state_memory_blocks, separate_memory_blocks = separate_memory_blocks))
     return cls
 
 
@@ -48,6 +51,10 @@ class EmulationDocument(SegmentedDocument):
 
     metadata_extension = ".omniemu"
 
+    # frame history and emulator state are saved in a binary container next to
+    # the .omniemu file rather than in the json
+    save_state_extension = ".omniemu-state"
+
     # Traits
 
     source_document = Any(None)
@@ -69,6 +76,10 @@ class EmulationDocument(SegmentedDocument):
 
     last_update_time = Float(0.0)
 
+    # uri the document is being saved to, used to find the save state
+    # container while serializing
+    save_state_uri = Any(None)
+
     ##### trait default values
 
     #### object methods
@@ -119,7 +130,9 @@ class EmulationDocument(SegmentedDocument):
 
     def restore_save_points_from_dict(self, e):
         # emulator type will already be set at document creation time
-        if 'frame_history' in e:
+        if 'save_state_container' in e:
+            self.restore_save_points_from_container(e['save_state_container'])
+        elif 'frame_history' in e:
             self.emulator.frame_history.restore_from_dict(e)
             self.emulator.configure_io_arrays()
             self.create_segments()
@@ -127,21 +140,67 @@ class EmulationDocument(SegmentedDocument):
             self.emulator.restore_from_dict(e['current_frame'])
         self.skip_frames_on_boot = e.get('skip_frames_on_boot', 0)
 
+    def restore_save_points_from_container(self, filename):
+        # the container is stored next to the source document
+        path = os.path.join(os.path.dirname(self.calc_save_state_path(self.source_document.metadata.uri)), filename)
+        container = ContainerReader(path)
+        header = container.header
+        self.emulator.frame_history.restore_from_container(container, header['frame_history'])
+        self.emulator.configure_io_arrays()
+        self.create_segments()
+        self.emulator.restore_from_dict(container.get_state(header['current_frame'], writable=True))
+
     def serialize_extra_to_dict(self, mdict):
         SegmentedDocument.serialize_extra_to_dict(self, mdict)
 
         mdict["emulator_type"] = self.emulator.name
-        mdict.update(self.emulator.frame_history.serialize_to_dict())
-        mdict["current_frame"] = self.emulator.serialize_to_dict()
+        if self.save_state_uri is not None:
+            path = self.calc_save_state_path(self.save_state_uri)
+            self.serialize_save_points_to_container(path)
+            mdict["save_state_container"] = os.path.basename(path)
+        else:
+            mdict.update(self.emulator.frame_history.serialize_to_dict())
+            mdict["current_frame"] = self.emulator.serialize_to_dict()
         mdict["skip_frames_on_boot"] = self.skip_frames_on_boot
 
+    def serialize_save_points_to_container(self, path):
+        history = self.emulator.frame_history
+        released = False
+        try:
+            with ContainerWriter(path) as container:
+                container.header['emulator_type'] = self.emulator.name
+                container.header['frame_history'] = history.serialize_to_container(container)
+                container.header['current_frame'] = container.add_state(self.emulator.serialize_to_dict())
+                if history.is_mapped_from(path):
+                    # Windows can't replace a file that is still memory
+                    # mapped, so frames restored from the previous save are
+                    # released once they have been copied to the new file
+                    history.clear()
+                    released = True
+        finally:
+            if released:
+                # and mapped from the file that's now in place, which holds
+                # the same frames unless it couldn't be replaced
+                container = ContainerReader(path)
+                history.restore_from_container(container, container.header['frame_history'])
+
+    def calc_save_state_path(self, uri):
+        if uri.startswith("file://"):
+            uri = uri[len("file://"):]
+        return uri + self.save_state_extension
+
     def save_to_uri(self, uri, editor, saver=None, save_metadata=True):
         # save both the source document and its .omnivore metadata and...
         self.source_document.save_to_uri(uri, editor, saver, save_metadata)
 
-        # the emulator metadata .omniemu from this emulator document
+        # the emulator metadata .omniemu from this emulator document, which
+        # also writes the save state container
         if save_metadata:
-            self.save_metadata_to_uri(uri, editor)
+            self.save_state_uri = uri
+            try:
+                self.save_metadata_to_uri(uri, editor)
+            finally:
+                self.save_state_uri = None
 
     ##### Initial viewer defaults
 
@@ -190,7 +249,7 @@ class EmulationDocument(SegmentedDocument):
         emu = self.emulator
         self.raw_bytes = emu.raw_array
         self.style = np.zeros([len(self.raw_bytes)], dtype=np.uint8)
-        self.parse_segments([segment_parser_factory(emu.save_state_memory_blocks)])
+        self.parse_segments([segment_parser_factory(emu.save_state_memory_blocks, emu.separate_memory_blocks)])
         log.debug("Segments after boot: %s" % str(self.segments))
         self.create_timer()
 
@@ -253,6 +312,12 @@ class EmulationDocument(SegmentedDocument):
         self.emulator.step_into(1)
         self.start_timer()
 
+    def debugger_step_out(self):
+        print("stepping out")
+        emu = self.emulator
+        emu.step_out(emu.cpu_call_graph)
+        self.start_timer()
+
     def debugger_break_vbi_start(self, count=1):
         print("stepping")
         self.emulator.break_vbi_start(count)
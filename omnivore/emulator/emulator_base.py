@@ -6,10 +6,11 @@ import numpy as np
 from atrcopy import find_diskimage
 
 from ..debugger import Debugger
-from ..debugger.dtypes import FRAME_STATUS_DTYPE
+from ..debugger.dtypes import FRAME_STATUS_DTYPE, MAIN_MEMORY_SIZE
 from .save_state import FrameHistory
 from .. import disassembler as disasm
 from ..utils.archutil import Labels, load_memory_map
+from ..errors import EmulatorError
 
 import logging
 log = logging.getLogger(__name__)
@@ -43,11 +44,7 @@ class EmulatorBase(Debugger):
 
     def __init__(self):
         Debugger.__init__(self)
-        self.input_raw = np.zeros([self.input_array_dtype.itemsize], dtype=np.uint8)
-        self.input = self.input_raw.view(dtype=self.input_array_dtype)
-        self.output_raw = np.zeros([FRAME_STATUS_DTYPE.itemsize + self.output_array_dtype.itemsize], dtype=np.uint8)
-        self.status = self.output_raw[0:FRAME_STATUS_DTYPE.itemsize].view(dtype=FRAME_STATUS_DTYPE)
-        self.output = self.output_raw[FRAME_STATUS_DTYPE.itemsize:].view(dtype=self.output_array_dtype)
+        self.init_io_arrays(np.zeros([self.input_array_dtype.itemsize], dtype=np.uint8), np.zeros([self.output_array_size], dtype=np.uint8))
         self.bootfile = None
         self.frame_count = 0
         self.frame_event = []
@@ -60,11 +57,20 @@ class EmulatorBase(Debugger):
         self.forced_modifier = None
         self.emulator_started = False
         self.cpu_history = None
+        self.cpu_history_trace = None
+        self.cpu_history_generation = 0
+        self.cpu_history_text = None
+        self.cpu_profile = None
+        self.profile_heat = np.zeros(MAIN_MEMORY_SIZE, dtype=np.uint8)
         self.labels = None
 
         self.compute_color_map()
         self.screen_rgb, self.screen_rgba = self.calc_screens()
 
+    @property
+    def output_array_size(self):
+        return FRAME_STATUS_DTYPE.itemsize + self.output_array_dtype.itemsize
+
     @property
     def raw_array(self):
         return self.output_raw
@@ -93,6 +99,30 @@ class EmulatorBase(Debugger):
     def access_type_array(self):
         return self.status['access_type'][0]
 
+    @property
+    def profile_heat_array(self):
+        return self.profile_heat
+
+    @property
+    def separate_memory_blocks(self):
+        """List of (array, origin, name) for memory blocks that aren't part
+        of `output_raw`, so they aren't copied with each frame or saved in the
+        frame history.
+        """
+        return [(self.profile_heat, 0, "Execution Profile")]
+
+    @property
+    def use_memory_access(self):
+        return bool(self.status['use_memory_access'][0])
+
+    @use_memory_access.setter
+    def use_memory_access(self, value):
+        """Turn the memory access visualization on or off. When off, the
+        emulator doesn't spend any time updating the memory_access and
+        access_type arrays at frame boundaries.
+        """
+        self.status['use_memory_access'][0] = 1 if value else 0
+
     @property
     def current_frame_number(self):
         return self.status['frame_number'][0]
@@ -164,6 +194,26 @@ class EmulatorBase(Debugger):
         rgba = np.empty((self.height, self.width, 4), np.uint8)
         return rgb, rgba
 
+    ##### Input/output arrays
+
+    def init_io_arrays(self, input_raw, output_raw):
+        self.input_raw = input_raw
+        self.input = self.input_raw.view(dtype=self.input_array_dtype)
+        self.output_raw = output_raw
+        self.status = self.output_raw[0:FRAME_STATUS_DTYPE.itemsize].view(dtype=FRAME_STATUS_DTYPE)
+        self.output = self.output_raw[FRAME_STATUS_DTYPE.itemsize:].view(dtype=self.output_array_dtype)
+
+    def use_shared_arrays(self, input_raw, output_raw, debug_cmd_raw):
+        """Replace the input, output, and debugger arrays with views into
+        externally owned memory (e.g. multiprocessing shared memory) so
+        another process can see the emulator state without copying.
+
+        Must be called before `configure_emulator`, because the low level
+        emulator stores pointers to these arrays.
+        """
+        self.init_io_arrays(input_raw, output_raw)
+        self.init_debug_array(debug_cmd_raw)
+
     ##### Serialization
 
     def restore_computed_attributes(self, state):
@@ -193,6 +243,7 @@ class EmulatorBase(Debugger):
         if labels is None:
             labels = load_memory_map(self.name)
         self.labels = labels
+        self.cpu_history_generation += 1
 
     def configure_emulator_defaults(self):
         pass
@@ -290,6 +341,7 @@ class EmulatorBase(Debugger):
         if not self.is_frame_finished:
             print(f"next_frame: continuing frame from cycle {self.current_cycle_in_frame} of frame {self.current_frame_number}")
         bpid = self.low_level_interface.next_frame(self.input, self.output_raw, self.debug_cmd, self.cpu_history)
+        self.process_cpu_history()
         if self.is_frame_finished:
             self.frame_count += 1
             self.process_frame_events()
@@ -297,6 +349,59 @@ class EmulatorBase(Debugger):
         self.forced_modifier = None
         return self.get_breakpoint(bpid)
 
+    def run_frames(self, num_frames, until=None, keep_frames=None):
+        """Run up to `num_frames` frames without any user interface.
+
+        The low level emulator loops over as many frames as possible before
+        returning to python: only after a frame listed in `keep_frames`, at a
+        pending frame event, or every frame if an `until` predicate is given.
+        Frame history is not saved and keyboard state is not polled; the
+        input array is held constant for the entire run.
+
+        `until` is a callable taking the emulator as its argument, checked
+        after each frame; the run stops when it returns True.
+
+        `keep_frames` lists frames relative to the start of the run (1 is the
+        first frame computed) whose complete state should be copied.
+
+        Returns a tuple of the number of frames completed, the breakpoint that
+        stopped the run (or None), and a dict mapping each kept frame to its
+        copy of `output_raw`.
+        """
+        stops = sorted(i for i in keep_frames if 0 < i <= num_frames) if keep_frames else []
+        kept = {}
+        count = 0
+        bp = None
+        while count < num_frames:
+            if until is not None:
+                chunk = 1
+            else:
+                chunk = num_frames - count
+                if stops:
+                    chunk = min(chunk, stops[0] - count)
+                if self.frame_event:
+                    chunk = min(chunk, max(1, min(c for c, _ in self.frame_event) - self.frame_count))
+                limit = self.max_frames_per_history_update
+                if limit is not None:
+                    chunk = min(chunk, limit)
+            bpid, finished = self.low_level_interface.run_frames(self.input, self.output_raw, self.debug_cmd, self.cpu_history, chunk)
+            self.process_cpu_history(finished)
+            count += finished
+            self.frame_count += finished
+            if finished:
+                self.process_frame_events()
+            while stops and stops[0] <= count:
+                if stops[0] == count:
+                    kept[count] = self.calc_current_state()
+                stops.pop(0)
+            bp = self.get_breakpoint(bpid)
+            if bp is not None:
+                break
+            if until is not None and until(self):
+                break
+        self.forced_modifier = None
+        return count, bp, kept
+
     def process_frame_events(self):
         still_waiting = []
         for count, callback in self.frame_event:
@@ -392,15 +497,16 @@ class EmulatorBase(Debugger):
         return self.output_raw.copy()
 
     def save_history(self, force=False):
-        # History is saved in a big list, which will waste space for empty
-        # entries but makes things extremely easy to manage. Simply delete
-        # a history entry by setting it to NONE.
+        # FrameHistory stores most frames as deltas against the previously
+        # saved frame, and saving a frame earlier than the latest one (after
+        # restoring an old frame and continuing) discards the newer frames.
         frame_number = int(self.status['frame_number'][0])
         if force or self.frame_history.is_memorable(frame_number):
-            print(f"Saving history at {frame_number}")
+            # every frame is memorable by default, so avoid printing here
+            log.debug(f"Saving history at {frame_number}")
             d = self.calc_current_state()
             self.frame_history.save_frame(frame_number, d)
-            self.print_history(frame_number)
+            self.frame_history.decimate()
 
     def get_history(self, frame_number):
         frame_number = int(frame_number)
@@ -453,8 +559,9 @@ class EmulatorBase(Debugger):
         """Return RGB image of the current screen
         """
 
-    def get_frame_rgba(self, frame_number=-1):
-        """Return RGBA image of the current screen
+    def get_frame_rgba(self, frame_number=-1, flip=False):
+        """Return RGBA image of the current screen, optionally flipped
+        vertically
         """
 
     def get_frame_rgba_opengl(self, frame_number=-1):
@@ -465,7 +572,15 @@ class EmulatorBase(Debugger):
     # CPU history
 
     def init_cpu_history(self, num_entries):
-        self.cpu_history = disasm.HistoryStorage(num_entries)
+        self.stop_cpu_history_trace()
+        self.stop_profiling()
+        self.cpu_history_generation += 1
+        if num_entries > 0:
+            self.cpu_history = disasm.HistoryStorage(num_entries)
+        else:
+            # instruction history turned off entirely; the low level
+            # emulators skip history entries if passed None
+            self.cpu_history = None
 
     def cpu_history_show_range(self, from_index, details=False):
         self.cpu_history.debug_range(from_index)
@@ -481,9 +596,111 @@ class EmulatorBase(Debugger):
         handled by numpy, so instead is used to map the row number in the
         display window (which ranges from 0 -> count) to the history entry
         starting at first_entry_index + start_index for count entries.
+
+        The returned object is reused by the next call, so its text must be
+        consumed before asking for another range.
+        """
+        if self.cpu_history_trace is not None:
+            return self.cpu_history_trace.stringify(start_index, count, self.labels.labels)
+        self.cpu_history_text = self.cpu_history.stringify(start_index, count, self.labels.labels, output=self.cpu_history_text)
+        return self.cpu_history_text
+
+    def calc_cpu_history_entry_id(self, row):
+        """Return a number identifying the history entry at `row` that
+        doesn't change as new entries are added, so consecutive rows have
+        consecutive ids. Ids are only comparable while
+        `cpu_history_generation` stays the same.
         """
-        return self.cpu_history.stringify(start_index, count, self.labels.labels)
+        if self.cpu_history_trace is not None:
+            # rows in a trace never move
+            return row
+        return (self.cpu_history.cumulative_count - len(self.cpu_history) + row) & 0xffffffff
+
+    def get_cpu_history_entry(self, index):
+        if self.cpu_history_trace is not None:
+            return self.cpu_history_trace[index]
+        return self.cpu_history[index]
 
     @property
     def num_cpu_history_entries(self):
+        if self.cpu_history_trace is not None:
+            return len(self.cpu_history_trace)
+        if self.cpu_history is None:
+            return 0
         return len(self.cpu_history)
+
+    def query_cpu_history(self, start=0, stop=None):
+        """Return a `HistoryQuery` to search the CPU history from row `start`
+        to row `stop`, covering the entire trace if one is active.
+        """
+        if self.cpu_history_trace is not None:
+            history = self.cpu_history_trace
+        elif self.cpu_history is not None:
+            history = self.cpu_history
+        else:
+            return disasm.HistoryQuery([])
+        return disasm.HistoryQuery.from_history(history, start, stop)
+
+    def start_cpu_history_trace(self, path):
+        """Save every CPU history entry from now on to the trace file at
+        `path`, appending to it if it already exists. The instruction history
+        is then numbered across the entire trace rather than just the entries
+        remaining in the ring.
+        """
+        if self.cpu_history is None:
+            raise EmulatorError("CPU history is turned off; can't save a trace")
+        self.stop_cpu_history_trace()
+        self.cpu_history_trace = disasm.HistoryTrace(path, self.cpu_history)
+        self.cpu_history_generation += 1
+
+    def stop_cpu_history_trace(self):
+        if self.cpu_history_trace is not None:
+            self.cpu_history_trace.close()
+            self.cpu_history_trace = None
+            self.cpu_history_generation += 1
+
+    def process_cpu_history(self, num_frames=1):
+        """Pass the CPU history entries generated since the last call to the
+        trace file and profiler, if active.
+        """
+        if self.cpu_history_trace is not None:
+            self.cpu_history_trace.spill(num_frames)
+        if self.cpu_profile is not None:
+            self.cpu_profile.update(num_frames)
+            self.cpu_profile.calc_heat_map(self.profile_heat_array)
+
+    @property
+    def max_frames_per_history_update(self):
+        """Number of frames that can be run before the CPU history ring could
+        overwrite entries not yet processed by `process_cpu_history`, or None
+        if nothing is following the history.
+        """
+        frames = []
+        if self.cpu_history_trace is not None:
+            frames.append(self.cpu_history_trace.max_frames_per_advance)
+        if self.cpu_profile is not None:
+            frames.append(self.cpu_profile.max_frames_per_update)
+        return min(frames) if frames else None
+
+    # Execution profiling
+
+    def start_profiling(self):
+        """Accumulate per-address instruction counts and subroutine cycle
+        totals from the CPU history. The profile is available as numpy arrays
+        in `cpu_profile` and as a heat map in the "Execution Profile" memory
+        block.
+        """
+        if self.cpu_history is None:
+            raise EmulatorError("CPU history is turned off; can't profile")
+        self.stop_profiling()
+        self.cpu_profile = disasm.ExecutionProfile(self.cpu_history)
+
+    def stop_profiling(self):
+        self.cpu_profile = None
+        self.profile_heat[:] = 0
+
+    @property
+    def cpu_call_graph(self):
+        if self.cpu_profile is None:
+            return None
+        return self.cpu_profile.call_graph
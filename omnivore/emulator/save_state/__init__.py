@@ -1 +1,3 @@
 from .frame_history import FrameHistory
+from .delta import FrameDelta
+from .container import ContainerReader, ContainerWriter
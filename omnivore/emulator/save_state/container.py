@@ -0,0 +1,145 @@
+"""Chunked binary container for emulator sessions
+
+The file holds raw array blobs followed by a small JSON header that records
+the offset, dtype and shape of each blob along with any other metadata::
+
+    magic (8 bytes)
+    blob 0, blob 1, ... (each aligned to `alignment` bytes)
+    JSON header
+    trailer: header offset (uint64), header length (uint64), magic
+
+Because the header is written last, arrays can be streamed to the file one at
+a time without knowing in advance how many there will be. On reading, the
+whole file is memory mapped and arrays are returned as read-only views, so
+nothing is read from disk until an array is actually used.
+"""
+import os
+import json
+import struct
+
+import numpy as np
+
+from ...errors import InvalidSaveStateError
+
+import logging
+log = logging.getLogger(__name__)
+
+
+magic = b"OMNIEMU\x00"
+version = 1
+alignment = 64
+trailer = struct.Struct("<QQ8s")
+
+
+class ContainerWriter:
+    """Write arrays and a JSON-compatible header to a container file.
+
+    The file is written to a temporary name and moved into place when the
+    writer is closed, so an existing container that is still memory mapped
+    (e.g. by the frame history being saved) is never overwritten in place.
+    Windows can't replace a file that is mapped, though, so any mapping of
+    the old file has to be released before the writer is closed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = path + ".tmp"
+        self.fh = open(self.temp_path, "wb")
+        self.fh.write(magic)
+        self.blobs = []
+        self.header = {'version': version}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def align(self):
+        pos = self.fh.tell()
+        pad = -pos % alignment
+        if pad:
+            self.fh.write(b"\0" * pad)
+        return pos + pad
+
+    def add_array(self, array):
+        """Append an array to the file, returning its blob index"""
+        array = np.ascontiguousarray(array)
+        offset = self.align()
+        self.fh.write(array.data.cast("B"))
+        self.blobs.append([offset, array.dtype.str, list(array.shape)])
+        return len(self.blobs) - 1
+
+    def add_state(self, state):
+        """Store a dict as returned by `Serializable.serialize_to_dict`,
+        replacing its numpy arrays with references to blobs. Returns the JSON
+        compatible dict to be placed in the header.
+        """
+        converted = {}
+        for key, value in state.items():
+            if isinstance(value, np.ndarray):
+                value = {'blob': self.add_array(value)}
+            elif isinstance(value, np.generic):
+                value = value.item()
+            converted[key] = value
+        return converted
+
+    def close(self):
+        self.header['blobs'] = self.blobs
+        text = json.dumps(self.header).encode("utf-8")
+        offset = self.align()
+        self.fh.write(text)
+        self.fh.write(trailer.pack(offset, len(text), magic))
+        self.fh.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.fh.close()
+        os.unlink(self.temp_path)
+
+
+class ContainerReader:
+    """Memory mapped access to the arrays in a container file"""
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        except (OSError, ValueError) as e:
+            raise InvalidSaveStateError(f"Can't open save state {path}: {e}")
+        if len(self.data) < len(magic) + trailer.size or bytes(self.data[:len(magic)]) != magic:
+            raise InvalidSaveStateError(f"{path} is not a save state file")
+        offset, length, end_magic = trailer.unpack(bytes(self.data[-trailer.size:]))
+        if end_magic != magic or offset + length > len(self.data) - trailer.size:
+            raise InvalidSaveStateError(f"{path} is truncated")
+        self.header = json.loads(bytes(self.data[offset:offset + length]).decode("utf-8"))
+        if self.header.get('version', 0) > version:
+            raise InvalidSaveStateError(f"{path} was saved by a newer version (format {self.header['version']})")
+        self.blobs = self.header['blobs']
+
+    def __str__(self):
+        return f"ContainerReader: {self.path}, {len(self.blobs)} arrays"
+
+    def get_array(self, index):
+        offset, dtype, shape = self.blobs[index]
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        return np.asarray(self.data[offset:offset + nbytes]).view(dtype).reshape(shape)
+
+    def get_state(self, converted, writable=False):
+        """Reverse of `ContainerWriter.add_state`
+
+        Arrays are read-only views into the file unless `writable` is True,
+        in which case they are copied. State that will be restored into an
+        emulator must be writable because the low level emulator code
+        updates it in place.
+        """
+        state = {}
+        for key, value in converted.items():
+            if isinstance(value, dict) and 'blob' in value:
+                value = self.get_array(value['blob'])
+                if writable:
+                    value = value.copy()
+            state[key] = value
+        return state
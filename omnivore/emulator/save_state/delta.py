@@ -0,0 +1,83 @@
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+def run_indexes(starts, lengths):
+    """Expand runs given as start offsets and lengths into the array of every
+    index covered by the runs, in order.
+    """
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum(lengths, dtype=np.int64) - lengths
+    return np.repeat(starts.astype(np.int64) - offsets, lengths) + np.arange(total, dtype=np.int64)
+
+
+class FrameDelta:
+    """Difference between two saved frames of emulator state.
+
+    Only the bytes that changed are kept, as runs of the XOR of the two
+    frames. XOR deltas can be applied in either direction and two consecutive
+    deltas can be merged into one, which allows frames in the middle of a
+    chain of deltas to be discarded.
+    """
+
+    # unchanged gaps shorter than this are included in a run, because each
+    # run costs 8 bytes of bookkeeping
+    max_gap = 8
+
+    def __init__(self, previous, starts, lengths, values, size):
+        self.previous = previous  # frame number this delta is relative to
+        self.starts = starts
+        self.lengths = lengths
+        self.values = values
+        self.size = size
+
+    def __str__(self):
+        return f"FrameDelta: from {self.previous}, {len(self.starts)} runs, {self.nbytes} bytes"
+
+    @classmethod
+    def from_frames(cls, previous, before, after):
+        return cls.from_xor(previous, np.bitwise_xor(before, after))
+
+    @classmethod
+    def from_xor(cls, previous, xor):
+        changed = np.flatnonzero(xor)
+        if len(changed) == 0:
+            starts = np.zeros(0, dtype=np.uint32)
+            lengths = np.zeros(0, dtype=np.uint32)
+            values = np.zeros(0, dtype=np.uint8)
+        else:
+            breaks = np.flatnonzero(np.diff(changed) > cls.max_gap) + 1
+            starts = changed[np.r_[0, breaks]]
+            ends = changed[np.r_[breaks - 1, len(changed) - 1]] + 1
+            lengths = ends - starts
+            values = xor[run_indexes(starts, lengths)]
+            starts = starts.astype(np.uint32)
+            lengths = lengths.astype(np.uint32)
+        return cls(previous, starts, lengths, values, len(xor))
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.lengths.nbytes + self.values.nbytes
+
+    def apply(self, data):
+        """Change `data` in place from the frame on one side of the delta to
+        the frame on the other side.
+        """
+        data[run_indexes(self.starts, self.lengths)] ^= self.values
+
+    def to_xor(self):
+        xor = np.zeros(self.size, dtype=np.uint8)
+        xor[run_indexes(self.starts, self.lengths)] = self.values
+        return xor
+
+    def merge(self, following):
+        """Combine with the delta immediately after this one, producing a
+        single delta from this delta's previous frame.
+        """
+        xor = self.to_xor()
+        following.apply(xor)
+        return FrameDelta.from_xor(self.previous, xor)
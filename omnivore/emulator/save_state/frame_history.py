@@ -1,79 +1,309 @@
 import os
 import tempfile
+from bisect import bisect_left, bisect_right
 
 import numpy as np
 
 from ...utils.persistence import Serializable
+from .delta import FrameDelta
 
 import logging
 log = logging.getLogger(__name__)
 
 
+class MappedFrames(dict):
+    """Saved frames restored from a container file.
+
+    The frame table from the file serves as the index, and the entry for a
+    frame (a memory mapped keyframe or FrameDelta) is only created the first
+    time it is accessed. Frames added or replaced after the restore are held
+    in the dict itself, which takes precedence over the table.
+    """
+    def __init__(self, container, table):
+        dict.__init__(self)
+        self.container = container
+        self.table = table
+        self.table_frame_numbers = table[:, 0]
+        self.removed = set()
+
+    def find_row(self, frame_number):
+        if frame_number not in self.removed:
+            i = np.searchsorted(self.table_frame_numbers, frame_number)
+            if i < len(self.table) and self.table_frame_numbers[i] == frame_number:
+                return self.table[i]
+        return None
+
+    def __missing__(self, frame_number):
+        row = self.find_row(frame_number)
+        if row is None:
+            raise KeyError(frame_number)
+        _, previous, first, _, size = row.tolist()
+        c = self.container
+        if previous < 0:
+            entry = c.get_array(first)
+        else:
+            entry = FrameDelta(previous, c.get_array(first), c.get_array(first + 1), c.get_array(first + 2), size)
+        dict.__setitem__(self, frame_number, entry)
+        return entry
+
+    def __contains__(self, frame_number):
+        return dict.__contains__(self, frame_number) or self.find_row(frame_number) is not None
+
+    def __setitem__(self, frame_number, entry):
+        self.removed.discard(frame_number)
+        dict.__setitem__(self, frame_number, entry)
+
+    def __delitem__(self, frame_number):
+        if frame_number not in self:
+            raise KeyError(frame_number)
+        dict.pop(self, frame_number, None)
+        self.removed.add(frame_number)
+
+
 class FrameHistory(Serializable):
     name = None
 
     serializable_attributes = ['frame_history']
     serializable_computed = {'frame_history'}
 
-    def __init__(self):
-        self.frame_history = self.calc_history_iterable()
+    # every Nth saved frame is stored in full; the frames in between are
+    # stored as deltas against the previously saved frame
+    keyframe_interval = 30
+
+    # approximate limit on the memory used by saved frames. The oldest frames
+    # are discarded when it is exceeded.
+    max_bytes = 256 * 1024 * 1024
+
+    frames_per_second = 60
+
+    # Aging policy used by decimate: a list of (age in seconds, interval)
+    # from newest to oldest, where frames younger than the age keep every
+    # frame whose number is a multiple of the interval. A final age of None
+    # applies to everything older. Each interval must be a multiple of the
+    # one before it.
+    decimation_tiers = [(5, 1), (60, 10), (None, 100)]
+
+    def __init__(self, max_bytes=None, decimation_tiers=None):
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if decimation_tiers is not None:
+            self.decimation_tiers = decimation_tiers
+        self.clear()
 
     def calc_history_iterable(self):
         return dict()
 
+    def clear(self):
+        # values are either full frames (keyframes) or FrameDelta objects
+        self.frame_history = self.calc_history_iterable()
+
+        # sorted list of the keys of frame_history. Frames are almost always
+        # added at the end, so keeping it sorted is cheap and allows lookups
+        # by bisection.
+        self.frame_numbers = []
+        self.total_bytes = 0
+        self.latest_frame_number = None
+        self.latest_data = None
+        self.last_decimated_frame_number = None
+
     ##### Serialization
 
     def calc_computed_attribute(self, key):
         if key == 'frame_history':
-            return [list(a) for a in self.frame_history.items()]
+            return [[k, self.get_frame(k)] for k in self.keys()]
         return getattr(self, key).copy()
 
     def restore_computed_attributes(self, state):
-        self.frame_history = self.calc_history_iterable()
-        for frame_number, data in state['frame_history']:
-            self.frame_history[frame_number] = data
+        self.clear()
+        for frame_number, data in sorted(state['frame_history'], key=lambda a: a[0]):
+            self.save_frame(frame_number, data)
+
+    def serialize_to_container(self, container):
+        """Stream the saved frames into a `ContainerWriter` as they are
+        stored, without reconstructing the full frames. Returns the entry for
+        the container header.
+
+        Each row of the frame table is the frame number, the frame the delta
+        is relative to (or -1 for a keyframe), the index of its first blob,
+        the number of bytes used and the size of the full frame. A keyframe
+        is a single blob; a delta is three: starts, lengths and values.
+        """
+        table = np.empty((len(self.frame_numbers), 5), dtype=np.int64)
+        for i, frame_number in enumerate(self.frame_numbers):
+            entry = self.frame_history[frame_number]
+            if isinstance(entry, FrameDelta):
+                first = container.add_array(entry.starts)
+                container.add_array(entry.lengths)
+                container.add_array(entry.values)
+                table[i] = (frame_number, entry.previous, first, entry.nbytes, entry.size)
+            else:
+                table[i] = (frame_number, -1, container.add_array(entry), entry.nbytes, len(entry))
+        return {'frame_table': container.add_array(table)}
+
+    def restore_from_container(self, container, state):
+        """Restore from a `ContainerReader`.
+
+        Only the frame table is read here; it becomes the index of the saved
+        frames, and the frames themselves stay in the memory mapped file
+        until they are needed. The exception is the most recent frame, which
+        is reconstructed to continue saving deltas.
+        """
+        self.clear()
+        table = container.get_array(state['frame_table'])
+        self.frame_history = MappedFrames(container, table)
+        self.frame_numbers = table[:, 0].tolist()
+        self.total_bytes = int(table[:, 3].sum())
+        self.update_latest()
+
+    def is_mapped_from(self, path):
+        """True if saved frames are memory mapped from the container file
+        at `path`, which then can't be replaced on Windows.
+        """
+        mapped = self.frame_history
+        if not isinstance(mapped, MappedFrames) or not os.path.exists(path) or not os.path.exists(mapped.container.path):
+            return False
+        return os.path.samefile(mapped.container.path, path)
 
     ##### Storage indexes
 
     def __len__(self):
-        return len(self.frame_history)
+        return len(self.frame_numbers)
 
     def __iter__(self):
-        keys = sorted(self.frame_history.keys())
-        for k in keys:
-            yield self.frame_history[k]
+        for k in self.keys():
+            yield self.get_frame(k)
+
+    def __contains__(self, frame_number):
+        return frame_number in self.frame_history
 
     def keys(self):
-        return sorted(self.frame_history.keys())
+        return list(self.frame_numbers)
 
     def is_memorable(self, frame_number):
-        return frame_number % 10 == 0
+        return frame_number % self.decimation_tiers[0][1] == 0
 
     def get_previous_frame(self, frame_cursor):
-        n = frame_cursor - 1
-        while n > 0:
-            if n in self.frame_history:
-                return n
-            n -= 1
-        raise IndexError("No previous frame")
+        i = bisect_left(self.frame_numbers, frame_cursor)
+        if i == 0:
+            raise IndexError("No previous frame")
+        return self.frame_numbers[i - 1]
 
     def get_next_frame(self, frame_cursor):
-        n = frame_cursor + 1
-        largest = max(self.frame_history.keys())
-        while n < largest:
-            if n in self.frame_history:
-                return n
-            n += 1
-        raise IndexError("No next frame")
+        i = bisect_right(self.frame_numbers, frame_cursor)
+        if i >= len(self.frame_numbers):
+            raise IndexError("No next frame")
+        return self.frame_numbers[i]
+
+    def get_nearest_frame(self, frame_cursor):
+        """Return the saved frame at or before the cursor"""
+        i = bisect_right(self.frame_numbers, frame_cursor)
+        if i == 0:
+            raise IndexError("No frame at or before %d" % frame_cursor)
+        return self.frame_numbers[i - 1]
+
+    def get_frame_range(self, start, stop):
+        """Return the saved frame numbers from start up to but not including
+        stop
+        """
+        i = bisect_left(self.frame_numbers, start)
+        j = bisect_left(self.frame_numbers, stop, i)
+        return self.frame_numbers[i:j]
+
+    def get_following_frame(self, frame_number):
+        # the frame saved immediately after this one, whose delta (if it is
+        # not a keyframe) is relative to this frame
+        try:
+            return self.get_next_frame(frame_number)
+        except IndexError:
+            return None
+
+    def is_keyframe(self, frame_number):
+        return not isinstance(self.frame_history[frame_number], FrameDelta)
+
+    def count_deltas(self, frame_number):
+        # number of deltas that must be applied to the keyframe to recreate
+        # the frame
+        count = 0
+        entry = self.frame_history[frame_number]
+        while isinstance(entry, FrameDelta):
+            count += 1
+            entry = self.frame_history[entry.previous]
+        return count
 
     ##### Storage
 
     def save_frame(self, frame_number, data):
-        # History is saved in a big list, which will waste space for empty
-        # entries but makes things extremely easy to manage. Simply delete
-        # a history entry by setting it to NONE.
+        """Save a frame of emulator state. The history keeps a reference to
+        `data`, so the caller must not modify it afterwards.
+        """
+        frame_number = int(frame_number)
+        if self.latest_frame_number is not None and frame_number <= self.latest_frame_number:
+            # emulation has been restarted from an earlier frame, so the saved
+            # frames from that point on are from an abandoned timeline
+            self.truncate(frame_number)
+        last = self.latest_frame_number
+        if last is None or len(data) != len(self.latest_data) or self.count_deltas(last) >= self.keyframe_interval - 1:
+            entry = data
+            nbytes = data.nbytes
+        else:
+            entry = FrameDelta.from_frames(last, self.latest_data, data)
+            nbytes = entry.nbytes
+        self.frame_history[frame_number] = entry
+        self.frame_numbers.append(frame_number)
+        self.total_bytes += nbytes
+        self.latest_frame_number = frame_number
+        self.latest_data = data
+        self.enforce_memory_limit()
+
+    def entry_nbytes(self, frame_number):
+        return self.frame_history[frame_number].nbytes
+
+    def remove_frame(self, frame_number):
+        """Discard a saved frame, rewriting the frame saved after it so it
+        can still be reconstructed.
+        """
         frame_number = int(frame_number)
-        self.frame_history[frame_number] = data
+        entry = self.frame_history[frame_number]
+        following = self.get_following_frame(frame_number)
+        if following is not None and not self.is_keyframe(following):
+            next_entry = self.frame_history[following]
+            if isinstance(entry, FrameDelta):
+                replacement = entry.merge(next_entry)
+            else:
+                # removing a keyframe, so the following frame becomes the new
+                # keyframe
+                replacement = entry.copy()
+                next_entry.apply(replacement)
+            self.total_bytes += replacement.nbytes - next_entry.nbytes
+            self.frame_history[following] = replacement
+        del self.frame_history[frame_number]
+        del self.frame_numbers[bisect_left(self.frame_numbers, frame_number)]
+        self.total_bytes -= entry.nbytes
+        if frame_number == self.latest_frame_number:
+            self.update_latest()
+
+    def truncate(self, frame_number):
+        """Remove all frames at or after `frame_number`"""
+        i = bisect_left(self.frame_numbers, frame_number)
+        for k in self.frame_numbers[i:]:
+            self.total_bytes -= self.entry_nbytes(k)
+            del self.frame_history[k]
+        del self.frame_numbers[i:]
+        self.update_latest()
+
+    def update_latest(self):
+        # the most recent frame is kept uncompressed to calculate the delta
+        # for the next frame to be saved
+        self.latest_frame_number = None
+        self.latest_data = None
+        if self.frame_numbers:
+            frame_number = self.frame_numbers[-1]
+            self.latest_data = self.get_frame(frame_number)
+            self.latest_frame_number = frame_number
+
+    def enforce_memory_limit(self):
+        while self.total_bytes > self.max_bytes and len(self.frame_numbers) > 1:
+            self.remove_frame(self.frame_numbers[0])
 
     ##### Retrieval
 
@@ -82,23 +312,64 @@ class FrameHistory(Serializable):
             index = int(index)
         except TypeError:
             try:
-                return [self.frame_history[i] for i in index]
+                return [self.get_frame(i) for i in index]
             except TypeError:
                 raise TypeError("argument must be a slice or an integer")
         else:
             if index < 0:
                 index += len( self )
-            return self.frame_history[index]  # will raise IndexError here
+            return self.get_frame(index)  # will raise KeyError here
 
     def get_frame(self, frame_number):
+        """Return a copy of the complete state of the saved frame"""
         frame_number = int(frame_number)
-        raw = self.frame_history[frame_number]
+        if frame_number == self.latest_frame_number:
+            return self.latest_data.copy()
+        entry = self.frame_history[frame_number]
+        deltas = []
+        while isinstance(entry, FrameDelta):
+            deltas.append(entry)
+            entry = self.frame_history[entry.previous]
+        raw = entry.copy()
+        for delta in reversed(deltas):
+            delta.apply(raw)
         return raw
 
     ##### Compact
 
+    def calc_tier_boundaries(self):
+        # convert the tier ages into frame counts, returning a list of (age
+        # in frames, interval to keep beyond that age)
+        boundaries = []
+        for (age, interval), (_, next_interval) in zip(self.decimation_tiers[:-1], self.decimation_tiers[1:]):
+            boundaries.append((int(age * self.frames_per_second), next_interval))
+        return boundaries
+
     def decimate(self):
         """Remove old history items according to an algorithm that discards
         some portion of the older history as time goes on
+
+        Each time a frame ages past one of the `decimation_tiers`, it is
+        discarded unless its frame number is a multiple of the interval of
+        the older tier. Only the frames that crossed a tier boundary since the
+        last call are examined, so the cost depends on the number of new
+        frames rather than the size of the history. The `max_bytes` limit is
+        enforced afterwards.
         """
-        pass
+        latest = self.latest_frame_number
+        if latest is None:
+            return
+        boundaries = self.calc_tier_boundaries()
+        previous = self.last_decimated_frame_number
+        if boundaries and (previous is None or previous > latest):
+            # first call or the history has been truncated; start from the
+            # oldest frame so every frame past a boundary is examined
+            previous = self.frame_numbers[0] - 1 + min(age for age, _ in boundaries)
+        for age, interval in boundaries:
+            # frames in this range have aged past the boundary since the last
+            # time through
+            for frame_number in self.get_frame_range(previous - age + 1, latest - age + 1):
+                if frame_number % interval != 0:
+                    self.remove_frame(frame_number)
+        self.last_decimated_frame_number = latest
+        self.enforce_memory_limit()
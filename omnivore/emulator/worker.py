@@ -0,0 +1,252 @@
+"""Run emulators in isolated worker processes
+
+The low level emulators (libatari800 in particular) keep the entire machine in
+process-global C state, so only one instance of each can live in a Python
+interpreter. To run many emulators at the same time, each `EmulatorWorker`
+starts a separate process that owns one emulator. The input, output and
+debugger arrays are allocated in shared memory, so the parent process sees
+the emulator state through the normal `EmulatorBase` array views (video,
+status, main memory, breakpoints) without any copying. Only short commands and
+breakpoint ids pass through the pipe.
+
+Frames of several workers can be computed in parallel by starting the frame
+on every worker before waiting for any of them, which is what `next_frame_all`
+does.
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ..debugger.dtypes import DEBUGGER_COMMANDS_DTYPE
+from ..errors import EmulatorError
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Methods of the emulator in the worker process that may be called from the
+# parent process. Return values must be picklable.
+worker_commands = {
+    'boot_from_file',
+    'coldstart',
+    'warmstart',
+    'load_disk',
+    'restore_history',
+    'configure_io_arrays',
+}
+
+
+def create_shared_array(size):
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    array = np.ndarray((size,), dtype=np.uint8, buffer=shm.buf)
+    array[:] = 0
+    return shm, array
+
+
+def attach_shared_array(name, size):
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray((size,), dtype=np.uint8, buffer=shm.buf)
+    return shm, array
+
+
+def worker_loop(conn, emulator_type, emu_args, instruction_history_count, shared_names):
+    # imported here so the spawned process loads the emulators itself
+    from .. import find_emulator
+
+    emu_cls = find_emulator(emulator_type)
+    emu = emu_cls()
+    handles = []  # shared memory must stay open for the life of the worker
+    arrays = []
+    for name, size in shared_names:
+        shm, array = attach_shared_array(name, size)
+        handles.append(shm)
+        arrays.append(array)
+    emu.use_shared_arrays(*arrays)
+    emu.configure_emulator(emu_args, instruction_history_count)
+    conn.send(("ready", None))
+
+    while True:
+        try:
+            cmd, args = conn.recv()
+        except EOFError:
+            break
+        if cmd == "quit":
+            conn.send(("ok", None))
+            break
+        try:
+            if cmd == "next_frame":
+                bp = emu.next_frame()
+                result = -1 if bp is None else int(bp.id)
+            elif cmd == "run_frames":
+                count, bp, kept = emu.run_frames(*args)
+                result = (count, -1 if bp is None else int(bp.id), kept)
+            elif cmd in worker_commands:
+                result = getattr(emu, cmd)(*args)
+            else:
+                raise EmulatorError(f"Unknown worker command {cmd}")
+        except Exception as e:
+            log.error(f"worker {emulator_type}: {cmd} failed: {e}")
+            conn.send(("error", str(e)))
+        else:
+            conn.send(("ok", result))
+    conn.close()
+
+
+class EmulatorWorker:
+    """Proxy for an emulator running in its own process.
+
+    The `emulator` attribute is a local, never-started instance of the
+    emulator class whose arrays are views into the shared memory, so all the
+    usual properties (e.g. `video_array`, `current_frame_number`,
+    `get_frame_rgb`) and the breakpoint interface work in the parent process.
+    """
+    start_method = "spawn"  # fork would copy the emulator thread state
+
+    def __init__(self, emulator_type, emu_args=None, instruction_history_count=0):
+        from .. import find_emulator
+
+        self.emulator_type = emulator_type
+        self.emu_args = emu_args
+        self.instruction_history_count = instruction_history_count
+        self.emulator = find_emulator(emulator_type)()
+        self.process = None
+        self.conn = None
+        self.shared = []
+        self.waiting = False
+
+    def __str__(self):
+        return f"EmulatorWorker: {self.emulator_type}, pid={self.pid}"
+
+    @property
+    def pid(self):
+        return None if self.process is None else self.process.pid
+
+    @property
+    def is_running(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        emu = self.emulator
+        sizes = [emu.input_raw.nbytes, emu.output_array_size, DEBUGGER_COMMANDS_DTYPE.itemsize]
+        arrays = []
+        for size in sizes:
+            shm, array = create_shared_array(size)
+            self.shared.append(shm)
+            arrays.append(array)
+        emu.use_shared_arrays(*arrays)
+        emu.clear_all_breakpoints()
+
+        ctx = multiprocessing.get_context(self.start_method)
+        self.conn, child_conn = ctx.Pipe()
+        shared_names = [(shm.name, size) for shm, size in zip(self.shared, sizes)]
+        self.process = ctx.Process(target=worker_loop, args=(child_conn, self.emulator_type, self.emu_args, self.instruction_history_count, shared_names), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.receive()
+        self.update_offsets()
+
+    def update_offsets(self):
+        # The offsets into the save state are computed by the emulator in the
+        # worker process, so the local views have to be recomputed after
+        # anything that can change the machine configuration.
+        self.emulator.configure_save_state_memory_blocks()
+
+    def receive(self):
+        status, result = self.conn.recv()
+        self.waiting = False
+        if status == "error":
+            raise EmulatorError(f"{self}: {result}")
+        return result
+
+    def call(self, cmd, *args):
+        if self.waiting:
+            raise EmulatorError(f"{self}: still waiting for the previous frame")
+        self.conn.send((cmd, args))
+        return self.receive()
+
+    ##### Frame processing
+
+    def start_next_frame(self):
+        """Start computing a frame without waiting for the result, so
+        other workers can run at the same time.
+        """
+        if self.waiting:
+            raise EmulatorError(f"{self}: still waiting for the previous frame")
+        self.conn.send(("next_frame", ()))
+        self.waiting = True
+
+    def finish_next_frame(self):
+        """Wait for the frame started in `start_next_frame` and return the
+        breakpoint that stopped it, or None if the frame finished normally.
+        """
+        bpid = self.receive()
+        return self.emulator.get_breakpoint(bpid)
+
+    def next_frame(self):
+        self.start_next_frame()
+        return self.finish_next_frame()
+
+    def run_frames(self, num_frames, keep_frames=None):
+        """Headless batch run in the worker; see `EmulatorBase.run_frames`.
+        A python `until` predicate can't be sent to the worker process, so
+        use breakpoints to stop early.
+        """
+        count, bpid, kept = self.call("run_frames", num_frames, None, keep_frames)
+        return count, self.emulator.get_breakpoint(bpid), kept
+
+    ##### Emulator commands
+
+    def boot_from_file(self, filename):
+        self.call("boot_from_file", filename)
+        self.update_offsets()
+
+    def coldstart(self):
+        self.call("coldstart")
+
+    def warmstart(self):
+        self.call("warmstart")
+
+    def load_disk(self, drive_num, pathname):
+        self.call("load_disk", drive_num, pathname)
+
+    def restore_history(self, frame_number):
+        self.call("restore_history", frame_number)
+
+    ##### Cleanup
+
+    def shutdown(self):
+        if self.process is not None:
+            if self.waiting:
+                self.receive()
+            if self.process.is_alive():
+                self.conn.send(("quit", ()))
+                try:
+                    self.receive()
+                except EOFError:
+                    pass
+            self.process.join()
+            self.conn.close()
+            self.process = None
+        # point the local emulator at private arrays, otherwise the views into
+        # the shared memory keep it from being released
+        emu = self.emulator
+        emu.use_shared_arrays(emu.input_raw.copy(), emu.output_raw.copy(), emu.debug_cmd_raw.copy())
+        emu.cpu_state = None
+        emu.main_memory = None
+        for shm in self.shared:
+            try:
+                shm.close()
+            except BufferError:
+                log.warning(f"{self}: shared memory {shm.name} still in use")
+            shm.unlink()
+        self.shared = []
+
+
+def next_frame_all(workers):
+    """Advance all workers by one frame in parallel, returning the list of
+    breakpoints (or None) in the same order as the workers.
+    """
+    for w in workers:
+        w.start_next_frame()
+    return [w.finish_next_frame() for w in workers]
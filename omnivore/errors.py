@@ -31,6 +31,12 @@ class FrameNotFinishedError(EmulatorError):
     pass
 
 
+class InvalidSaveStateError(EmulatorError):
+    """Raised when an emulator save state file can't be read
+    """
+    pass
+
+
 class UnknownAssemblerError(OmnivoreError):
     """Raised when the requested assembler is not available
     """
@@ -1,42 +1,43 @@
-# Fast integer multiple scaling of bitmaps
+# Fast nearest-neighbor scaling of bitmaps
 
 import numpy as np
 
-def intscale(arr, scale, output=None):
-    scale = int(scale)
-    if scale == 1:
+def calc_scaled_shape(arr, hscale, wscale):
+    h, w = arr.shape[0:2]
+    return (int(h * hscale), int(w * wscale)) + arr.shape[2:]
+
+def intscale(arr, hscale, wscale=None, output=None):
+    """Scale an image array of shape (h, w) or (h, w, depth) by `hscale`
+    vertically and `wscale` horizontally (defaulting to `hscale`), using
+    nearest-neighbor sampling.
+
+    Integer factors duplicate each source pixel into a hscale x wscale
+    block; fractional factors pick the source pixel under the center of
+    each output pixel. Either way, the output is written in a single numpy
+    operation. If `output` is given it must be a C-contiguous array of the
+    scaled shape and the same dtype, and it is returned after being filled.
+    """
+    if wscale is None:
+        wscale = hscale
+    if hscale <= 0 or wscale <= 0:
+        raise ValueError("Scale must be greater than zero")
+    if hscale == 1 and wscale == 1 and output is None:
         return arr
-    elif scale < 1:
-        raise ValueError("Scale must be an integer greater than 1")
-    h, w, depth = arr.shape
+    shape = calc_scaled_shape(arr, hscale, wscale)
     if output is None:
-        output = np.empty((h * scale, w * scale, depth), dtype=np.uint8)
-    dest_h = scale * h
-    dest_w = scale * w
-    if scale == 2:
-        # duplicate source pixels into two columns
-        output[::2,::2,:] = arr[:,:,:]
-        output[::2,1::2,:] = arr[:,:,:]
-        # then copy completed rows to the row below
-        output[1::2,:,:] = output[0::2,:,:]
-    elif scale == 3:
-        # duplicate source pixels into three columns
-        output[::3,::3,:] = arr[:,:,:]
-        output[::3,1::3,:] = arr[:,:,:]
-        output[::3,2::3,:] = arr[:,:,:]
-        # then copy completed rows to the next two rows
-        output[1::3,:,:] = output[::3,:,:]
-        output[2::3,:,:] = output[::3,:,:]
+        output = np.empty(shape, dtype=arr.dtype)
+    elif output.shape != shape or output.dtype != arr.dtype or not output.flags.c_contiguous:
+        raise ValueError(f"output must be a contiguous {arr.dtype} array of shape {shape}")
+    h, w = arr.shape[0:2]
+    if hscale == int(hscale) and wscale == int(wscale):
+        # view the output as a block of pixels for each source pixel and
+        # broadcast the source into all of them at once
+        blocks = output.reshape((h, int(hscale), w, int(wscale)) + arr.shape[2:])
+        blocks[...] = arr[:, np.newaxis, :, np.newaxis]
     else:
-        raise ValueError("Scale greater than 3 not yet implemented")
-        for y in range(h):
-            dest_y = y * 3
-            # duplicate source pixels to three columns
-            output[dest_y,::3,:] = arr[y,::,:]
-            output[dest_y,1::3,:] = arr[y,::,:]
-            output[dest_y,2::3,:] = arr[y,::,:]
-            # then copy that row to two more
-            output[dest_y+1,:,:] = output[dest_y,:,:]
-            output[dest_y+2,:,:] = output[dest_y,:,:]
-
+        rows = ((np.arange(shape[0]) + 0.5) / hscale).astype(np.intp)
+        cols = ((np.arange(shape[1]) + 0.5) / wscale).astype(np.intp)
+        np.minimum(rows, h - 1, out=rows)
+        np.minimum(cols, w - 1, out=cols)
+        output[...] = arr[rows[:, np.newaxis], cols]
     return output
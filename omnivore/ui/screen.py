@@ -110,8 +110,9 @@ class BitmapScreen(wx.Panel, EmulatorScreenBase):
     def set_scale(self, scale):
         """Scale a numpy array by an integer factor
 
-        This turns out to be too slow to be used by the screen display. OpenGL
-        displays don't use this at all because the display hardware scales
+        Frames are scaled into a buffer shared with the wx.Image, so the
+        image doesn't have to be recreated for each frame. OpenGL displays
+        don't use this at all because the display hardware scales
         automatically.
         """
         self.screen_scale = scale
@@ -131,7 +132,7 @@ class BitmapScreen(wx.Panel, EmulatorScreenBase):
     def scale_frame(self, frame):
         if self.screen_scale == 1:
             return frame
-        scaled = intscale(frame, self.screen_scale, self.scaled_frame)
+        scaled = intscale(frame, self.screen_scale, output=self.scaled_frame)
         log.debug("panel scale: %d, %s" % (self.screen_scale, scaled.shape))
         return scaled
 
@@ -168,9 +169,13 @@ class OpenGLEmulatorMixin(object):
     def show_frame(self, frame_number=-1):
         if not self.finished_init:
             return
-        frame = self.get_rgba_texture_data(frame_number)
         try:
-            self.update_texture(self.display_texture, frame)
+            if self.uses_palette_shader:
+                frame = self.get_color_indexed_texture_data(frame_number)
+                self.update_indexed_texture(self.display_texture, frame)
+            else:
+                frame = self.get_rgba_texture_data(frame_number)
+                self.update_texture(self.display_texture, frame)
         except Exception as e:
             import traceback
 
@@ -199,10 +204,15 @@ class OpenGLScreen(OpenGLEmulatorMixin, wxLegacyTextureCanvas, EmulatorScreenBas
 
 class GLSLScreen(OpenGLEmulatorMixin, wxGLSLTextureCanvas, EmulatorScreenBase):
     def __init__(self, parent, emulator):
+        self.indexed_frame = None
         wxGLSLTextureCanvas.__init__(self, parent, NTSC, -1, size=(3*emulator.width, 3*emulator.height))
         EmulatorScreenBase.__init__(self, emulator)
 
     def get_color_indexed_texture_data(self, frame_number=-1):
-        raw = np.flipud(self.emulator.get_color_indexed_screen(frame_number))
+        raw = self.emulator.get_color_indexed_screen(frame_number)
+        # flipped into a reusable buffer because OpenGL needs contiguous data
+        if self.indexed_frame is None or self.indexed_frame.shape != raw.shape:
+            self.indexed_frame = np.empty(raw.shape, dtype=np.uint8)
+        np.copyto(self.indexed_frame, raw[::-1])
         log.debug("raw data for GLSL version: %s" % str(raw.shape))
-        return raw
+        return self.indexed_frame
@@ -106,6 +106,10 @@ void main()
 
 
 class GLSLTextureCanvas(object):
+    # color indexed frames can be uploaded as is; the fragment shader looks
+    # up the colors in the palette texture
+    uses_palette_shader = True
+
     def __init__(self, initial_palette):
         self.ui_init_context()
         self.init_attributes()
@@ -280,6 +284,18 @@ class GLSLTextureCanvas(object):
         #     gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, data)
         #gl.glBindTexture(gl.GL_TEXTURE_2D, 0)
 
+    def update_indexed_texture(self, texture, data):
+        """Upload a color indexed image of shape (h, w) as a single channel
+        texture, a quarter of the size of the RGBA equivalent. The shader
+        converts the index to a color using the palette texture.
+        """
+        log.debug("update_indexed_texture: texture=%d, shape=%s" % (texture, data.shape))
+        gl.glBindTexture(gl.GL_TEXTURE_2D, texture)
+        h, w = data.shape
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_LUMINANCE, w, h, 0,
+            gl.GL_LUMINANCE, gl.GL_UNSIGNED_BYTE, data)
+
     def set_palette_data(self, data):
         self.palette_data = data
         if self.finished_init:
@@ -400,6 +416,8 @@ class GLSLTextureCanvas(object):
 
 
 class LegacyTextureCanvas(GLSLTextureCanvas):
+    uses_palette_shader = False
+
     def init_shader(self):
         pass
 
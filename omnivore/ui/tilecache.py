@@ -0,0 +1,85 @@
+"""Backing store of rendered tiles for the bitmap and character grids
+
+Rendering the visible part of a grid and converting it to a bitmap is the
+expensive part of a repaint, but an edit, caret move or selection change
+only touches a few bytes. The grid is divided into tiles of a fixed number
+of rows and columns, and each rendered tile is kept along with a copy of
+the data and style bytes it was rendered from. A tile is only rendered
+again when those bytes differ, which covers changes from commands, the
+emulator and selections alike without having to track where they came from.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class TileCache:
+    """LRU cache of rendered tiles, keyed by the row and column of the
+    upper left cell of the tile.
+
+    Anything else that affects the rendered image (renderer, zoom, colors,
+    font) should be passed to `check_state`, which discards all tiles when
+    it changes.
+    """
+    def __init__(self, tile_rows=16, tile_cols=16, max_tiles=1024):
+        self.tile_rows = tile_rows
+        self.tile_cols = tile_cols
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.state = None
+        self.num_rendered = 0
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def clear(self):
+        self.tiles.clear()
+
+    def check_state(self, state):
+        if state != self.state:
+            self.tiles.clear()
+            self.state = state
+
+    def iter_tiles(self, first_row, last_row, first_col, last_col, min_row, max_row, max_col):
+        """Yield (first_row, last_row, first_col, last_col) of each tile
+        overlapping the given cells.
+
+        Tiles are aligned to multiples of the tile size and clipped to the
+        rows between `min_row` and `max_row` and the columns before
+        `max_col`, so a tile always covers the same cells no matter where
+        the viewport is.
+        """
+        first_row = max(first_row, min_row)
+        last_row = min(last_row, max_row)
+        last_col = min(last_col, max_col)
+        tr = self.tile_rows
+        tc = self.tile_cols
+        for r in range(first_row - first_row % tr, last_row, tr):
+            r0 = max(r, min_row)
+            r1 = min(r + tr, max_row)
+            for c in range(first_col - first_col % tc, last_col, tc):
+                yield r0, r1, c, min(c + tc, max_col)
+
+    def get(self, key, data, style, render):
+        """Return the tile rendered from the 2D arrays `data` and `style`,
+        calling `render(data, style)` if the tile isn't in the cache or the
+        bytes have changed since it was rendered.
+        """
+        try:
+            old_data, old_style, item = self.tiles[key]
+        except KeyError:
+            pass
+        else:
+            if np.array_equal(old_data, data) and np.array_equal(old_style, style):
+                self.tiles.move_to_end(key)
+                return item
+        item = render(data, style)
+        self.num_rendered += 1
+        self.tiles[key] = (data.copy(), style.copy(), item)
+        self.tiles.move_to_end(key)
+        while len(self.tiles) > self.max_tiles:
+            self.tiles.popitem(last=False)
+        return item
@@ -5,10 +5,11 @@ import wx
 
 from traits.api import on_trait_change, Bool, Undefined
 
-from omnivore_framework.utils.nputil import intscale
 from omnivore_framework.utils.wx import compactgrid as cg
 
+from ..ui.intscale import intscale
 from ..ui.segment_grid import SegmentGridControl, SegmentTable
+from ..ui.tilecache import TileCache
 
 from . import SegmentViewer
 from . import actions as va
@@ -41,6 +42,7 @@ class BitmapLineRenderer(cg.TableLineRenderer):
         image_cache = BitmapImageCache()
         w, h = self.calc_cell_size_in_pixels(grid_control)
         cg.LineRenderer.__init__(self, grid_control, w, h, grid_control.items_per_row, image_cache)
+        self.tile_cache = TileCache()
 
     def calc_cell_size_in_pixels(self, grid_control):
         w = grid_control.zoom_w * grid_control.scale_width * grid_control.pixels_per_byte
@@ -102,30 +104,39 @@ class BitmapLineRenderer(cg.TableLineRenderer):
             last_row -= 1
 
         # If there are any more rows to display, they will be full-width rows;
-        # i.e. the data is in a rectangular grid
-        nr = last_row - first_row
-        if nr > 0:
+        # i.e. the data is in a rectangular grid. These are drawn from the
+        # tile cache, so only tiles whose bytes have changed are rendered.
+        if last_row > first_row:
             bytes_per_row = self.calc_bytes_per_row(t)
-            nc = last_col - first_col
             offset = t.start_offset % bytes_per_row
-            first_index = (first_row * bytes_per_row) - offset
-            last_index = (last_row * bytes_per_row) - offset
-            log.debug(f"drawing rectangular grid: bpr={bytes_per_row}, first,last={first_index},{last_index}, nr={nr}, start_offset={offset}")
-            data = t.data[first_index:last_index].reshape((nr, bytes_per_row))[0:nr,first_col:last_col].flatten()
-            style = t.style[first_index:last_index].reshape((nr, bytes_per_row))[0:nr,first_col:last_col].flatten()
-
-            # get_image(cls, machine, antic_font, byte_values, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
-
-            array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, nc, nr, nc * nr, data, style)
-            width = array.shape[1]
-            height = array.shape[0]
-            if width > 0 and height > 0:
-                array = intscale(array, grid_control.zoom_h, grid_control.zoom_w)
-                #print("bitmap: %d,%d,3 after scaling: %s" % (height, width, str(array.shape)))
-                image = wx.Image(array.shape[1], array.shape[0])
-                image.SetData(array.tobytes())
-                bmp = wx.Bitmap(image)
-                dc.DrawBitmap(bmp, frame_rect.x, frame_rect.y)
+            tiles = self.tile_cache
+            tiles.check_state((grid_control.bitmap_renderer, grid_control.zoom_w, grid_control.zoom_h, bytes_per_row, offset, t.num_rows))
+            render = lambda data, style: self.render_tile(grid_control, data, style)
+            for r0, r1, c0, c1 in tiles.iter_tiles(first_row, last_row, first_col, last_col, 1, t.num_rows - 1, bytes_per_row):
+                first_index = (r0 * bytes_per_row) - offset
+                last_index = (r1 * bytes_per_row) - offset
+                data = t.data[first_index:last_index].reshape((r1 - r0, bytes_per_row))[:,c0:c1]
+                style = t.style[first_index:last_index].reshape((r1 - r0, bytes_per_row))[:,c0:c1]
+                bmp = tiles.get((r0, c0), data, style, render)
+                if bmp is not None:
+                    rect = self.col_to_rect(r0, c0)
+                    dc.DrawBitmap(bmp, rect.x, rect.y)
+
+    def render_tile(self, grid_control, data, style):
+        nr, nc = data.shape
+        log.debug(f"rendering tile: nr={nr}, nc={nc}")
+
+        # get_image(cls, machine, antic_font, byte_values, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
+
+        array = grid_control.bitmap_renderer.get_image(grid_control.segment_viewer, nc, nr, nc * nr, data.flatten(), style.flatten())
+        width = array.shape[1]
+        height = array.shape[0]
+        if width > 0 and height > 0:
+            array = intscale(array, grid_control.zoom_h, grid_control.zoom_w)
+            image = wx.Image(array.shape[1], array.shape[0])
+            image.SetData(array.tobytes())
+            return wx.Bitmap(image)
+        return None
 
 
 class BitmapGridControl(SegmentGridControl):
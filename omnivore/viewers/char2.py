@@ -6,10 +6,11 @@ import numpy as np
 
 from traits.api import on_trait_change, Bool, Undefined
 
-from omnivore_framework.utils.nputil import intscale
 from omnivore_framework.utils.wx import compactgrid as cg
 
+from ..ui.intscale import intscale
 from ..ui.segment_grid import SegmentGridControl, SegmentTable
+from ..ui.tilecache import TileCache
 
 from . import SegmentViewer
 
@@ -44,6 +45,7 @@ class AnticCharRenderer(cg.TableLineRenderer):
         w = parent.font_renderer.char_bit_width * parent.zoom_w
         h = parent.font_renderer.char_bit_height * parent.zoom_h
         cg.LineRenderer.__init__(self, parent, w, h, parent.items_per_row, image_cache)
+        self.tile_cache = TileCache()
 
     # BaseLineRenderer interface
 
@@ -96,36 +98,49 @@ class AnticCharRenderer(cg.TableLineRenderer):
                 self.draw_line(grid_control, dc, last_row - 1, col, index, last_index)
             last_row -= 1
 
-        bytes_per_row = t.items_per_row
-        nr = last_row - first_row
-        nc = last_col - first_col
-        first_index = (first_row * bytes_per_row) - t.start_offset
-        last_index = (last_row * bytes_per_row) - t.start_offset
-        t = t
-        if last_index > len(t.data):
-            last_index = len(t.data)
-            data = np.zeros((nr * bytes_per_row), dtype=np.uint8)
-            data[0:last_index - first_index] = t.data[first_index:last_index]
-            style = np.zeros((nr * bytes_per_row), dtype=np.uint8)
-            style[0:last_index - first_index] = t.style[first_index:last_index]
-        else:
-            data = t.data[first_index:last_index]
-            style = t.style[first_index:last_index]
-        data = data.reshape((nr, -1))
-        style = style.reshape((nr, -1))
+        # Remaining rows are full-width and are drawn from the tile cache, so
+        # only tiles whose bytes have changed are rendered
+        if last_row > first_row:
+            bytes_per_row = t.items_per_row
+            v = grid_control.segment_viewer
+            tiles = self.tile_cache
+            tiles.check_state((v.current_antic_font, grid_control.font_renderer, v.machine.font_mapping, grid_control.zoom_w, grid_control.zoom_h, bytes_per_row, t.start_offset, t.num_rows))
+            render = lambda data, style: self.render_tile(grid_control, data, style)
+            for r0, r1, c0, c1 in tiles.iter_tiles(first_row, last_row, first_col, last_col, 1, t.num_rows - 1, bytes_per_row):
+                first_index = (r0 * bytes_per_row) - t.start_offset
+                last_index = (r1 * bytes_per_row) - t.start_offset
+                if last_index > len(t.data):
+                    last_index = len(t.data)
+                    data = np.zeros(((r1 - r0) * bytes_per_row), dtype=np.uint8)
+                    data[0:last_index - first_index] = t.data[first_index:last_index]
+                    style = np.zeros(((r1 - r0) * bytes_per_row), dtype=np.uint8)
+                    style[0:last_index - first_index] = t.style[first_index:last_index]
+                else:
+                    data = t.data[first_index:last_index]
+                    style = t.style[first_index:last_index]
+                data = data.reshape((r1 - r0, -1))[:,c0:c1]
+                style = style.reshape((r1 - r0, -1))[:,c0:c1]
+                bmp = tiles.get((r0, c0), data, style, render)
+                if bmp is not None:
+                    rect = self.col_to_rect(r0, c0)
+                    dc.DrawBitmap(bmp, rect.x, rect.y)
+
+    def render_tile(self, grid_control, data, style):
+        nr, nc = data.shape
+        data = np.ascontiguousarray(data)
+        style = np.ascontiguousarray(style)
 
         # get_image(cls, machine, antic_font, byte_values, style, start_byte, end_byte, bytes_per_row, nr, start_col, visible_cols):
 
-        array = grid_control.font_renderer.get_image(grid_control.segment_viewer, grid_control.segment_viewer.current_antic_font, data, style, first_index, last_index, bytes_per_row, nr, first_col, nc)
+        array = grid_control.font_renderer.get_image(grid_control.segment_viewer, grid_control.segment_viewer.current_antic_font, data, style, 0, nr * nc, nc, nr, 0, nc)
         width = array.shape[1]
         height = array.shape[0]
         if width > 0 and height > 0:
             array = intscale(array, grid_control.zoom_h, grid_control.zoom_w)
-            #print("bitmap: %d,%d,3 after scaling: %s" % (height, width, str(array.shape)))
             image = wx.Image(array.shape[1], array.shape[0])
             image.SetData(array.tobytes())
-            bmp = wx.Bitmap(image)
-            dc.DrawBitmap(bmp, frame_rect.x, frame_rect.y)
+            return wx.Bitmap(image)
+        return None
 
 
 class CharGridControl(SegmentGridControl):
@@ -9,6 +9,7 @@ from traits.api import on_trait_change, Bool, Undefined, Any, Instance
 
 from atrcopy import DefaultSegment, not_user_bit_mask
 from ..disassembler import DisassemblyConfig, flags
+from ..disassembler.worker import DisassemblyWorker, SegmentSnapshot
 
 from omnivore_framework.utils.wx import compactgrid as cg
 from ..byte_edit.linked_base import VirtualTableLinkedBase
@@ -44,6 +45,11 @@ class DisassemblyTable(cg.HexTable):
         cg.HexTable.__init__(self, s.data, s.style, len(self.column_labels), s.origin)
 
         self.max_num_entries = 80000
+        self.text_output = None
+        self.current = None
+        self.snapshot = None
+        self.worker = DisassemblyWorker(wx.CallAfter)
+        self.rebuild_callback = None
         self.rebuild()
 
     def calc_num_rows(self):
@@ -93,7 +99,7 @@ class DisassemblyTable(cg.HexTable):
                 if t is None:
                     text = ""
                 else:
-                    text = t[row - t.start_index]
+                    text = t.get_str(row - t.start_index)
             elif col == 0:
                 addr = e[row]['pc']
                 has_label = p.jmp_targets[addr]
@@ -120,27 +126,84 @@ class DisassemblyTable(cg.HexTable):
         return text, style
 
     def prepare_for_drawing(self, start_row, visible_rows, start_cell, visible_cells):
-        self.parsed = self.current.stringify(start_row, visible_rows, labels1.labels)
+        # the text buffers are reused on every repaint instead of reallocated
+        self.parsed = self.current.stringify(start_row, visible_rows, labels1.labels, output=self.text_output)
+        self.text_output = self.parsed
+
+    def find_changed_range(self, snapshot):
+        """Return the start and end index of the bytes whose values or
+        styles differ from the last parse, or None if the segment itself
+        has changed.
+        """
+        old = self.snapshot
+        if old is None or snapshot.segment is not old.segment or len(snapshot) != len(old) or snapshot.origin != old.origin:
+            return None
+        changed = np.flatnonzero((snapshot.data != old.data) | (snapshot.style != old.style))
+        if len(changed) == 0:
+            return 0, 0
+        return int(changed[0]), int(changed[-1]) + 1
+
+    def parse(self, snapshot):
+        return self.driver.parse_parallel(snapshot, self.max_num_entries)
+
+    def rebuild(self, background=False):
+        """Update the disassembly to match the segment.
+
+        Small changes are disassembled immediately. A full disassembly is
+        run on the worker thread if `background` is True, in which case the
+        previous disassembly is shown until the new one is ready, and then
+        `rebuild_callback` is called.
+        """
+        snapshot = SegmentSnapshot(self.linked_base.segment)
+        if not self.worker.is_busy:
+            # comparing against the last parse finds the edited range no
+            # matter which segment the change was made through
+            changed = self.find_changed_range(snapshot)
+            if changed is not None:
+                if changed[0] == changed[1] or self.driver.reparse(self.current, snapshot.data, snapshot.style, *changed):
+                    self.set_current(snapshot, self.current)
+                    return
+        if background and self.current is not None:
+            # replaces any parse of an older version of the segment
+            self.worker.submit(self.parse, lambda parsed: self.background_rebuild_finished(snapshot, parsed), snapshot)
+        else:
+            self.worker.cancel()
+            self.set_current(snapshot, self.parse(snapshot))
 
-    def rebuild(self):
-        segment = self.linked_base.segment
-        self.current = self.driver.parse(segment, self.max_num_entries)
+    def set_current(self, snapshot, current):
+        self.snapshot = snapshot
+        self.current = current
         self.parsed = None
         self.init_boundaries()
-        print(f"new num_rows: {self.num_rows}")
+
+    def background_rebuild_finished(self, snapshot, current):
+        self.set_current(snapshot, current)
+        if self.rebuild_callback is not None:
+            self.rebuild_callback()
+
+    def shutdown(self):
+        # the worker thread would otherwise keep this table and its last
+        # disassembly alive after the control is gone
+        self.worker.shutdown()
+        self.rebuild_callback = None
 
 
 class DisassemblyControl(SegmentGridControl):
     default_table_cls = DisassemblyTable
 
     def calc_default_table(self, linked_base):
-        return self.default_table_cls(linked_base)
+        table = self.default_table_cls(linked_base)
+        table.rebuild_callback = self.background_rebuild_finished
+        return table
 
     def calc_line_renderer(self):
         return cg.VirtualTableLineRenderer(self, 2, widths=self.default_table_cls.column_sizes, col_labels=self.default_table_cls.column_labels)
 
     def recalc_view(self):
-        self.table.rebuild()
+        self.table.rebuild(background=True)
+        cg.CompactGrid.recalc_view(self)
+
+    def background_rebuild_finished(self):
         cg.CompactGrid.recalc_view(self)
 
 
@@ -161,11 +224,17 @@ class DisassemblyViewer(SegmentViewer):
     def table(self):
         return self.control.table
 
+    # cleanup
+
+    def prepare_for_destroy(self):
+        self.table.shutdown()
+        SegmentViewer.prepare_for_destroy(self)
+
     def refresh_view_for_value_change(self, flags):
-        self.table.rebuild()
+        self.table.rebuild(background=True)
 
     def refresh_view_for_style_change(self, flags):
-        self.table.rebuild()
+        self.table.rebuild(background=True)
 
     def recalc_data_model(self):
         self.table.rebuild()
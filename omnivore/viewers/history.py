@@ -11,6 +11,7 @@ from atrcopy import DefaultSegment
 
 from ..disassembler import flags
 from ..disassembler import dtypes as dd
+from ..disassembler.textcache import StringifiedHistoryCache
 
 from omnivore_framework.utils.wx import compactgrid as cg
 from ..byte_edit.linked_base import VirtualTableLinkedBase
@@ -35,6 +36,8 @@ class InstructionHistoryTable(cg.VirtualTable):
         self.history_entries = None
         self.visible_history_start_row = 0
         self.visible_history_lookup_table = None
+        self.parsed = None
+        self.text_cache = StringifiedHistoryCache()
         cg.VirtualTable.__init__(self, len(self.column_labels), s.origin)
 
     def calc_num_rows(self):
@@ -49,7 +52,7 @@ class InstructionHistoryTable(cg.VirtualTable):
             return "----"
         try:
             emu = self.virtual_linked_base.emulator
-            return "%04x" % (emu.cpu_history[row][0])
+            return "%04x" % (emu.get_cpu_history_entry(row)[0])
         except IndexError:
             return "----"
 
@@ -57,7 +60,7 @@ class InstructionHistoryTable(cg.VirtualTable):
         last_line = min(start_line + num_lines, self.num_rows)
         emu = self.virtual_linked_base.emulator
         for line in range(start_line, last_line, step):
-            h = emu.cpu_history[line]
+            h = emu.get_cpu_history_entry(line)
             t = h['disassembler_type']
             if t == flags.DISASM_NEXT_INSTRUCTION:
                 h = h.view(dtype=dd.HISTORY_BREAKPOINT_DTYPE)
@@ -75,7 +78,7 @@ class InstructionHistoryTable(cg.VirtualTable):
                 f = h['frame_number']
                 yield "f%d" % (f)
             else:
-                yield "%d" % (emu.cpu_history[line][0])
+                yield "%d" % (emu.get_cpu_history_entry(line)[0])
 
     def calc_row_label_width(self, view_params):
         return view_params.calc_text_width("256 256")
@@ -96,7 +99,13 @@ class InstructionHistoryTable(cg.VirtualTable):
     def prepare_for_drawing(self, start_row, visible_rows, start_cell, visible_cells):
         emu = self.virtual_linked_base.emulator
         self.visible_history_start_row = start_row
-        self.parsed = emu.calc_stringified_history(start_row, visible_rows)
+        num_rows = emu.num_cpu_history_entries
+        visible_rows = max(0, min(visible_rows, num_rows - start_row))
+        # the last entry may be the next instruction, which is reused for
+        # the instruction that actually gets executed
+        volatile = 1 if start_row + visible_rows >= num_rows else 0
+        stringify = lambda offset, count: emu.calc_stringified_history(start_row + offset, count).iter_str()
+        self.parsed = self.text_cache.get(emu.cpu_history_generation, emu.calc_cpu_history_entry_id(start_row), visible_rows, stringify, volatile)
 
     @property
     def needs_rebuild(self):
@@ -107,7 +116,7 @@ class InstructionHistoryTable(cg.VirtualTable):
     def rebuild(self):
         v = self.virtual_linked_base
         emu = v.emulator
-        self.current_num_rows = len(emu.cpu_history)
+        self.current_num_rows = emu.num_cpu_history_entries
         segment = DefaultSegment(emu.cpu_history.entries.view(np.uint8))
         v.segment = segment
         print("CPU HISTORY ENTRIES", self.current_num_rows)
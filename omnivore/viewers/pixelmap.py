@@ -6,9 +6,9 @@ import wx
 from traits.api import on_trait_change, Bool, Undefined
 from atrcopy import selected_bit_mask
 
-from omnivore_framework.utils.nputil import intscale
 from omnivore_framework.utils.wx import compactgrid as cg
 
+from ..ui.intscale import intscale
 from ..ui.segment_grid import SegmentGridControl, SegmentTable
 
 from . import SegmentViewer
@@ -1,12 +1,15 @@
 import sys
 sys.path[0:0] = [".."]
 import json
+import os
+import tempfile
 
 import pytest
 
 import numpy as np
 
 import omnivore
+from omnivore.emulator.save_state import ContainerReader, ContainerWriter
 
 
 def compare(array1, array2, name="output"):
@@ -151,6 +154,95 @@ class Test6502(object):
         assert(cycles2a == emu.cycles_since_power_on)
         compare(output2, output2a)
 
+    def test_restore_from_container(self):
+        # same steps as EmulatorDocument saving to and restoring from a
+        # save state container
+        emu = self.emu
+        while emu.current_frame_number < 50:
+            emu.next_frame()
+            emu.save_history()
+        output1 = emu.calc_current_state()
+        cycles1 = emu.cycles_since_power_on
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "test.omniemu-state")
+            with ContainerWriter(path) as container:
+                container.header['frame_history'] = emu.frame_history.serialize_to_container(container)
+                container.header['current_frame'] = container.add_state(emu.serialize_to_dict())
+            while emu.current_frame_number < 100:
+                emu.next_frame()
+            output2 = emu.calc_current_state()
+
+            container = ContainerReader(path)
+            emu.frame_history.restore_from_container(container, container.header['frame_history'])
+            emu.configure_io_arrays()
+            emu.restore_from_dict(container.get_state(container.header['current_frame'], writable=True))
+            assert emu.current_frame_number == 50
+            assert cycles1 == emu.cycles_since_power_on
+            compare(output1, emu.calc_current_state(), 'output1 - restored')
+
+            # the restored emulator keeps running as before
+            while emu.current_frame_number < 100:
+                emu.next_frame()
+            compare(output2, emu.calc_current_state(), 'output2 - continued')
+
+            # frames restored from the history are writable copies too
+            emu.restore_history(40)
+            assert emu.current_frame_number == 40
+            del container
+
+    def test_profile_heat_map(self):
+        # the heat map is kept outside of the save state so it doesn't make
+        # every saved frame bigger
+        emu = self.emu
+        size = emu.output_raw.nbytes
+        emu.start_profiling()
+        emu.run_frames(5)
+        assert emu.profile_heat.max() == 255
+        assert not np.shares_memory(emu.profile_heat, emu.output_raw)
+        assert emu.calc_current_state().nbytes == size
+        emu.stop_profiling()
+        assert emu.profile_heat.max() == 0
+
+    def test_run_frames(self):
+        emu = self.emu
+        state0 = emu.calc_current_state()
+        for i in range(20):
+            emu.next_frame()
+        output1 = emu.calc_current_state()
+        cycles1 = emu.cycles_since_power_on
+
+        emu.restore_state(state0)
+        count, bp, kept = emu.run_frames(20, keep_frames=[5, 20])
+        assert count == 20
+        assert bp is None
+        assert sorted(kept.keys()) == [5, 20]
+        assert(cycles1 == emu.cycles_since_power_on)
+        compare(output1, kept[20], 'output1 - kept[20]')
+
+    def test_run_frames_until(self):
+        emu = self.emu
+        start = emu.cycles_since_power_on
+        count, bp, kept = emu.run_frames(100, until=lambda e: e.cycles_since_power_on - start > 50000)
+        assert count < 100
+        assert bp is None
+        assert kept == {}
+
+    def test_run_frames_count_frames_breakpoint(self):
+        # the frame count breakpoint fires after its frame has finished, so
+        # that frame must still be counted and its frame events processed
+        emu = self.emu
+        events = []
+        start = emu.current_frame_number
+        frame_count = emu.frame_count
+        emu.frame_event.append((frame_count + 5, lambda: events.append(emu.frame_count)))
+        emu.count_frames(5)
+        count, bp, kept = emu.run_frames(20)
+        assert bp is not None and bp.id == 0
+        assert count == 5
+        assert emu.current_frame_number == start + 5
+        assert emu.frame_count == frame_count + 5
+        assert events == [frame_count + 5]
+
 class TestAtari800(Test6502):
     emu_name = "atari800"
     emu = omnivore.find_emulator(emu_name)()
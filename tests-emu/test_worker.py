@@ -0,0 +1,44 @@
+import sys
+sys.path[0:0] = [".."]
+
+import pytest
+
+import numpy as np
+
+from omnivore.emulator.worker import EmulatorWorker, next_frame_all
+
+
+class TestWorker(object):
+    def setup_method(self):
+        self.workers = [EmulatorWorker('6502') for i in range(3)]
+        for w in self.workers:
+            w.start()
+
+    def teardown_method(self):
+        for w in self.workers:
+            w.shutdown()
+
+    def test_parallel_frames(self):
+        for i in range(10):
+            breakpoints = next_frame_all(self.workers)
+            assert breakpoints == [None, None, None]
+        for w in self.workers:
+            assert w.emulator.current_frame_number == 10
+        first = self.workers[0].emulator.main_memory
+        for w in self.workers[1:]:
+            assert np.array_equal(first, w.emulator.main_memory)
+
+    def test_breakpoint(self):
+        w = self.workers[0]
+        b = w.emulator.create_breakpoint(0xf002)
+        bp = w.next_frame()
+        assert bp is not None
+        assert bp.id == b.id
+        assert w.emulator.program_counter == 0xf002
+
+
+if __name__ == "__main__":
+    t = TestWorker()
+    t.setup_method()
+    t.test_parallel_frames()
+    t.teardown_method()
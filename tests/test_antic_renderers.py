@@ -0,0 +1,115 @@
+import numpy as np
+
+from atrcopy import user_bit_mask, diff_bit_mask, match_bit_mask, comment_bit_mask, selected_bit_mask
+
+from omnivore.arch import antic_renderers
+
+
+class MockColor(object):
+    def __init__(self, rgb):
+        self.rgb = rgb
+
+    def Get(self, include_alpha):
+        return self.rgb
+
+
+class MockPreferences(object):
+    background_color = (255, 255, 255)
+    data_background_color = (224, 255, 224)
+    highlight_background_color = (100, 100, 255)
+    match_background_color = (255, 255, 100)
+    comment_background_color = (100, 255, 100)
+    empty_background_color = MockColor((128, 64, 32))
+
+
+class MockMachine(object):
+    color_registers = [(16 * i, 128, 255 - 16 * i) for i in range(16)]
+
+
+class MockSegmentViewer(object):
+    preferences = MockPreferences()
+    machine = MockMachine()
+
+
+class TestBitmapRenderers(object):
+    def setup_method(self):
+        self.viewer = MockSegmentViewer()
+        self.bytes_per_row = 4
+        self.nr = 12
+        self.count = 41
+        num_bytes = self.bytes_per_row * self.nr
+        self.byte_values = np.arange(0, num_bytes * 37, 37, dtype=np.int64).astype(np.uint8)
+        styles = [
+            0,
+            diff_bit_mask,
+            1,
+            user_bit_mask,
+            comment_bit_mask,
+            comment_bit_mask | 1,
+            match_bit_mask,
+            match_bit_mask | comment_bit_mask | 2,
+            selected_bit_mask,
+            selected_bit_mask | match_bit_mask,
+            selected_bit_mask | match_bit_mask | comment_bit_mask | diff_bit_mask | 3,
+        ]
+        self.style = np.resize(np.asarray(styles, dtype=np.uint8), num_bytes)
+
+    def expected_color_set(self, colors, style):
+        # highest priority first
+        color_registers, h_colors, m_colors, c_colors, d_colors = colors
+        if style & selected_bit_mask:
+            c = h_colors
+        elif style & match_bit_mask:
+            c = m_colors
+        elif style & comment_bit_mask:
+            c = c_colors
+        elif style & user_bit_mask:
+            c = d_colors
+        else:
+            c = color_registers
+        return np.asarray(c, dtype=np.float64).astype(np.uint8)
+
+    def check_image(self, renderer, registers, bits_per_pixel):
+        colors = renderer.calc_blended_colors(self.viewer, registers)
+        image = renderer.get_image(self.viewer, self.bytes_per_row, self.nr, self.count, self.byte_values, self.style)
+        pixels_per_byte = 8 // bits_per_pixel
+        assert image.shape == (self.nr, self.bytes_per_row * pixels_per_byte, 3)
+        image = image.reshape((-1, pixels_per_byte, 3))
+        empty = self.viewer.preferences.empty_background_color.Get(False)
+        mask = (1 << bits_per_pixel) - 1
+        for i, (value, style) in enumerate(zip(self.byte_values, self.style)):
+            color_set = self.expected_color_set(colors, style)
+            for j in range(pixels_per_byte):
+                if i < self.count:
+                    expected = color_set[(value >> (8 - bits_per_pixel * (j + 1))) & mask]
+                else:
+                    expected = empty
+                assert tuple(image[i, j]) == tuple(expected)
+
+    def test_1bpp(self):
+        renderer = antic_renderers.OneBitPerPixelB()
+        self.check_image(renderer, renderer.get_bw_colors(self.viewer), 1)
+
+    def test_2bpp(self):
+        registers = self.viewer.machine.color_registers[0:4]
+        self.check_image(antic_renderers.TwoBitsPerPixel(), registers, 2)
+
+    def test_4bpp(self):
+        registers = self.viewer.machine.color_registers
+        self.check_image(antic_renderers.FourBitsPerPixel(), registers, 4)
+
+    def test_style_classes(self):
+        classes = antic_renderers.style_classes[self.style[:11]]
+        assert list(classes) == [
+            antic_renderers.NORMAL_STYLE,
+            antic_renderers.NORMAL_STYLE,
+            antic_renderers.DATA_STYLE,
+            antic_renderers.DATA_STYLE,
+            antic_renderers.COMMENT_STYLE,
+            antic_renderers.COMMENT_STYLE,
+            antic_renderers.MATCH_STYLE,
+            antic_renderers.MATCH_STYLE,
+            antic_renderers.SELECTED_STYLE,
+            antic_renderers.SELECTED_STYLE,
+            antic_renderers.SELECTED_STYLE,
+        ]
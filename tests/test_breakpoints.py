@@ -0,0 +1,68 @@
+import numpy as np
+
+from omnivore.debugger import dtypes as dd
+from omnivore.debugger.debugger import Debugger, check_tokens
+
+
+class TestCompileBreakpoints(object):
+    def setup_method(self):
+        self.debugger = Debugger()
+        self.c = self.debugger.debug_cmd[0]
+
+    def pc_bit(self, addr):
+        return bool(self.c['pc_bitmap'][addr >> 3] & (1 << (addr & 7)))
+
+    def test_address(self):
+        b1 = self.debugger.create_breakpoint(0xdada)
+        b2 = self.debugger.create_breakpoint(0x0601)
+        assert b1.address == 0xdada
+        assert self.c['num_address_breakpoints'] == 2
+        assert self.c['num_conditional_breakpoints'] == 0
+        assert list(self.c['address_breakpoint_ids'][:2]) == [b1.id, b2.id]
+        assert self.pc_bit(0xdada)
+        assert self.pc_bit(0x0601)
+        assert not self.pc_bit(0x0600)
+        assert np.count_nonzero(np.unpackbits(self.c['pc_bitmap'])) == 2
+
+        b1.disable()
+        assert self.c['num_address_breakpoints'] == 1
+        assert not self.pc_bit(0xdada)
+        self.debugger.clear_all_breakpoints()
+        assert self.c['num_address_breakpoints'] == 0
+        assert not self.pc_bit(0x0601)
+
+    def test_conditional(self):
+        b = self.debugger.create_breakpoint()
+        b.terms = (dd.REG_A, dd.NUMBER, 0x10, dd.OP_LT, dd.REG_X, dd.OP_LOGICAL_NOT, dd.OP_LOGICAL_AND, dd.END_OF_LIST)
+        b.enable()
+        assert b.address is None
+        assert self.c['num_conditional_breakpoints'] == 1
+        assert self.c['conditional_breakpoint_ids'][0] == b.id
+        assert b.enabled
+
+    def test_errors(self):
+        assert check_tokens([dd.REG_A, dd.NUMBER, 5, dd.OP_RSHIFT, dd.OP_UMINUS, dd.END_OF_LIST]) == dd.BREAKPOINT_ENABLED
+        assert check_tokens([dd.REG_A, dd.OP_PLUS, dd.END_OF_LIST]) == dd.STACK_UNDERFLOW
+        assert check_tokens([dd.REG_A, dd.REG_X, dd.END_OF_LIST]) == dd.STACK_OVERFLOW
+        assert check_tokens([dd.REG_A, 0x2fff, dd.END_OF_LIST]) == dd.EVALUATION_ERROR
+        assert check_tokens([dd.REG_A]) == dd.EVALUATION_ERROR
+
+        b = self.debugger.create_breakpoint()
+        b.terms = (dd.REG_A, dd.OP_EQ, dd.END_OF_LIST)
+        b.enable()
+        assert b.status == dd.STACK_UNDERFLOW
+        assert b.had_error
+        assert self.c['num_conditional_breakpoints'] == 0
+
+    def test_watch(self):
+        b1 = self.debugger.create_watchpoint(0xd40a, write=True)
+        b2 = self.debugger.create_watchpoint(0x0080)
+        b3 = self.debugger.create_breakpoint(0x0080)
+        assert self.c['num_watch_breakpoints'] == 2
+        assert list(self.c['watch_breakpoint_ids'][:2]) == [b1.id, b2.id]
+        assert np.flatnonzero(np.unpackbits(self.c['write_bitmap'], bitorder='little')).tolist() == [0xd40a]
+        assert np.flatnonzero(np.unpackbits(self.c['read_bitmap'], bitorder='little')).tolist() == [0x0080]
+        assert np.flatnonzero(np.unpackbits(self.c['pc_bitmap'], bitorder='little')).tolist() == [0x0080]
+        b1.clear()
+        assert self.c['num_watch_breakpoints'] == 1
+        assert not self.c['write_bitmap'].any()
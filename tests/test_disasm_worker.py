@@ -0,0 +1,74 @@
+import gc
+import queue
+import threading
+import weakref
+
+import pytest
+
+from omnivore.disassembler.worker import DisassemblyWorker
+
+
+class TestDisassemblyWorker(object):
+    def setup_method(self):
+        self.delivered = queue.Queue()
+        self.worker = DisassemblyWorker(self.deliver)
+        self.results = []
+
+    def deliver(self, func, *args):
+        self.delivered.put((func, args))
+
+    def process_deliveries(self):
+        # stale results may be delivered before being discarded
+        while self.worker.is_busy:
+            func, args = self.delivered.get(timeout=5)
+            func(*args)
+
+    def test_stale_jobs(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow(value):
+            started.set()
+            release.wait(5)
+            return value
+
+        w = self.worker
+        w.submit(slow, self.results.append, "first")
+        started.wait(5)
+        # replaces the running job and is itself replaced before it starts
+        w.submit(str.upper, self.results.append, "second")
+        w.submit(str.upper, self.results.append, "third")
+        assert w.is_busy
+        release.set()
+        self.process_deliveries()
+        assert self.results == ["THIRD"]
+        assert not w.is_busy
+
+    def test_cancel(self):
+        w = self.worker
+        w.submit(str.upper, self.results.append, "first")
+        w.cancel()
+        assert not w.is_busy
+        w.submit(str.upper, self.results.append, "second")
+        self.process_deliveries()
+        assert self.results == ["SECOND"]
+
+    def test_shutdown(self):
+        class Result(object):
+            pass
+
+        w = self.worker
+        w.submit(lambda: Result(), self.results.append)
+        self.process_deliveries()
+        result = weakref.ref(self.results.pop())
+        gc.collect()
+        # the idle thread doesn't keep the last result alive
+        assert result() is None
+
+        thread = w.thread
+        w.shutdown()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert not w.is_busy
+        with pytest.raises(RuntimeError):
+            w.submit(str.upper, self.results.append, "first")
@@ -0,0 +1,278 @@
+import gc
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+from omnivore.emulator.save_state import FrameHistory, ContainerReader, ContainerWriter
+from omnivore.emulator.save_state.delta import FrameDelta
+from omnivore.errors import InvalidSaveStateError
+
+
+def make_frames(count, size=4096, seed=1234):
+    # frames that change a little bit from one to the next, like an emulator
+    rng = np.random.RandomState(seed)
+    frames = []
+    data = rng.randint(0, 256, size).astype(np.uint8)
+    for i in range(count):
+        data = data.copy()
+        changes = rng.randint(0, size, 20)
+        data[changes] = rng.randint(0, 256, len(changes))
+        data[i % size] = i & 0xff
+        frames.append(data)
+    return frames
+
+
+class TestFrameDelta(object):
+    def test_apply(self):
+        before, after = make_frames(2)
+        d = FrameDelta.from_frames(0, before, after)
+        assert d.nbytes < before.nbytes
+        data = before.copy()
+        d.apply(data)
+        assert np.array_equal(data, after)
+        d.apply(data)
+        assert np.array_equal(data, before)
+
+    def test_merge(self):
+        f0, f1, f2 = make_frames(3)
+        d = FrameDelta.from_frames(0, f0, f1).merge(FrameDelta.from_frames(1, f1, f2))
+        assert d.previous == 0
+        data = f0.copy()
+        d.apply(data)
+        assert np.array_equal(data, f2)
+
+    def test_empty(self):
+        f0 = make_frames(1)[0]
+        d = FrameDelta.from_frames(0, f0, f0)
+        data = f0.copy()
+        d.apply(data)
+        assert np.array_equal(data, f0)
+
+
+class TestFrameHistory(object):
+    def setup_method(self):
+        self.frames = make_frames(100)
+        self.h = FrameHistory()
+        for i, f in enumerate(self.frames):
+            self.h.save_frame(i * 10, f)
+
+    def test_get_frame(self):
+        h = self.h
+        assert len(h) == 100
+        assert h.total_bytes < sum(f.nbytes for f in self.frames) / 4
+        for i, f in enumerate(self.frames):
+            assert np.array_equal(h.get_frame(i * 10), f)
+            assert np.array_equal(h[i * 10], f)
+
+    def test_remove_frame(self):
+        h = self.h
+        for frame_number in [0, 150, 290, 300, 990]:
+            h.remove_frame(frame_number)
+        assert len(h) == 95
+        for i, f in enumerate(self.frames):
+            if i * 10 in h.frame_history:
+                assert np.array_equal(h.get_frame(i * 10), f)
+        assert h.latest_frame_number == 980
+
+    def test_truncate(self):
+        h = self.h
+        new_frames = make_frames(5, seed=5678)
+        h.save_frame(500, new_frames[0])
+        assert h.keys()[-1] == 500
+        assert len(h) == 51
+        assert np.array_equal(h.get_frame(490), self.frames[49])
+        assert np.array_equal(h.get_frame(500), new_frames[0])
+
+    def test_index(self):
+        h = self.h
+        assert h.get_previous_frame(55) == 50
+        assert h.get_previous_frame(50) == 40
+        assert h.get_previous_frame(10) == 0
+        assert h.get_next_frame(55) == 60
+        assert h.get_next_frame(980) == 990
+        assert h.get_nearest_frame(55) == 50
+        assert h.get_nearest_frame(50) == 50
+        assert h.get_frame_range(25, 60) == [30, 40, 50]
+        assert h.get_frame_range(2000, 3000) == []
+        for cursor, method in [(0, h.get_previous_frame), (990, h.get_next_frame), (-1, h.get_nearest_frame)]:
+            try:
+                method(cursor)
+            except IndexError:
+                pass
+            else:
+                raise AssertionError(f"{method.__name__}({cursor}) should fail")
+        h.remove_frame(50)
+        h.truncate(900)
+        assert h.keys() == sorted(h.frame_history.keys())
+        assert h.get_next_frame(40) == 60
+        assert h.get_next_frame(880) == 890
+        assert 50 not in h
+        assert 40 in h
+
+    def test_memory_limit(self):
+        h = FrameHistory(max_bytes=16384)
+        for i, f in enumerate(self.frames):
+            h.save_frame(i * 10, f)
+        assert h.total_bytes <= 16384
+        assert h.keys()[-1] == 990
+        for k in h.keys():
+            assert np.array_equal(h.get_frame(k), self.frames[k // 10])
+
+    def test_serialize(self):
+        state = self.h.serialize_to_dict()
+        assert len(state['frame_history']) == 100
+        h2 = FrameHistory()
+        h2.restore_from_dict(state)
+        assert h2.keys() == self.h.keys()
+        for i, f in enumerate(self.frames):
+            assert np.array_equal(h2.get_frame(i * 10), f)
+
+
+class TestContainer(object):
+    def setup_method(self):
+        self.frames = make_frames(100)
+        self.h = FrameHistory()
+        for i, f in enumerate(self.frames):
+            self.h.save_frame(i * 10, f)
+        self.h.remove_frame(500)
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, "test.omniemu-state")
+
+    def teardown_method(self):
+        self.tempdir.cleanup()
+
+    def test_frame_history(self):
+        with ContainerWriter(self.path) as container:
+            container.header['frame_history'] = self.h.serialize_to_container(container)
+            container.header['current_frame'] = container.add_state({'name': 'test', 'frame_count': np.int64(3), 'output_raw': self.frames[0]})
+        container = ContainerReader(self.path)
+        h2 = FrameHistory()
+        h2.restore_from_container(container, container.header['frame_history'])
+        assert h2.keys() == self.h.keys()
+        assert h2.total_bytes == self.h.total_bytes
+        for k in h2.keys():
+            assert np.array_equal(h2.get_frame(k), self.frames[k // 10])
+        state = container.get_state(container.header['current_frame'])
+        assert state['frame_count'] == 3
+        assert np.array_equal(state['output_raw'], self.frames[0])
+        assert not state['output_raw'].flags.writeable
+
+        # state restored into an emulator is updated in place
+        state = container.get_state(container.header['current_frame'], writable=True)
+        state['output_raw'][0] += 1
+        assert np.array_equal(state['output_raw'][1:], self.frames[0][1:])
+        assert np.array_equal(container.get_state(container.header['current_frame'])['output_raw'], self.frames[0])
+
+        # restored frames are views into the file, so they must not be
+        # changed when the history is modified
+        h2.remove_frame(0)
+        h2.save_frame(995, self.frames[0])
+        assert np.array_equal(h2.get_frame(10), self.frames[1])
+        assert np.array_equal(h2.get_frame(995), self.frames[0])
+
+    def test_lazy_restore(self):
+        with ContainerWriter(self.path) as container:
+            container.header['frame_history'] = self.h.serialize_to_container(container)
+        container = ContainerReader(self.path)
+        h2 = FrameHistory()
+        h2.restore_from_container(container, container.header['frame_history'])
+        assert len(h2) == 99
+
+        # only the chain of the latest frame has been created
+        assert dict.__len__(h2.frame_history) <= h2.keyframe_interval
+        assert 500 not in h2
+        assert 510 in h2
+        assert np.array_equal(h2.get_frame(310), self.frames[31])
+        assert dict.__len__(h2.frame_history) <= 2 * h2.keyframe_interval
+
+        # frames replaced after the restore take precedence over the file
+        new_frames = make_frames(2, seed=5678)
+        h2.save_frame(300, new_frames[0])
+        h2.save_frame(310, new_frames[1])
+        assert h2.keys()[-1] == 310
+        assert 320 not in h2
+        assert np.array_equal(h2.get_frame(310), new_frames[1])
+        assert np.array_equal(h2.get_frame(290), self.frames[29])
+
+    def test_save_over_mapped(self):
+        # same steps as EmulatorDocument saving over the container its frame
+        # history was restored from
+        with ContainerWriter(self.path) as container:
+            container.header['frame_history'] = self.h.serialize_to_container(container)
+        container = ContainerReader(self.path)
+        h2 = FrameHistory()
+        h2.restore_from_container(container, container.header['frame_history'])
+        old_container = weakref.ref(container)
+        del container
+        assert h2.is_mapped_from(self.path)
+        assert not h2.is_mapped_from(self.path + ".other")
+        assert not self.h.is_mapped_from(self.path)
+        h2.save_frame(995, self.frames[0])
+
+        with ContainerWriter(self.path) as container:
+            container.header['frame_history'] = h2.serialize_to_container(container)
+            h2.clear()
+            gc.collect()
+            # nothing refers to the old file any more
+            assert old_container() is None
+        container = ContainerReader(self.path)
+        h2.restore_from_container(container, container.header['frame_history'])
+        assert h2.is_mapped_from(self.path)
+        assert h2.keys() == self.h.keys() + [995]
+        for k in self.h.keys():
+            assert np.array_equal(h2.get_frame(k), self.frames[k // 10])
+        assert np.array_equal(h2.get_frame(995), self.frames[0])
+
+    def test_invalid(self):
+        with open(self.path, "wb") as fh:
+            fh.write(b"not a save state file")
+        try:
+            ContainerReader(self.path)
+        except InvalidSaveStateError:
+            pass
+        else:
+            raise AssertionError("invalid file should not be readable")
+
+
+class TestDecimate(object):
+    def setup_method(self):
+        self.frames = make_frames(3000, size=1024)
+
+    def check_tiers(self, h, latest):
+        for k in h.keys():
+            age = latest - k
+            if age >= 600:
+                assert k % 100 == 0
+            elif age >= 60:
+                assert k % 10 == 0
+
+    def test_tiers(self):
+        h = FrameHistory(decimation_tiers=[(1, 1), (10, 10), (None, 100)])
+        for i, f in enumerate(self.frames):
+            h.save_frame(i, f)
+            h.decimate()
+        self.check_tiers(h, 2999)
+        # every frame in the newest second, every 10th in the next 9 seconds
+        # and every 100th after that
+        assert len(h) == 60 + 54 + 24
+        for k in h.keys():
+            assert np.array_equal(h.get_frame(k), self.frames[k])
+
+    def test_decimate_once(self):
+        h = FrameHistory(decimation_tiers=[(1, 1), (10, 10), (None, 100)])
+        for i, f in enumerate(self.frames):
+            h.save_frame(i, f)
+        h.decimate()
+        self.check_tiers(h, 2999)
+        assert len(h) == 60 + 54 + 24
+
+    def test_memory_limit(self):
+        h = FrameHistory(max_bytes=20000, decimation_tiers=[(1, 1), (10, 10), (None, 100)])
+        for i, f in enumerate(self.frames):
+            h.save_frame(i, f)
+            h.decimate()
+            assert h.total_bytes <= 20000
+        for k in h.keys():
+            assert np.array_equal(h.get_frame(k), self.frames[k])
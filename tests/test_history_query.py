@@ -0,0 +1,78 @@
+import numpy as np
+
+from omnivore.disassembler.dtypes import HISTORY_6502_DTYPE, HISTORY_ENTRY_DTYPE, HISTORY_FRAME_DTYPE
+from omnivore.disassembler.flags import *
+from omnivore.disassembler.query import HistoryQuery
+
+
+def make_history(num_frames=4, seed=1234):
+    rng = np.random.RandomState(seed)
+    frames = []
+    for frame_number in range(num_frames):
+        count = 200
+        h = np.zeros(count, dtype=HISTORY_6502_DTYPE)
+        h['disassembler_type'] = DISASM_6502_HISTORY
+        h['pc'] = rng.randint(0x600, 0x700, count)
+        h['cycles'] = rng.randint(2, 8, count)
+        h['a'] = np.repeat(np.arange(count // 10), 10)
+        h['flag'][50:60] = FLAG_STORE_A_IN_MEMORY
+        h['target_addr'][50:60] = 0xd01a + np.arange(10)
+        h['flag'][60] = FLAG_LOAD_A_FROM_MEMORY
+        h['target_addr'][60] = 0xd01a
+        # VBI from 100 to 150, longer in odd frames
+        h['disassembler_type'][100] = DISASM_ATARI800_VBI_START
+        h['disassembler_type'][150 + 20 * (frame_number % 2)] = DISASM_ATARI800_VBI_END
+        h['cycles'][100:180] = 4
+        h['cycles'][h['disassembler_type'] != DISASM_6502_HISTORY] = 0
+        h['disassembler_type'][-1] = DISASM_FRAME_END
+        h[-1:].view(HISTORY_FRAME_DTYPE)['frame_number'] = frame_number + 10
+        frames.append(h.view(HISTORY_ENTRY_DTYPE))
+    return np.concatenate(frames)
+
+
+class TestHistoryQuery(object):
+    def setup_method(self):
+        self.entries = make_history()
+        # split like the wraparound point in the ring
+        self.query = HistoryQuery([self.entries[:333], self.entries[333:]], 5)
+        self.h = self.entries.view(HISTORY_6502_DTYPE)
+
+    def test_masks(self):
+        q = self.query
+        h = self.h
+        assert len(q) == len(h)
+        is_instruction = h['disassembler_type'] == DISASM_6502_HISTORY
+        expected = np.flatnonzero((h['pc'] >= 0x640) & (h['pc'] <= 0x660) & is_instruction) + 5
+        assert np.array_equal(q.rows(q.pc_in_range(0x640, 0x660)), expected)
+
+        writes = q.rows(q.writes_to(0xd01a))
+        assert np.array_equal(writes, np.arange(4) * 200 + 55)
+        assert len(q.rows(q.writes_to(0xd01a, 0xd01f))) == 4 * 6
+        assert np.array_equal(q.rows(q.reads_from(0xd01a)), np.arange(4) * 200 + 65)
+        assert np.array_equal(q.entries(writes)['pc'], h['pc'][writes - 5])
+
+    def test_register_changed(self):
+        q = self.query
+        changed = q.rows(q.register_changed('a'))
+        h = self.h
+        rows = np.flatnonzero(h['disassembler_type'] == DISASM_6502_HISTORY)
+        a = h['a'][rows]
+        expected = rows[:-1][a[1:] != a[:-1]] + 5
+        assert np.array_equal(changed, expected)
+
+    def test_frames(self):
+        q = self.query
+        rows, frames = q.frame_ends()
+        assert np.array_equal(rows, np.arange(4) * 200 + 199 + 5)
+        assert np.array_equal(frames, [10, 11, 12, 13])
+
+        starts, cycles = q.interrupt_cycles()
+        h = self.h
+        assert np.array_equal(starts, np.arange(4) * 200 + 105)
+        assert np.array_equal(cycles, [49 * 4, 69 * 4, 49 * 4, 69 * 4])
+        assert np.array_equal(q.frames_with_long_vbi(200), [11, 13])
+
+    def test_empty(self):
+        q = HistoryQuery([])
+        assert len(q.rows(q.pc_in_range(0, 0xffff))) == 0
+        assert len(q.frames_with_long_vbi(0)) == 0
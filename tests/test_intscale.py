@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from omnivore.ui.intscale import intscale
+
+
+class TestIntscale(object):
+    def setup_method(self):
+        self.image = np.arange(4 * 5 * 3, dtype=np.uint8).reshape((4, 5, 3))
+
+    def test_integer(self):
+        for hscale, wscale in [(1, 1), (2, 2), (3, 1), (4, 7), (8, 8)]:
+            scaled = intscale(self.image, hscale, wscale)
+            expected = np.repeat(np.repeat(self.image, hscale, axis=0), wscale, axis=1)
+            assert np.array_equal(scaled, expected)
+
+    def test_output(self):
+        output = np.empty((20, 25, 3), dtype=np.uint8)
+        scaled = intscale(self.image, 5, output=output)
+        assert scaled is output
+        assert np.array_equal(output, np.repeat(np.repeat(self.image, 5, axis=0), 5, axis=1))
+        with pytest.raises(ValueError):
+            intscale(self.image, 4, output=output)
+
+    def test_fractional(self):
+        gray = self.image[:,:,0]
+        scaled = intscale(gray, 1.5, 0.5)
+        assert scaled.shape == (6, 2)
+        assert list(scaled[:,0]) == list(gray[[0, 1, 1, 2, 3, 3], 1])
+        assert list(scaled[0]) == list(gray[0, [1, 3]])
@@ -0,0 +1,187 @@
+import numpy as np
+import pytest
+
+from atrcopy import SegmentData, DefaultSegment
+
+from omnivore.disassembler import DisassemblyConfig
+from omnivore.disassembler.dtypes import HISTORY_ENTRY_DTYPE
+from omnivore.disassembler.libudis import TextStorage
+
+
+# runs of bytes that the data parser has to look ahead to group, same as in
+# test_libudis.py at the top level
+repeat_test = np.asarray([1,1,1,1,1,1,1,0, 0,0,0,0,0,0,0,0, 0,1,1,1,1,1,0,0, 0,0,0,0,0,0,0,0, 0,0,0,0,0,0,0,0], dtype=np.uint8)
+
+code_style = 0
+data_style = 1
+
+
+def get_entries(parsed):
+    return parsed.raw_entries[:len(parsed) * HISTORY_ENTRY_DTYPE.itemsize]
+
+
+def get_rows(parsed):
+    # (start index, number of bytes) of each entry
+    e = get_entries(parsed).view(HISTORY_ENTRY_DTYPE)
+    return list(zip((e['pc'] - parsed.origin).tolist(), e['num_bytes'].tolist()))
+
+
+class TestTextStorage(object):
+    def setup_method(self):
+        self.storage = TextStorage(4, 64)
+
+    def test_reserve_grows(self):
+        s = self.storage
+        old = s.text_buffer
+        s.reserve(2, 32)
+        assert s.text_buffer is old
+        s.reserve(16)
+        assert s.text_buffer is not old
+        assert len(s.text_buffer) == 16 * 64
+
+    def test_reserve_supplied_buffer(self):
+        buffer = np.zeros(256, dtype=np.uint8)
+        s = TextStorage(4, text_buffer=buffer)
+        s.reserve(4, 256)
+        assert s.text_buffer is buffer
+
+        # more lines fit in the same text buffer
+        s.reserve(8, 256)
+        assert s.text_buffer is buffer
+
+        # but the buffer belongs to the caller and can't be replaced
+        with pytest.raises(ValueError):
+            s.reserve(16)
+        assert s.text_buffer is buffer
+
+    def test_get_out_of_range(self):
+        s = self.storage
+        s.reserve(4, 64)
+        offset = 0
+        for text in [b"lda #$00", b"rts"]:
+            s.text_buffer[offset:offset + len(text)] = np.frombuffer(text, dtype=np.uint8)
+            s.store(len(text))
+            offset += len(text)
+        assert s.get_bytes(0) == b"lda #$00"
+        assert s.get_str(-1) == "rts"
+        assert bytes(s.get_view(1)) == b"rts"
+
+        # lines past the last one stored are out of range even though the
+        # storage has room for them
+        for i in [2, 3, -3]:
+            with pytest.raises(IndexError):
+                s.get_bytes(i)
+            with pytest.raises(IndexError):
+                s.get_view(i)
+
+
+class TestReparse(object):
+    def setup_method(self):
+        self.driver = DisassemblyConfig()
+        self.driver.register_parser("6502", code_style)
+        self.driver.register_parser("data", data_style)
+
+        # code and data chunks of run-heavy bytes, with chunk boundaries at
+        # 40, 104 and 144
+        self.data = np.concatenate([repeat_test, np.arange(64, dtype=np.uint8), repeat_test, repeat_test, repeat_test[::-1]])
+        self.style = np.zeros(len(self.data), dtype=np.uint8)
+        self.style[40:104] = data_style
+        self.style[144:] = data_style
+
+    def make_segment(self, data, style):
+        segment = DefaultSegment(SegmentData(data.copy()), 0x6000)
+        segment.style[:] = style
+        return segment
+
+    def check_reparse(self, data, style):
+        parsed = self.driver.parse(self.make_segment(self.data, self.style), 1000)
+        changed = np.flatnonzero((data != self.data) | (style != self.style))
+        assert len(changed) > 0
+        segment = self.make_segment(data, style)
+        expected = self.driver.parse(segment, 1000)
+        new_data = np.frombuffer(bytearray(segment.data.tobytes()), dtype=np.uint8)
+        new_style = segment.get_comment_locations(user=0x7)
+        assert self.driver.reparse(parsed, new_data, new_style, changed[0], changed[-1] + 1)
+        assert get_rows(parsed) == get_rows(expected)
+        assert np.array_equal(get_entries(parsed), get_entries(expected))
+        assert np.array_equal(parsed.index_to_row, expected.index_to_row)
+        return parsed
+
+    def test_lookahead(self):
+        # the first entry only ends early because of the run that the edit
+        # breaks, more than one entry before the edit
+        self.data = np.asarray([0]*6 + [1]*12 + [5]*8, dtype=np.uint8)
+        self.style = np.zeros(len(self.data), dtype=np.uint8) + data_style
+        data = self.data.copy()
+        data[13] = 2
+        parsed = self.check_reparse(data, self.style)
+        assert get_rows(parsed) == [(0, 8), (8, 8), (16, 8), (24, 2)]
+
+    def test_byte_edits(self):
+        last = len(self.data) - 1
+        for index in [0, 1, 13, 20, 39, 40, 41, 60, 103, 104, 105, 143, 144, 145, last - 1, last]:
+            for value in [0, 1, 0x20, 0xa9]:
+                data = self.data.copy()
+                data[index] = value
+                if not np.array_equal(data, self.data):
+                    self.check_reparse(data, self.style)
+
+    def test_run_edits(self):
+        # edits that create or split runs on either side of chunk boundaries
+        for start, end in [(0, 9), (30, 50), (36, 40), (40, 49), (95, 113), (130, 144), (144, 153), (150, 170), (len(self.data) - 9, len(self.data))]:
+            for value in [0, 1, 7]:
+                data = self.data.copy()
+                data[start:end] = value
+                if not np.array_equal(data, self.data):
+                    self.check_reparse(data, self.style)
+
+    def test_style_edits(self):
+        last = len(self.data)
+        for start, end in [(0, 1), (0, 20), (17, 23), (38, 40), (39, 42), (40, 41), (100, 110), (104, 105), (140, 150), (143, 144), (last - 1, last), (last - 20, last)]:
+            for value in [code_style, data_style]:
+                style = self.style.copy()
+                style[start:end] = value
+                if not np.array_equal(style, self.style):
+                    self.check_reparse(self.data, style)
+
+
+class TestParseParallel(object):
+    def setup_method(self):
+        self.driver = DisassemblyConfig()
+        self.driver.register_parser("6502", code_style)
+        self.driver.register_parser("data", data_style)
+
+        # random code has lots of jump targets and instructions that cross
+        # piece boundaries; runs of data can cover several pieces
+        r = np.random.RandomState(0)
+        chunks = [
+            (code_style, r.randint(0, 256, 500)),
+            (data_style, np.tile(repeat_test, 10)),
+            (code_style, np.tile(repeat_test, 10)),
+            (data_style, r.randint(0, 256, 300)),
+            (data_style, np.zeros(300) + 0xaa),
+            (code_style, r.randint(0, 256, 97)),
+            (data_style, repeat_test[::-1]),
+        ]
+        data = np.concatenate([c[1] for c in chunks]).astype(np.uint8)
+        self.segment = DefaultSegment(SegmentData(data), 0x6000)
+        self.segment.style[:] = np.concatenate([np.zeros(len(c[1]), dtype=np.uint8) + c[0] for c in chunks])
+
+    def check_parallel(self, piece_size):
+        expected = self.driver.parse(self.segment, 5000)
+        parsed = self.driver.parse_parallel(self.segment, 5000, num_workers=4, piece_size=piece_size)
+        assert len(parsed) == len(expected)
+        assert np.array_equal(get_entries(parsed), get_entries(expected))
+        assert np.array_equal(parsed.index_to_row, expected.index_to_row)
+        assert np.array_equal(parsed.jmp_targets, expected.jmp_targets)
+
+    def test_pieces(self):
+        for piece_size in [7, 16, 23, 64, 255]:
+            self.check_parallel(piece_size)
+
+    def test_comments(self):
+        # comments split data chunks, but not code chunks
+        for index in [100, 510, 511, 1350, 1620]:
+            self.segment.set_comment_at(index, "split")
+        for piece_size in [16, 64]:
+            self.check_parallel(piece_size)
@@ -0,0 +1,97 @@
+import numpy as np
+
+from omnivore.disassembler.dtypes import HISTORY_6502_DTYPE, HISTORY_ENTRY_DTYPE, HISTORY_FRAME_DTYPE
+from omnivore.disassembler.flags import *
+from omnivore.disassembler.profiler import ExecutionProfile
+from omnivore.disassembler.callgraph import CallGraph
+
+
+def make_entries(program):
+    # program is a list of (pc, opcode, operand, cycles, flag)
+    h = np.zeros(len(program), dtype=HISTORY_6502_DTYPE)
+    for i, (pc, opcode, operand, cycles, flag) in enumerate(program):
+        h[i]['pc'] = pc
+        h[i]['disassembler_type'] = DISASM_6502_HISTORY
+        h[i]['instruction'] = (opcode, operand & 0xff, operand >> 8)
+        h[i]['cycles'] = cycles
+        h[i]['flag'] = flag
+    return h.view(HISTORY_ENTRY_DTYPE)
+
+
+jsr = 0x20
+rts = 0x60
+nop = 0xea
+
+program = [
+    (0x600, jsr, 0x2000, 6, 0),
+    (0x2000, nop, 0, 2, 0),
+    (0x2001, jsr, 0x3000, 6, 0),
+    (0x3000, nop, 0, 2, 0),
+    (0x3001, rts, 0, 6, FLAG_RTS),
+    (0x2004, rts, 0, 6, FLAG_RTS),
+    (0x603, nop, 0, 2, 0),
+]
+
+
+class TestExecutionProfile(object):
+    def test_calls(self):
+        entries = make_entries(program * 3)
+        p = ExecutionProfile()
+        # split in the middle of a subroutine to check the stack carries over
+        p.add_entries([entries[:4], entries[4:]])
+        assert p.hits[0x600] == 3
+        assert p.cycles[0x2001] == 18
+        assert p.calls[0x2000] == 3
+        assert p.calls[0x3000] == 3
+        assert p.inclusive[0x3000] == 3 * (6 + 2 + 6)
+        assert p.exclusive[0x3000] == 3 * (6 + 2 + 6)
+        assert p.inclusive[0x2000] == 3 * (6 + 2 + 6 + 2 + 6 + 6)
+        assert p.exclusive[0x2000] == 3 * (6 + 2 + 6)
+        assert set(p.hot_spots(4)) == {0x600, 0x2001, 0x3001, 0x2004}
+        assert p.call_graph.stack == []
+
+        heat = p.calc_heat_map()
+        assert heat.max() == 255
+        assert heat[0x700] == 0
+
+    def test_unbalanced(self):
+        # RTS without a JSR is ignored, JSR without a RTS stays on the stack
+        # and is charged for the time so far
+        entries = make_entries([program[4], program[0], program[1]])
+        p = ExecutionProfile()
+        p.add_entries([entries])
+        assert p.calls.sum() == 1
+        assert p.exclusive[0x2000] == 8
+        stack = p.call_graph.stack
+        assert len(stack) == 1
+        assert p.call_graph.address[stack[0].node] == 0x2000
+
+
+class TestCallGraph(object):
+    def test_tree(self):
+        entries = make_entries(program * 2)
+        frame_end = np.zeros(1, dtype=HISTORY_FRAME_DTYPE)
+        frame_end['disassembler_type'] = DISASM_FRAME_END
+        frame_end['frame_number'] = 5
+        entries = np.concatenate([entries[:7], frame_end.view(HISTORY_ENTRY_DTYPE), entries[7:]])
+        g = CallGraph()
+        g.add_entries([entries[:3], entries[3:]])
+        assert len(g) == 3
+        assert list(g.address[:3]) == [-1, 0x2000, 0x3000]
+        assert list(g.parent[:3]) == [-1, 0, 1]
+        assert list(g.calls[:3]) == [0, 2, 2]
+        assert list(g.self_cycles[:3]) == [4, 28, 28]
+        assert list(g.calc_inclusive()) == [60, 56, 28]
+
+        frame = g.get_frame_self_cycles(5)
+        assert list(frame) == [2, 14, 14]
+        lines = g.calc_folded_stacks(5, labels={0x3000: "inner"})
+        assert lines == ["top 2", "top;$2000 14", "top;$2000;inner 14"]
+        assert g.get_frame_self_cycles(6) is None
+
+    def test_step_out(self):
+        g = CallGraph()
+        g.add_entries([make_entries(program[:4])])
+        assert g.step_out_target() == (0x2004, 0)
+        g.add_entries([make_entries(program[4:])])
+        assert g.step_out_target() is None
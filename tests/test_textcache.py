@@ -0,0 +1,51 @@
+from omnivore.disassembler.textcache import StringifiedHistoryCache
+
+
+class TestStringifiedHistoryCache(object):
+    def setup_method(self):
+        self.calls = []
+        self.num_rows = 100
+
+    def stringify(self, first_id):
+        def func(offset, count):
+            self.calls.append((offset, count))
+            stop = min(first_id + offset + count, self.num_rows)
+            return [(f"line {i}", f"result {i}") for i in range(first_id + offset, stop)]
+        return func
+
+    def test_incremental(self):
+        cache = StringifiedHistoryCache(max_rows=30)
+        text = cache.get(0, 10, 20, self.stringify(10))
+        assert self.calls == [(0, 20)]
+        assert text[0] == ("line 10", "result 10")
+        assert len(cache) == 20
+
+        # scroll by 5 rows: only the 5 new rows are formatted
+        self.calls = []
+        text = cache.get(0, 15, 20, self.stringify(15))
+        assert self.calls == [(15, 5)]
+        assert text[-1] == ("line 34", "result 34")
+        assert len(cache) == 25
+
+        # volatile rows are always reformatted and never cached
+        self.calls = []
+        text = cache.get(0, 15, 20, self.stringify(15), num_volatile=1)
+        assert self.calls == [(19, 1)]
+
+        # eviction keeps the most recently used rows
+        self.calls = []
+        cache.get(0, 50, 10, self.stringify(50))
+        assert len(cache) == 30
+        assert 10 not in cache.rows
+        assert 34 in cache.rows
+
+        # new generation clears the cache
+        self.calls = []
+        cache.get(1, 50, 10, self.stringify(50))
+        assert self.calls == [(0, 10)]
+        assert len(cache) == 10
+
+    def test_end_of_history(self):
+        cache = StringifiedHistoryCache()
+        text = cache.get(0, 95, 10, self.stringify(95))
+        assert len(text) == 5
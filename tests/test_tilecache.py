@@ -0,0 +1,50 @@
+import numpy as np
+
+from omnivore.ui.tilecache import TileCache
+
+
+class TestTileCache(object):
+    def setup_method(self):
+        self.cache = TileCache(tile_rows=4, tile_cols=8, max_tiles=4)
+        self.data = np.arange(256, dtype=np.uint8).reshape((16, 16))
+        self.style = np.zeros((16, 16), dtype=np.uint8)
+
+    def render(self, data, style):
+        return int(data.sum()) + int(style.sum())
+
+    def draw(self):
+        items = {}
+        for r0, r1, c0, c1 in self.cache.iter_tiles(1, 9, 3, 16, 1, 15, 16):
+            data = self.data[r0:r1,c0:c1]
+            style = self.style[r0:r1,c0:c1]
+            items[(r0, c0)] = self.cache.get((r0, c0), data, style, self.render)
+        return items
+
+    def test_iter_tiles(self):
+        tiles = list(self.cache.iter_tiles(1, 9, 3, 16, 1, 15, 12))
+        assert tiles == [(1, 4, 0, 8), (1, 4, 8, 12), (4, 8, 0, 8), (4, 8, 8, 12), (8, 12, 0, 8), (8, 12, 8, 12)]
+
+    def test_dirty_tiles(self):
+        c = self.cache
+        c.max_tiles = 16
+        first = self.draw()
+        assert c.num_rendered == 6
+        assert self.draw() == first
+        assert c.num_rendered == 6
+
+        # only the tiles containing changed bytes are rendered again
+        self.data[5, 2] = 0
+        self.style[10, 12] = 0x80
+        second = self.draw()
+        assert c.num_rendered == 8
+        assert second[(4, 0)] == first[(4, 0)] - 0x52
+        assert second[(8, 8)] == first[(8, 8)] + 0x80
+
+        c.check_state("zoom")
+        self.draw()
+        assert c.num_rendered == 14
+
+    def test_eviction(self):
+        self.draw()
+        assert len(self.cache) == 4
+        assert list(self.cache.tiles) == [(4, 0), (4, 8), (8, 0), (8, 8)]
@@ -0,0 +1,71 @@
+import os
+import tempfile
+
+import numpy as np
+
+from omnivore.disassembler.dtypes import HISTORY_ENTRY_DTYPE, HISTORY_FRAME_DTYPE
+from omnivore.disassembler.flags import DISASM_6502_HISTORY, DISASM_FRAME_END
+from omnivore.disassembler.trace import TraceFile
+
+
+def make_frame(frame_number, count):
+    entries = np.zeros(count + 1, dtype=HISTORY_ENTRY_DTYPE)
+    entries['pc'][:count] = np.arange(count) + 0x600
+    entries['disassembler_type'][:count] = DISASM_6502_HISTORY
+    entries['disassembler_type'][count] = DISASM_FRAME_END
+    entries[count:].view(HISTORY_FRAME_DTYPE)['frame_number'] = frame_number
+    return entries
+
+
+class TestTraceFile(object):
+    def setup_method(self):
+        fd, self.path = tempfile.mkstemp(suffix=".trace")
+        os.close(fd)
+        os.unlink(self.path)
+
+    def teardown_method(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def test_append(self):
+        trace = TraceFile(self.path)
+        frames = [make_frame(i, 100 + i) for i in range(10)]
+        index = 0
+        for f in frames:
+            # split each frame like a ring wraparound
+            trace.append([f[:30], f[30:]], index)
+            index += len(f)
+        everything = np.concatenate(frames)
+        assert len(trace) == len(everything)
+        assert np.array_equal(trace.get_entries(0, len(trace)), everything)
+        assert np.array_equal(trace.get_entries(50, 500), everything[50:500])
+        assert trace[150] == everything[150]
+        assert trace.next_index == index
+
+        start, stop = trace.find_frame(3)
+        assert start == sum(len(f) for f in frames[:3])
+        assert np.array_equal(trace.get_entries(start, stop), frames[3])
+        assert trace.find_frame(99) is None
+        assert trace.find_cumulative_index(0) == 0
+        assert trace.find_cumulative_index(index) == -1
+        trace.close()
+
+        trace = TraceFile(self.path)
+        assert len(trace) == len(everything)
+        assert np.array_equal(trace.get_entries(0, len(trace)), everything)
+        trace.append([make_frame(10, 5)], index)
+        assert trace.find_frame(10) == (len(everything), len(everything) + 6)
+        trace.close()
+
+    def test_truncated(self):
+        trace = TraceFile(self.path)
+        trace.append([make_frame(0, 100)], 0)
+        trace.append([make_frame(1, 100)], 101)
+        trace.close()
+        size = os.path.getsize(self.path)
+        with open(self.path, "r+b") as fh:
+            fh.truncate(size - 10)
+        trace = TraceFile(self.path)
+        assert len(trace) == 101
+        assert trace.find_frame(1) is None
+        trace.close()